@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AgentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agents'
+
+    def ready(self):
+        # Schema setup normally runs once per deploy via
+        # `manage.py setup_checkpointer`; this is an opt-in shortcut for dev
+        if getattr(settings, "AGENTS_SETUP_CHECKPOINTER_ON_STARTUP", False):
+            from .services.checkpointer import setup_checkpointer
+
+            try:
+                setup_checkpointer()
+            except Exception as e:
+                print(f"⚠ Warning during checkpointer init: {e}")
@@ -0,0 +1,203 @@
+"""
+Per-process admission control for supervisor runs.
+
+An ``AdmissionController`` admits at most ``max_concurrent`` runs at once.
+Extra requests wait in a bounded FIFO queue for at most ``queue_timeout``
+seconds; when the queue is full or the wait budget runs out the request is
+rejected with ``AdmissionRejected`` so the view can answer with a fast 503.
+
+The run executor is the only client: the view calls ``enqueue``, which
+takes a slot or a queue place without blocking (a full queue is rejected
+right there), and the run then awaits ``wait_async`` on the agent loop
+and hands its waiter to ``discard`` when it ends. Views run in other
+threads than that loop, so the lock is a ``threading.Lock`` and a
+released slot is handed straight to the oldest waiter's future.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import metrics
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within its queue budget"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("future", "loop", "granted", "admitted", "released", "queued_at")
+
+    def __init__(self, future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.future = future
+        self.loop = loop
+        self.granted = False
+        self.admitted = False
+        self.released = False
+        self.queued_at = time.monotonic()
+
+    def grant(self) -> None:
+        self.granted = True
+        self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    """Bounded concurrency limiter with a bounded, time-limited wait queue"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int,
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: deque = deque()
+
+    # ---- bookkeeping ----
+
+    def _reject(self, reason: str):
+        metrics.inc("agents_admission_rejected_total", limiter=self.name, reason=reason)
+        raise AdmissionRejected(reason, self.retry_after)
+
+    def _admitted(self, waiter: _Waiter) -> None:
+        waiter.admitted = True
+        metrics.inc("agents_admission_admitted_total", limiter=self.name)
+        metrics.observe(
+            "agents_admission_queue_wait_seconds",
+            time.monotonic() - waiter.queued_at,
+            limiter=self.name,
+        )
+
+    def enqueue(self, loop: asyncio.AbstractEventLoop) -> _Waiter:
+        """
+        Take a slot now or join the wait queue, without blocking.
+
+        Returns a waiter that is already ``granted`` when a slot was free;
+        it is awaited with ``wait_async`` on ``loop`` (which may be another
+        thread's loop). Raises AdmissionRejected when the queue is full.
+        """
+        waiter = _Waiter(future=asyncio.Future(loop=loop), loop=loop)
+
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                waiter.granted = True
+            elif len(self._waiters) >= self.max_queue:
+                self._reject("queue_full")
+            else:
+                self._waiters.append(waiter)
+
+        if waiter.granted:
+            self._admitted(waiter)
+        return waiter
+
+    async def wait_async(self, waiter: _Waiter) -> None:
+        """Await admission of a loop waiter without holding a thread"""
+        if waiter.admitted:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    waiter.released = True
+                    self._reject("timeout")
+        except asyncio.CancelledError:
+            # Cancelled while queued; give back a slot we were handed
+            self.discard(waiter)
+            raise
+
+        self._admitted(waiter)
+
+    def discard(self, waiter: _Waiter) -> None:
+        """Leave the queue or free the waiter's slot; safe to call repeatedly"""
+        with self._lock:
+            if waiter.released:
+                return
+            waiter.released = True
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return
+        self._release()
+
+    def _release(self) -> None:
+        """Free a slot, handing it to the oldest waiter if there is one"""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().grant()
+            else:
+                self._active -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+            }
+
+
+def overloaded_response(error: AdmissionRejected) -> JsonResponse:
+    """Fast 503 telling the client (or load balancer) when to retry"""
+    response = JsonResponse(
+        {"error": "Server is busy, please retry shortly", "reason": error.reason},
+        status=503,
+    )
+    response["Retry-After"] = str(error.retry_after)
+    return response
+
+
+_chat_admission: Optional[AdmissionController] = None
+_chat_admission_lock = threading.Lock()
+
+
+def get_chat_admission() -> AdmissionController:
+    """Process-wide limiter in front of the chat endpoints"""
+    global _chat_admission
+    if _chat_admission is None:
+        with _chat_admission_lock:
+            if _chat_admission is None:
+                _chat_admission = AdmissionController(
+                    name="chat",
+                    max_concurrent=getattr(settings, "AGENTS_CHAT_MAX_CONCURRENT", 5),
+                    max_queue=getattr(settings, "AGENTS_CHAT_MAX_QUEUE", 20),
+                    queue_timeout=getattr(settings, "AGENTS_CHAT_QUEUE_TIMEOUT", 10.0),
+                    retry_after=getattr(settings, "AGENTS_CHAT_RETRY_AFTER", 5),
+                )
+    return _chat_admission
+
+
+def admission_stats() -> dict:
+    if _chat_admission is None:
+        return {"admission": {}}
+    return {"admission": {_chat_admission.name: _chat_admission.stats()}}
+
+
+metrics.register_collector(admission_stats)
@@ -0,0 +1,46 @@
+"""
+Cooperative cancellation for agent runs.
+
+Most supervisor nodes are sync functions, which LangGraph runs in executor
+threads even under ``astream``; cancelling the asyncio task does not stop
+them. ``CancellationHandler`` is passed in the run's callbacks and raises
+``RunCancelled`` on the next LLM token, LLM/retriever/chain start once the
+run is cancelled. Raising inside ``on_llm_new_token`` unwinds the OpenAI
+streaming call, which closes the HTTP response and stops generation.
+"""
+
+import threading
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class RunCancelled(Exception):
+    """Raised inside a run that was cancelled by the client or an operator"""
+
+
+class CancellationHandler(BaseCallbackHandler):
+    """Callback handler that aborts a run once its cancel event is set"""
+
+    raise_error = True
+    run_inline = True
+
+    def __init__(self, cancel_event: threading.Event | None = None):
+        self.cancel_event = cancel_event or threading.Event()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def _check(self, *args: Any, **kwargs: Any) -> None:
+        if self.cancel_event.is_set():
+            raise RunCancelled("Run cancelled")
+
+    on_llm_start = _check
+    on_chat_model_start = _check
+    on_llm_new_token = _check
+    on_retriever_start = _check
+    on_chain_start = _check
@@ -0,0 +1,60 @@
+"""
+Server-side allowlist of chat models a request may pick.
+
+Clients send a public name (the UI's model selector values, e.g.
+``"default"`` or ``"fast"``); ``AGENTS_CHAT_MODELS`` maps each name to an
+OpenAI model, so a cheaper or faster model can be put behind a name, or a
+new one added, with a settings change instead of a deploy. Anything not in
+the map is rejected. The graph registry compiles and caches one supervisor
+graph per resolved model.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+
+DEFAULT_CHAT_MODELS = {
+    "default": "gpt-4.1",
+    "fast": "gpt-4.1-mini",
+}
+DEFAULT_CHAT_MODEL = "default"
+
+
+class UnknownChatModel(ValueError):
+    """The requested model is not in the allowlist"""
+
+
+def chat_models() -> Dict[str, str]:
+    """Public name -> OpenAI model, in display order"""
+    return dict(getattr(settings, "AGENTS_CHAT_MODELS", DEFAULT_CHAT_MODELS))
+
+
+def default_chat_model() -> str:
+    return getattr(settings, "AGENTS_CHAT_DEFAULT_MODEL", DEFAULT_CHAT_MODEL)
+
+
+def resolve_chat_model(name: Optional[str]) -> Tuple[str, str]:
+    """
+    Validate a requested model name.
+
+    Args:
+        name: Public model name from the request; empty means the default
+
+    Returns:
+        (public name, OpenAI model name)
+
+    Raises:
+        UnknownChatModel: The name is not a string or not in AGENTS_CHAT_MODELS
+    """
+    models = chat_models()
+    if name is not None and not isinstance(name, str):
+        raise UnknownChatModel(
+            f"model must be a string; choose one of: {', '.join(models)}"
+        )
+    name = name or default_chat_model()
+    if name not in models:
+        raise UnknownChatModel(
+            f"Unknown model {name!r}; choose one of: {', '.join(models)}"
+        )
+    return name, models[name]
@@ -0,0 +1,154 @@
+"""
+Time-windowed coalescing of streamed answer tokens.
+
+One ``streaming`` event per token means one JSON encode, one SSE frame and
+one HTTP write per token. ``TokenCoalescer`` merges consecutive tokens into
+a single ``streaming`` event per window (``window_seconds``) or per
+``max_tokens`` tokens, whichever comes first. Any other event (usage,
+error, ...) flushes the pending text first and passes straight through,
+so the end of an answer is never held back.
+
+``acoalesce`` drives it over an async event stream and also flushes when
+the window expires while the producer is waiting on the model, so a slow
+token is delayed by at most one window.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import AsyncGenerator, AsyncIterable, List, Optional
+
+
+class TokenCoalescer:
+    """Buffers ``streaming`` events and merges them into larger ones"""
+
+    def __init__(self, window_seconds: float, max_tokens: int):
+        self.window_seconds = window_seconds
+        self.max_tokens = max(1, max_tokens)
+        self._pending: List[str] = []
+        self._opened_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0 and self.max_tokens > 1
+
+    def time_left(self) -> Optional[float]:
+        """Seconds until the pending text must be flushed (None if empty)"""
+        if not self._pending:
+            return None
+        return max(0.0, self._opened_at + self.window_seconds - time.monotonic())
+
+    def add(self, event: dict) -> List[dict]:
+        """Take one event; return the events that are ready to send"""
+        if event.get("type") != "streaming" or not self.enabled:
+            return self.flush() + [event]
+
+        if not self._pending:
+            self._opened_at = time.monotonic()
+        self._pending.append(event["message"])
+
+        if len(self._pending) >= self.max_tokens or self.time_left() == 0:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[dict]:
+        """Pending tokens as one streaming event (or nothing)"""
+        if not self._pending:
+            return []
+        text = "".join(self._pending)
+        self._pending = []
+        return [{"type": "streaming", "message": text}]
+
+
+class _Raised:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+_END = object()
+
+
+def _wake(waiter: Optional[asyncio.Future]) -> None:
+    if waiter is not None and not waiter.done():
+        waiter.set_result(None)
+
+
+async def acoalesce(
+    events: AsyncIterable[dict], window_seconds: float, max_tokens: int
+) -> AsyncGenerator[dict, None]:
+    """Coalesce an async event stream, flushing on window expiry too"""
+    coalescer = TokenCoalescer(window_seconds, max_tokens)
+    if not coalescer.enabled:
+        async for event in events:
+            yield event
+        return
+
+    # The producer runs in one task of its own and hands events over a
+    # deque: a window timeout must never cancel the graph run itself. The
+    # consumer sleeps on a single future woken by the producer or a timer,
+    # which is much cheaper per token than asyncio.wait_for.
+    loop = asyncio.get_running_loop()
+    items: deque = deque()
+    # waiter: the consumer's sleep; eager: it has no pending text and wants
+    # the next event now. With text pending, tokens only pile up in the
+    # deque until the window timer (or a full batch) wakes the consumer.
+    state = {"waiter": None, "eager": True}
+
+    def wake() -> None:
+        _wake(state["waiter"])
+
+    async def pump():
+        try:
+            async for event in events:
+                items.append(event)
+                if (
+                    state["eager"]
+                    or event.get("type") != "streaming"
+                    or len(items) >= coalescer.max_tokens
+                ):
+                    wake()
+        except Exception as e:
+            items.append(_Raised(e))
+        else:
+            items.append(_END)
+        wake()
+
+    producer = asyncio.ensure_future(pump())
+    try:
+        while True:
+            if not items:
+                timeout = coalescer.time_left()
+                waiter = state["waiter"] = loop.create_future()
+                state["eager"] = timeout is None
+                timer = loop.call_later(timeout, _wake, waiter) if timeout is not None else None
+                try:
+                    await waiter
+                finally:
+                    state["waiter"] = None
+                    if timer is not None:
+                        timer.cancel()
+
+            # Take everything that has arrived since the last wake-up
+            while items:
+                item = items.popleft()
+                if item is _END:
+                    for event in coalescer.flush():
+                        yield event
+                    return
+                if isinstance(item, _Raised):
+                    raise item.error
+                for event in coalescer.add(item):
+                    yield event
+
+            if coalescer.time_left() == 0:
+                # Window expired while the model was thinking
+                for event in coalescer.flush():
+                    yield event
+    finally:
+        if not producer.done():
+            # Wait for the graph to unwind before the caller releases what
+            # the run holds (its pooled connection)
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
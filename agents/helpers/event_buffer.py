@@ -0,0 +1,155 @@
+"""
+Bounded, numbered SSE event buffer for one agent run.
+
+The producer appends event dicts; each one gets the next integer id and is
+encoded to its SSE frame (bytes) once. Any number of subscribers can replay from a
+``Last-Event-ID`` and then follow the live run, either from a WSGI thread
+(``follow``) or from an event loop (``afollow``).
+
+Followers given a ``heartbeat`` interval send an SSE comment frame when
+the run has been quiet that long (e.g. while the classifier and the
+multi-query expansion run before the first token). Proxies see bytes and
+keep the connection open, and a client that went away is noticed at the
+next write instead of never.
+"""
+
+import asyncio
+import threading
+from typing import AsyncGenerator, Generator, List, Optional, Tuple
+
+from .stream_helper import emit_sse
+
+
+# SSE comment line; clients ignore it, intermediaries see traffic
+HEARTBEAT_FRAME = b": keepalive\n\n"
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RunEventBuffer:
+    """Thread-safe bounded buffer of pre-encoded SSE frames"""
+
+    def __init__(self, max_events: int):
+        self._max_events = max_events
+        self._frames: List[bytes] = []
+        self._first_id = 1
+        self._next_id = 1
+        self._closed = False
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def last_event_id(self) -> int:
+        return self._next_id - 1
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def append(self, event: dict) -> Optional[int]:
+        """Number, encode and store one event; wake every subscriber"""
+        with self._cond:
+            if self._closed:
+                # Late events from a run that was already finalised
+                return None
+            event_id = self._next_id
+            self._next_id += 1
+            self._frames.append(emit_sse(event, event_id))
+            self._evict()
+            self._notify()
+        return event_id
+
+    def close(self) -> None:
+        """Mark the run finished; followers drain and stop"""
+        with self._cond:
+            self._closed = True
+            self._notify()
+
+    def _evict(self) -> None:
+        # Drop the oldest frames in batches so appends stay amortised O(1)
+        excess = len(self._frames) - self._max_events
+        if excess > 0:
+            drop = max(excess, self._max_events // 8)
+            del self._frames[:drop]
+            self._first_id += drop
+
+    def _notify(self) -> None:
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._async_waiters.clear()
+
+    def _read_after(self, last_id: int) -> List[Tuple[Optional[int], bytes]]:
+        """Frames with id > last_id (call with the lock held)"""
+        if not self._frames or last_id >= self.last_event_id:
+            return []
+
+        entries = []
+        if last_id + 1 < self._first_id:
+            # The client asked for events that were already evicted
+            entries.append((None, emit_sse({
+                "type": "replay_truncated",
+                "first_event_id": self._first_id,
+            })))
+        start = max(0, last_id + 1 - self._first_id)
+        entries.extend(
+            (self._first_id + offset, frame)
+            for offset, frame in enumerate(self._frames[start:], start)
+        )
+        return entries
+
+    def follow(
+        self, last_id: int = 0, heartbeat: Optional[float] = None
+    ) -> Generator[bytes, None, None]:
+        """Replay frames after ``last_id``, then block for live ones"""
+        if heartbeat:
+            # Flushes the response headers through any proxy right away
+            yield HEARTBEAT_FRAME
+        while True:
+            with self._cond:
+                entries = self._read_after(last_id)
+                if not entries:
+                    if self._closed:
+                        return
+                    # heartbeat 0 / None: wait without waking up
+                    if self._cond.wait(heartbeat or None) or not heartbeat:
+                        continue
+                    entries = [(None, HEARTBEAT_FRAME)]
+
+            for event_id, frame in entries:
+                if event_id is not None:
+                    last_id = event_id
+                yield frame
+
+    async def afollow(
+        self, last_id: int = 0, heartbeat: Optional[float] = None
+    ) -> AsyncGenerator[bytes, None]:
+        """Async counterpart of ``follow``; waits without holding a thread"""
+        loop = asyncio.get_running_loop()
+        if heartbeat:
+            yield HEARTBEAT_FRAME
+        while True:
+            future = None
+            with self._cond:
+                entries = self._read_after(last_id)
+                if not entries:
+                    if self._closed:
+                        return
+                    future = loop.create_future()
+                    self._async_waiters.append((loop, future))
+
+            if future is not None:
+                # Keep waiting on the same future across heartbeats so the
+                # waiter list does not grow while the run is quiet
+                while not future.done():
+                    done, _ = await asyncio.wait((future,), timeout=heartbeat or None)
+                    if not done:
+                        yield HEARTBEAT_FRAME
+                continue
+
+            for event_id, frame in entries:
+                if event_id is not None:
+                    last_id = event_id
+                yield frame
@@ -0,0 +1,100 @@
+"""
+Minimal in-process metrics registry.
+
+Counters, gauges and timers are kept per worker process and exposed as a
+JSON snapshot by the /api/metrics view. Collectors are called at snapshot
+time for values that are cheaper to pull than to push (e.g. pool stats).
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[MetricKey, float] = {}
+_gauges: Dict[MetricKey, float] = {}
+_timers: Dict[MetricKey, Dict[str, float]] = {}
+_collectors: List[Callable[[], Dict[str, Any]]] = []
+
+
+def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def _format_key(key: MetricKey) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    rendered = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{rendered}}}"
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Increment a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set a gauge to an absolute value"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name: str, delta: float, **labels) -> None:
+    """Move a gauge up or down"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record one duration sample (count / sum / max)"""
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+        timer["count"] += 1
+        timer["sum"] += seconds
+        timer["max"] = max(timer["max"], seconds)
+
+
+def register_collector(collector: Callable[[], Dict[str, Any]]) -> None:
+    """Register a callable whose dict result is merged into every snapshot"""
+    with _lock:
+        if collector not in _collectors:
+            _collectors.append(collector)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return every metric as plain JSON-serialisable data"""
+    with _lock:
+        data = {
+            "counters": {_format_key(k): v for k, v in _counters.items()},
+            "gauges": {_format_key(k): v for k, v in _gauges.items()},
+            "timers": {
+                _format_key(k): {
+                    **v,
+                    "avg": v["sum"] / v["count"] if v["count"] else 0.0,
+                }
+                for k, v in _timers.items()
+            },
+        }
+        collectors = list(_collectors)
+
+    for collector in collectors:
+        try:
+            data.update(collector())
+        except Exception as e:
+            print(f"[METRICS] Collector {collector.__name__} failed: {e}")
+
+    return data
+
+
+def reset() -> None:
+    """Clear all recorded values (collectors stay registered)"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timers.clear()
@@ -0,0 +1,231 @@
+"""
+Record agent event streams once, replay them without OpenAI.
+
+``record_stream`` drives a real graph with ``agent.stream`` and writes every
+step, with the time since the previous one, to a JSON Lines file (gzip when
+the name ends in ``.gz``). ``ReplayAgent`` loads such a file and stands in
+for the compiled graph: ``stream`` / ``astream`` yield the same steps at the
+original pace, ``speed`` times faster, or as fast as possible
+(``speed=None``). That makes the SSE path (filter, coalescer, framing, run
+buffer) and the client parser load-testable and deterministic on a machine
+with no network.
+
+Steps are recorded in the richest shape, ``stream_mode=["messages",
+"custom"]`` with ``subgraphs=True``; replay reshapes them for whatever
+``stream_mode`` / ``subgraphs`` the caller asks for, as LangGraph does.
+Only the message metadata keys the stream layer reads are kept, so a token
+costs a few dozen bytes. Callbacks do not fire during replay, so the usage
+event reports no tokens.
+
+File layout: one header object, then one ``[dt_ms, namespace, mode,
+payload]`` array per step.
+"""
+
+import asyncio
+import gzip
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, Generator, List, Optional, Tuple
+
+import orjson
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    ToolMessageChunk,
+)
+
+
+FORMAT_VERSION = 1
+RECORD_STREAM_MODE = ["messages", "custom"]
+
+# Message metadata the stream layer and usage tracking look at
+RECORDED_METADATA = (
+    "langgraph_node",
+    "langgraph_step",
+    "langgraph_checkpoint_ns",
+    "checkpoint_ns",
+    "ls_provider",
+    "ls_model_name",
+    "tags",
+)
+
+MESSAGE_CLASSES = {
+    cls.__name__: cls
+    for cls in (AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage, ToolMessageChunk)
+}
+
+Step = Tuple[Tuple[str, ...], str, Any]
+
+
+def _open(path, mode: str):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def _encode_payload(mode: str, payload: Any) -> Any:
+    if mode != "messages":
+        return payload
+    message, metadata = payload
+    encoded = message.model_dump(exclude_defaults=True)
+    encoded["class"] = type(message).__name__
+    return [encoded, {key: metadata[key] for key in RECORDED_METADATA if key in metadata}]
+
+
+def _decode_payload(mode: str, payload: Any) -> Any:
+    if mode != "messages":
+        return payload
+    encoded, metadata = payload
+    encoded = dict(encoded)
+    cls = MESSAGE_CLASSES[encoded.pop("class")]
+    return cls(**encoded), metadata
+
+
+def record_stream(
+    agent,
+    agent_input: Dict[str, Any],
+    config: Dict[str, Any],
+    path,
+    **header: Any,
+) -> int:
+    """
+    Run ``agent`` once and record its stream steps to ``path``.
+
+    Args:
+        agent: Compiled graph (with a checkpointer if it needs one)
+        agent_input: Graph input
+        config: Graph config
+        path: Output file; ``.gz`` compresses it
+        **header: Extra JSON-safe fields for the header (e.g. the question)
+
+    Returns:
+        Number of steps recorded
+    """
+    count = 0
+    with _open(path, "wb") as out:
+        out.write(orjson.dumps({
+            "version": FORMAT_VERSION,
+            "stream_mode": RECORD_STREAM_MODE,
+            "subgraphs": True,
+            "recorded_at": time.time(),
+            **header,
+        }) + b"\n")
+
+        last = time.monotonic()
+        for namespace, mode, payload in agent.stream(
+            agent_input,
+            config=config,
+            stream_mode=RECORD_STREAM_MODE,
+            subgraphs=True,
+        ):
+            now = time.monotonic()
+            dt_ms = round((now - last) * 1000, 2)
+            last = now
+            out.write(orjson.dumps(
+                [dt_ms, list(namespace), mode, _encode_payload(mode, payload)],
+                default=str,
+            ) + b"\n")
+            count += 1
+    return count
+
+
+def load_recording(path) -> Tuple[dict, List[Tuple[float, Step]]]:
+    """Header and ``(dt_seconds, step)`` pairs of a recording"""
+    with _open(path, "rb") as source:
+        lines = source.read().splitlines()
+    if not lines:
+        raise ValueError(f"Empty recording: {path}")
+
+    header = orjson.loads(lines[0])
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported recording version: {header.get('version')}")
+
+    steps = []
+    for line in lines[1:]:
+        dt_ms, namespace, mode, payload = orjson.loads(line)
+        steps.append((dt_ms / 1000, (tuple(namespace), mode, _decode_payload(mode, payload))))
+    return header, steps
+
+
+class ReplayAgent:
+    """
+    Fake compiled graph that replays a recording.
+
+    Args:
+        path: Recording written by ``record_stream``
+        speed: 1.0 keeps the recorded timing, 10 is ten times faster,
+            None (or 0) replays as fast as possible
+    """
+
+    def __init__(self, path, speed: Optional[float] = 1.0):
+        self.path = Path(path)
+        self.speed = speed
+        self.header, self.steps = load_recording(path)
+
+    def copy(self, update: Optional[dict] = None) -> "ReplayAgent":
+        # bind_checkpointer() support: a replay has no state to persist
+        return self
+
+    def _delays(self) -> Generator[float, None, None]:
+        """Seconds to wait before each step, on one absolute schedule"""
+        started = time.monotonic()
+        due = 0.0
+        for dt, _ in self.steps:
+            if not self.speed:
+                yield 0.0
+                continue
+            due += dt / self.speed
+            yield max(0.0, started + due - time.monotonic())
+
+    @staticmethod
+    def _shape(step: Step, stream_mode, subgraphs: bool):
+        """Reshape a recorded step the way ``stream`` would have returned it"""
+        namespace, mode, payload = step
+        if isinstance(payload, dict) and "at" in payload:
+            # Stage timestamps are monotonic; rebase them on the replay clock
+            payload = {**payload, "at": time.monotonic()}
+        single = isinstance(stream_mode, str)
+        if mode not in ([stream_mode] if single else stream_mode):
+            return None
+        if namespace and not subgraphs and mode != "messages":
+            # Tokens keep flowing from subgraph models; other output does not
+            return None
+        if single:
+            return (namespace, payload) if subgraphs else payload
+        return (namespace, mode, payload) if subgraphs else (mode, payload)
+
+    def stream(
+        self,
+        agent_input: Any = None,
+        config: Optional[dict] = None,
+        *,
+        stream_mode="messages",
+        subgraphs: bool = False,
+        **kwargs: Any,
+    ) -> Generator[Any, None, None]:
+        for delay, (_, step) in zip(self._delays(), self.steps):
+            if delay:
+                time.sleep(delay)
+            item = self._shape(step, stream_mode, subgraphs)
+            if item is not None:
+                yield item
+
+    async def astream(
+        self,
+        agent_input: Any = None,
+        config: Optional[dict] = None,
+        *,
+        stream_mode="messages",
+        subgraphs: bool = False,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Any, None]:
+        for delay, (_, step) in zip(self._delays(), self.steps):
+            # Yield to the loop even at full speed so replays share it fairly
+            await asyncio.sleep(delay)
+            item = self._shape(step, stream_mode, subgraphs)
+            if item is not None:
+                yield item
@@ -0,0 +1,43 @@
+"""
+Pipeline stage events, emitted by the graph nodes themselves.
+
+Nodes call ``emit_stage`` at the points that matter (intent classified,
+retrieval started / finished, generation started). The event goes through
+LangGraph's custom stream writer, so it reaches the client in order with
+the message stream when the graph is streamed with the ``"custom"`` mode,
+and is a no-op otherwise (``invoke``, tests, other stream modes).
+
+``emit_event`` writes any other client event (e.g. ``sources``) the same
+way.
+
+Each stage event carries ``at``, a ``time.monotonic()`` timestamp; the stream
+layer turns it into milliseconds since the run started.
+"""
+
+import time
+from typing import Any, Dict
+
+from langgraph.config import get_stream_writer
+
+
+INTENT_CLASSIFIED = "intent_classified"
+RETRIEVAL_STARTED = "retrieval_started"
+RETRIEVAL_FINISHED = "retrieval_finished"
+GENERATION_STARTED = "generation_started"
+FIRST_TOKEN = "first_token"
+DONE = "done"
+
+
+def emit_event(event: Dict[str, Any]) -> None:
+    """Write a client event (a dict with a ``type``) to the graph's custom stream, if any"""
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        # Called outside a graph run
+        return
+    writer(event)
+
+
+def emit_stage(stage: str, **fields: Any) -> None:
+    """Write a ``stage`` event to the graph's custom stream, if any"""
+    emit_event({"type": "stage", "stage": stage, "at": time.monotonic(), **fields})
@@ -1,83 +1,239 @@
-import json
 import time
+import orjson
 import traceback
-from typing import Dict, Any, Generator
-import re
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from typing import Dict, Any, AsyncGenerator
+from langchain_core.messages import AIMessage, AIMessageChunk
 
-def stream_generator(
+from . import metrics, stages
+from .cancellation import RunCancelled
+from .usage import UsageTracker
+
+
+# The answer is generated by the chat model node inside the message_agent
+# subgraph, or for small talk by the supervisor's small_talk node; every
+# other LLM call (intent classification, multi-query rewrites) is internal
+# and never streamed to the client
+ANSWER_SUBGRAPH = "message_agent"
+ANSWER_MODEL_NODE = "model"
+SMALL_TALK_NODE = "small_talk"
+
+
+def emit_sse(obj: dict, event_id: int | None = None) -> bytes:
+    """Encode one SSE frame (UTF-8 bytes), with an ``id:`` field when numbered"""
+    data = b"data: " + orjson.dumps(obj) + b"\n\n"
+    if event_id is None:
+        return data
+    return b"id: %d\n" % event_id + data
+
+
+def _with_usage(config: Dict[str, Any], usage: UsageTracker) -> Dict[str, Any]:
+    """The run config with ``usage`` among its callbacks (added once)"""
+    callbacks = list(config.get("callbacks") or [])
+    if usage not in callbacks:
+        callbacks.append(usage)
+    return {**config, "callbacks": callbacks}
+
+
+def _text(content) -> str:
+    """Plain text of a message's content (string or content blocks)"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else str(block)
+            for block in content
+        )
+    return ""
+
+
+class AnswerStreamFilter:
+    """
+    Node-aware filter over ``stream_mode=["messages", "custom"]``,
+    ``subgraphs=True`` steps.
+
+    Only tokens from the message_agent subgraph's model node (or the
+    small_talk node) become ``streaming`` events. The supervisor's message_agent node then returns
+    the same answer as one full AIMessage; it is dropped once tokens were
+    streamed and sent whole only when the model did not stream. Output of
+    other nodes is dropped (and counted) so the client never sees the
+    classifier's JSON or the retriever's query rewrites.
+
+    Custom-stream events written by the nodes (``stage`` events) pass
+    through with their monotonic ``at`` turned into ``elapsed_ms`` since
+    the stream started. The filter adds the ``first_token`` and ``done``
+    stages itself and puts TTFT, latency and tokens/sec on the usage event.
+    """
+
+    def __init__(self, usage: UsageTracker, labels: Dict[str, str] | None = None):
+        self.usage = usage
+        self.labels = labels or {}
+        self.streamed_answer = False
+        self.answer_chunks = 0
+        self.dropped: Dict[str, int] = {}
+        self.started_at = time.monotonic()
+        self.first_token_at: float | None = None
+        self.done_at: float | None = None
+
+    def _elapsed_ms(self, at: float) -> float:
+        return round((at - self.started_at) * 1000, 1)
+
+    def _stage(self, stage: str, at: float, **fields) -> dict:
+        return {"type": "stage", "stage": stage, "elapsed_ms": self._elapsed_ms(at), **fields}
+
+    def _answer(self, content: str) -> list:
+        self.streamed_answer = True
+        self.answer_chunks += 1
+        if self.first_token_at is not None:
+            return [{"type": "streaming", "message": content}]
+        self.first_token_at = time.monotonic()
+        return [
+            self._stage(stages.FIRST_TOKEN, self.first_token_at),
+            {"type": "streaming", "message": content},
+        ]
+
+    def events(self, step) -> list:
+        """Client events for one ``(namespace, mode, payload)`` step"""
+        namespace, mode, payload = step
+        if mode == "custom":
+            if not isinstance(payload, dict) or "type" not in payload:
+                return []
+            event = dict(payload)
+            if "at" in event:
+                event["elapsed_ms"] = self._elapsed_ms(event.pop("at"))
+            return [event]
+
+        message, metadata = payload
+
+        node = metadata.get("langgraph_node", "")
+        subgraph = namespace[0].split(":", 1)[0] if namespace else ""
+
+        if subgraph == ANSWER_SUBGRAPH and node == ANSWER_MODEL_NODE:
+            if getattr(message, "tool_calls", None):
+                return []
+            content = _text(message.content)
+            if not content:
+                return []
+            return self._answer(content)
+
+        if not namespace and node == SMALL_TALK_NODE:
+            content = _text(message.content)
+            if not content or (self.streamed_answer and not isinstance(message, AIMessageChunk)):
+                return []
+            return self._answer(content)
+
+        if not namespace and node == ANSWER_SUBGRAPH and isinstance(message, AIMessage):
+            # The supervisor node's copy of the answer
+            content = _text(message.content)
+            if self.streamed_answer or not content:
+                return []
+            return self._answer(content)
+
+        key = f"{subgraph}/{node}" if subgraph else node
+        self.dropped[key] = self.dropped.get(key, 0) + 1
+        return []
+
+    def timings(self) -> dict:
+        """TTFT, total latency and generation speed for the usage event"""
+        done_at = self.done_at or time.monotonic()
+        timings = {
+            "ttft_ms": None,
+            "latency_ms": self._elapsed_ms(done_at),
+            "tokens_per_second": None,
+        }
+        if self.first_token_at is not None:
+            timings["ttft_ms"] = self._elapsed_ms(self.first_token_at)
+            generation_seconds = done_at - self.first_token_at
+            output_tokens = (
+                self.usage.output_tokens_of(f"{ANSWER_SUBGRAPH}/{ANSWER_MODEL_NODE}")
+                or self.usage.output_tokens_of(SMALL_TALK_NODE)
+                or self.answer_chunks
+            )
+            if generation_seconds > 0:
+                timings["tokens_per_second"] = round(output_tokens / generation_seconds, 1)
+        return timings
+
+    def final_events(self) -> list:
+        """The ``done`` stage and the usage event that close the stream"""
+        self.done_at = time.monotonic()
+        return [
+            self._stage(stages.DONE, self.done_at),
+            {**self.usage.as_event(), **self.timings()},
+        ]
+
+    def record(self) -> None:
+        """Report chunk counts and stream timings to the metrics sink"""
+        metrics.inc("agents_stream_chunks_total", self.answer_chunks, kind="answer", **self.labels)
+        for node, count in self.dropped.items():
+            metrics.inc("agents_stream_chunks_total", count, kind="dropped", node=node, **self.labels)
+        if self.first_token_at is not None:
+            metrics.observe("agents_stream_ttft_seconds", self.first_token_at - self.started_at, **self.labels)
+        if self.done_at is not None:
+            metrics.observe("agents_stream_latency_seconds", self.done_at - self.started_at, **self.labels)
+
+
+def error_event(e: Exception) -> dict:
+    """Build an error event and log the traceback"""
+    error_detail = traceback.format_exc()
+    print(f"Stream error: {error_detail}")
+
+    return {
+        "type": "error",
+        "message": str(e),
+        "detail": error_detail,
+        "timestamp": time.time()
+    }
+
+async def astream_events(
     agent,
     agent_input: Dict[str, Any],
     config: Dict[str, Any],
-) -> Generator[str, None, None]:
+    usage: UsageTracker | None = None,
+    labels: Dict[str, str] | None = None,
+) -> AsyncGenerator[dict, None]:
     """
-    Streams SSE-like events from a multi-step agent with real-time token streaming.
-    
+    Streams events from the supervisor graph, driven by ``agent.astream``,
+    with real-time token streaming.
+
     Emits events:
-    - token: Individual tokens as they arrive (for real-time display)
-    - message: Complete message when done
-    - usage: Token usage statistics
+    - stage: Pipeline progress (intent, retrieval, generation, first token, done)
+    - streaming: Final-answer tokens as they arrive (for real-time display)
+    - sources: Retrieved documents' metadata and scores
+    - usage: Token usage per model and node, cost estimate, TTFT, latency
+      and tokens/sec
     - error: Error messages if something fails
-    """
-    def emit_sse(obj: dict) -> str:
-        """Format SSE data line"""
-        return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
 
-    # Token usage tracking
-    prompt_tokens = 0
-    completion_tokens = 0
+    Pass ``usage`` to read the token counts even if the stream is cut short,
+    and ``labels`` (e.g. the model) to label the stream's timing metrics.
+    The event loop is free while the graph waits on OpenAI, so one thread
+    can drive many runs at once. Cancelling the consuming task cancels the
+    graph and any in-flight OpenAI request with it.
+    """
+    usage = usage if usage is not None else UsageTracker()
+    config = _with_usage(config, usage)
+    answer_filter = AnswerStreamFilter(usage, labels)
 
     try:
-        print(f"[DEBUG] Starting agent stream with config: {config}")
-        
-        # ============================================
-        # STREAM AGENT EXECUTION - USE stream_mode="messages"
-        # ============================================
-        for step in agent.stream(
-            agent_input, 
-            config=config, 
-            stream_mode="messages"  # ✅ Changed to "messages" for token streaming
+        # The config carries callbacks and per-run objects: log the thread only
+        thread_id = config.get("configurable", {}).get("thread_id")
+        print(f"[DEBUG] Starting async agent stream for thread {thread_id}")
+
+        async for step in agent.astream(
+            agent_input,
+            config=config,
+            stream_mode=["messages", "custom"],
+            subgraphs=True,
         ):
-            last_message = step[0]
-            content = getattr(last_message, "content", None)
-
-            yield emit_sse({
-                "type": "streaming",
-                "message": content
-            })
-
-            # ============================================
-            # TOKEN USAGE (Extract from any message)
-            # ============================================
-            if hasattr(last_message, "usage_metadata") and last_message.usage_metadata:
-                usage = last_message.usage_metadata
-                in_tokens = usage.get("input_tokens")
-                out_tokens = usage.get("output_tokens")
-
-                if in_tokens is not None:
-                    prompt_tokens = in_tokens
-                if out_tokens is not None:
-                    completion_tokens = out_tokens
-
-                print(f"[DEBUG] Token usage found: input={in_tokens}, output={out_tokens}")
-        
-        total_tokens = prompt_tokens + completion_tokens
-        yield emit_sse({
-            "type": "usage",
-            "input_tokens": prompt_tokens,
-            "output_tokens": completion_tokens,
-            "total_tokens": total_tokens
-        })
-
-        print(f"[DEBUG] Stream complete")
-        
+            for event in answer_filter.events(step):
+                yield event
+
+        for event in answer_filter.final_events():
+            yield event
+
+        print(f"[DEBUG] Async stream complete for thread {thread_id}")
+
+    except RunCancelled:
+        raise
     except Exception as e:
-        error_detail = traceback.format_exc()
-        print(f"Stream error: {error_detail}")
-
-        yield emit_sse({
-            "type": "error",
-            "message": str(e),
-            "detail": error_detail,
-            "timestamp": time.time()
-        })
\ No newline at end of file
+        yield error_event(e)
+    finally:
+        answer_filter.record()
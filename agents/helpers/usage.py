@@ -0,0 +1,181 @@
+"""
+Token usage and cost per graph node and per model for one run.
+
+``UsageTracker`` is a callback handler passed in the run's callbacks, so it
+sees every chat model call in the graph (intent classifier, the
+multi-query rewrites, the message_agent generation) from the
+call's own start/end hooks instead of guessing from streamed messages.
+Calls are summed per (node, model); the final ``usage`` event reports the
+totals, both breakdowns and a cost estimate from ``AGENTS_MODEL_PRICING``
+(USD per 1M input / output tokens, matched by longest model-name prefix).
+"""
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from django.conf import settings
+from langchain_core.callbacks import BaseCallbackHandler
+
+from . import metrics
+
+
+# USD per 1M tokens: (input, output)
+DEFAULT_MODEL_PRICING = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+UNKNOWN = "unknown"
+
+
+def model_pricing() -> Dict[str, Tuple[float, float]]:
+    return {**DEFAULT_MODEL_PRICING, **getattr(settings, "AGENTS_MODEL_PRICING", {})}
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """USD cost of one model's tokens, or None if the model has no price"""
+    pricing = model_pricing()
+    # "gpt-4.1-2025-04-14" is priced as "gpt-4.1", "gpt-4.1-mini" as itself
+    matches = [name for name in pricing if model == name or model.startswith(name + "-")]
+    if not matches:
+        return None
+    input_price, output_price = pricing[max(matches, key=len)]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def node_key(metadata: Dict[str, Any]) -> str:
+    """'node' for supervisor nodes, 'subgraph/node' inside a subgraph"""
+    node = metadata.get("langgraph_node") or UNKNOWN
+    namespace = metadata.get("langgraph_checkpoint_ns") or ""
+    outer = namespace.split("|", 1)[0].split(":", 1)[0]
+    return node if not outer or outer == node else f"{outer}/{node}"
+
+
+def _new_row() -> Dict[str, int]:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+
+
+class UsageTracker(BaseCallbackHandler):
+    """Sums chat model usage per (node, model) across one run"""
+
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[UUID, Tuple[str, str]] = {}
+        self._rows: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+    # ---- callbacks ----
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        model = (
+            metadata.get("ls_model_name")
+            or params.get("model")
+            or params.get("model_name")
+            or UNKNOWN
+        )
+        with self._lock:
+            self._calls[run_id] = (node_key(metadata), model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            node, model = self._calls.pop(run_id, (UNKNOWN, UNKNOWN))
+        input_tokens, output_tokens = self._usage_of(response)
+
+        with self._lock:
+            row = self._rows.setdefault((node, model), _new_row())
+            row["calls"] += 1
+            row["input_tokens"] += input_tokens
+            row["output_tokens"] += output_tokens
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._calls.pop(run_id, None)
+
+    @staticmethod
+    def _usage_of(response) -> Tuple[int, int]:
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens") or 0
+                    output_tokens += usage.get("output_tokens") or 0
+        if not (input_tokens or output_tokens):
+            # Non-message generations report through llm_output
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens = token_usage.get("prompt_tokens") or 0
+            output_tokens = token_usage.get("completion_tokens") or 0
+        return input_tokens, output_tokens
+
+    # ---- totals ----
+
+    def _snapshot(self) -> Dict[Tuple[str, str], Dict[str, int]]:
+        with self._lock:
+            return {key: dict(row) for key, row in self._rows.items()}
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(row["input_tokens"] for row in self._snapshot().values())
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(row["output_tokens"] for row in self._snapshot().values())
+
+    def output_tokens_of(self, node: str) -> int:
+        """Output tokens generated by one node (all models)"""
+        return sum(
+            row["output_tokens"]
+            for (row_node, _), row in self._snapshot().items()
+            if row_node == node
+        )
+
+    def as_event(self) -> dict:
+        """Build the final usage event with per-model and per-node breakdowns"""
+        rows = self._snapshot()
+        by_model: Dict[str, dict] = {}
+        by_node: Dict[str, dict] = {}
+        for (node, model), row in rows.items():
+            for group, key in ((by_model, model), (by_node, node)):
+                totals = group.setdefault(key, _new_row())
+                for field, value in row.items():
+                    totals[field] += value
+
+        cost = 0.0
+        priced = True
+        for model, totals in by_model.items():
+            totals["cost_usd"] = estimate_cost(model, totals["input_tokens"], totals["output_tokens"])
+            if totals["cost_usd"] is None:
+                priced = False
+            else:
+                cost += totals["cost_usd"]
+
+        input_tokens = sum(row["input_tokens"] for row in rows.values())
+        output_tokens = sum(row["output_tokens"] for row in rows.values())
+        return {
+            "type": "usage",
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "cost_usd": round(cost, 6),
+            # False when some model had no price, i.e. cost_usd is a lower bound
+            "cost_complete": priced,
+            "by_model": by_model,
+            "by_node": by_node,
+        }
+
+    def record(self, **labels: str) -> None:
+        """Push this run's tokens and cost to the metrics sink"""
+        for (node, model), row in self._snapshot().items():
+            metrics.inc("agents_llm_calls_total", row["calls"], node=node, model=model, **labels)
+            metrics.inc("agents_llm_tokens_total", row["input_tokens"], node=node, model=model, kind="input", **labels)
+            metrics.inc("agents_llm_tokens_total", row["output_tokens"], node=node, model=model, kind="output", **labels)
+            cost = estimate_cost(model, row["input_tokens"], row["output_tokens"])
+            if cost is not None:
+                metrics.inc("agents_llm_cost_usd_total", cost, model=model, **labels)
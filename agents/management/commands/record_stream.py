@@ -0,0 +1,36 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the supervisor graph once against OpenAI and record its stream "
+        "steps (with timing) for ReplayAgent"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("message", help="User message to send")
+        parser.add_argument(
+            "--output", "-o", required=True,
+            help="Recording file (.jsonl, or .jsonl.gz to compress)",
+        )
+
+    def handle(self, *args, **options):
+        from langchain_core.messages import HumanMessage
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        from agents.helpers.replay import record_stream
+        from agents.services.graph_registry import bind_checkpointer, get_supervisor_graph
+
+        message = options["message"]
+        # A throwaway in-memory thread: recording needs no Postgres
+        agent = bind_checkpointer(get_supervisor_graph(), InMemorySaver())
+        config = {"configurable": {"thread_id": f"record-{uuid.uuid4().hex}"}}
+        agent_input = {"messages": [HumanMessage(content=message)], "user_message": message}
+
+        try:
+            steps = record_stream(agent, agent_input, config, options["output"], message=message)
+        except Exception as e:
+            raise CommandError(f"Recording failed: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Recorded {steps} steps to {options['output']}"))
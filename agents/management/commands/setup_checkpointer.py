@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Create or migrate the LangGraph checkpoint tables in Postgres"
+
+    def handle(self, *args, **options):
+        from agents.services.checkpointer import setup_checkpointer
+
+        try:
+            setup_checkpointer()
+        except Exception as e:
+            raise CommandError(f"Checkpointer setup failed: {e}")
+        self.stdout.write(self.style.SUCCESS("Checkpointer tables are ready"))
@@ -0,0 +1,114 @@
+"""
+Postgres connection pool and checkpointer leases for the supervisor graph.
+
+Runs execute on the run manager's event loop, so there is one async pool.
+A checkpointer writes on its connection for the whole run, so the lease
+must last as long as the run that drives the graph. The lease helper is a
+context manager; leave it when the run finishes, fails or is cancelled
+and the connection goes straight back to the pool.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import psycopg
+from django.conf import settings
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+from ..helpers import metrics
+
+
+# Connection settings required by the Postgres savers
+CONNECTION_KWARGS = {
+    "autocommit": True,
+    "prepare_threshold": 0,
+    "row_factory": dict_row,
+}
+
+_async_connection_pool = None
+_async_connection_pool_lock = asyncio.Lock()
+
+
+def get_db_uri() -> str:
+    """Postgres URI for the current environment"""
+    if os.getenv("ENV_TYPE") == 'localhost':
+        return os.getenv("POSTGRES_URL")
+    return os.getenv("POSTGRES_URL_PROD")
+
+
+def setup_checkpointer() -> None:
+    """
+    Create / migrate the checkpoint tables (idempotent DDL).
+
+    Run once per deploy via ``manage.py setup_checkpointer``; uses its own
+    connection so no pool is opened just for the migration.
+    """
+    with psycopg.connect(get_db_uri(), **CONNECTION_KWARGS) as conn:
+        PostgresSaver(conn).setup()
+    print("INIT CHECKPOINTER #####")
+
+
+def _pool_options() -> dict:
+    return {
+        "min_size": getattr(settings, "AGENTS_DB_POOL_MIN_SIZE", 1),
+        "max_size": getattr(settings, "AGENTS_DB_POOL_MAX_SIZE", 5),
+        "timeout": getattr(settings, "AGENTS_DB_POOL_TIMEOUT", 30.0),
+        "max_waiting": getattr(settings, "AGENTS_DB_POOL_MAX_WAITING", 0),
+        "kwargs": CONNECTION_KWARGS,
+    }
+
+
+async def get_async_connection_pool() -> AsyncConnectionPool:
+    """
+    Process-wide async pool. It must be opened inside the running event
+    loop, so it is created lazily on the first async request.
+    """
+    global _async_connection_pool
+    if _async_connection_pool is None:
+        async with _async_connection_pool_lock:
+            if _async_connection_pool is None:
+                pool = AsyncConnectionPool(
+                    get_db_uri(), name="checkpointer-async", open=False, **_pool_options()
+                )
+                await pool.open()
+                _async_connection_pool = pool
+    return _async_connection_pool
+
+
+@asynccontextmanager
+async def async_leased_checkpointer() -> AsyncIterator[AsyncPostgresSaver]:
+    """Lease one pooled async connection and wrap it in an AsyncPostgresSaver"""
+    pool = await get_async_connection_pool()
+    requested_at = time.monotonic()
+    try:
+        conn = await pool.getconn()
+    except Exception:
+        metrics.inc("agents_db_lease_errors_total", pool="async")
+        raise
+
+    leased_at = time.monotonic()
+    metrics.observe("agents_db_lease_wait_seconds", leased_at - requested_at, pool="async")
+    metrics.add_gauge("agents_db_leases_active", 1, pool="async")
+    try:
+        yield AsyncPostgresSaver(conn)
+    finally:
+        metrics.add_gauge("agents_db_leases_active", -1, pool="async")
+        metrics.observe("agents_db_lease_seconds", time.monotonic() - leased_at, pool="async")
+        await pool.putconn(conn)
+
+
+def pool_stats() -> dict:
+    """psycopg pool statistics (waiting requests, errors, sizes) per pool"""
+    stats = {}
+    if _async_connection_pool is not None:
+        stats["async"] = _async_connection_pool.get_stats()
+    return {"db_pools": stats}
+
+
+metrics.register_collector(pool_stats)
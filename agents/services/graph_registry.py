@@ -0,0 +1,104 @@
+import threading
+from typing import Dict, Iterable, Tuple
+
+from langchain_openai import ChatOpenAI
+
+from .message_agent import create_message_agent
+from .supervisor import create_supervisor_agent
+
+
+DEFAULT_MODEL_NAME = "gpt-4.1"
+DEFAULT_TEMPERATURE = 0.1
+DEFAULT_AGENTS = ("message_agent",)
+
+# Specialist agents the supervisor graph knows how to wire in
+SUPPORTED_AGENTS = {
+    "message_agent": create_message_agent,
+}
+
+GraphKey = Tuple[str, float, Tuple[str, ...]]
+
+_graphs: Dict[GraphKey, object] = {}
+_graphs_lock = threading.Lock()
+
+
+def _graph_key(model_name: str, temperature: float, agents: Iterable[str]) -> GraphKey:
+    agent_set = tuple(sorted(set(agents)))
+    unknown = [name for name in agent_set if name not in SUPPORTED_AGENTS]
+    if unknown:
+        raise ValueError(f"Unsupported agents: {unknown}")
+    if "message_agent" not in agent_set:
+        raise ValueError("The supervisor graph requires 'message_agent'")
+    return (model_name, float(temperature), agent_set)
+
+
+def build_supervisor_graph(
+    model_name: str = DEFAULT_MODEL_NAME,
+    temperature: float = DEFAULT_TEMPERATURE,
+    agents: Iterable[str] = DEFAULT_AGENTS,
+):
+    """
+    Build and compile a supervisor graph without a checkpointer.
+
+    The specialist agents are compiled with ``checkpointer=None`` so they
+    inherit whatever checkpointer the parent graph runs with.
+
+    Args:
+        model_name: OpenAI chat model used by the supervisor and agents
+        temperature: Sampling temperature for the model
+        agents: Names of the specialist agents to wire in
+
+    Returns:
+        Compiled supervisor graph
+    """
+    _graph_key(model_name, temperature, agents)
+
+    model = ChatOpenAI(model=model_name, temperature=temperature)
+    message_agent = SUPPORTED_AGENTS["message_agent"](model, None)
+
+    return create_supervisor_agent(model, message_agent, None)
+
+
+def get_supervisor_graph(
+    model_name: str = DEFAULT_MODEL_NAME,
+    temperature: float = DEFAULT_TEMPERATURE,
+    agents: Iterable[str] = DEFAULT_AGENTS,
+):
+    """
+    Return the process-wide compiled supervisor graph for this configuration.
+
+    Graphs are built on first use and shared across threads afterwards.
+    Compiled graphs are not mutated at run time, so sharing them is safe;
+    bind a checkpointer per invocation with ``bind_checkpointer``.
+    """
+    key = _graph_key(model_name, temperature, agents)
+
+    graph = _graphs.get(key)
+    if graph is not None:
+        return graph
+
+    with _graphs_lock:
+        # Another thread may have built it while we waited for the lock
+        graph = _graphs.get(key)
+        if graph is None:
+            print(f"[GRAPH REGISTRY] Compiling supervisor graph for {key}")
+            graph = build_supervisor_graph(*key)
+            _graphs[key] = graph
+
+    return graph
+
+
+def bind_checkpointer(graph, checkpointer):
+    """
+    Return a shallow copy of a compiled graph bound to ``checkpointer``.
+
+    This only copies the Pregel attribute dict; nodes, channels and the
+    compiled specialist agents are shared with the cached graph.
+    """
+    return graph.copy({"checkpointer": checkpointer})
+
+
+def clear_graph_registry() -> None:
+    """Drop every cached graph (used by benchmarks and tests)."""
+    with _graphs_lock:
+        _graphs.clear()
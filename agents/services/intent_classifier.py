@@ -0,0 +1,186 @@
+"""
+Intent classification in the query embedding space.
+
+The supervisor used to ask the chat model (structured output) to pick one
+of six intent labels on every turn. Here the user message is embedded once
+(the same embedding retrieval searches with) and compared to one centroid
+per intent, the normalised mean embedding of a handful of labelled example
+questions. When the best and second best centroids are closer than
+``AGENTS_INTENT_MARGIN_THRESHOLD`` the supervisor falls back to the
+``RouteQuery`` LLM call.
+
+The centroids are built on first use with a single ``embed_documents`` call
+and kept for the life of the process.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+
+INTENTS = (
+    "technical_capability",
+    "domain_expertise",
+    "business_trust",
+    "engagement_hiring",
+    "process_communication",
+    "general_chat",
+)
+
+# Labelled examples the centroids are built from. Keep these apart from the
+# eval set in benchmarks/data/intent_eval.jsonl.
+INTENT_EXAMPLES: Dict[str, Tuple[str, ...]] = {
+    "technical_capability": (
+        "Do you work with React and Node.js?",
+        "Can you build on AWS with auto scaling?",
+        "Which tech stack do you use for web applications?",
+        "Can you integrate Stripe and third-party APIs?",
+        "How do you handle application security and data encryption?",
+        "Do you have experience with Python and Django?",
+        "Can your team build cross-platform mobile apps with Flutter?",
+        "How would you scale our backend to millions of users?",
+        "Do you do DevOps, CI/CD pipelines and Docker?",
+        "Can you migrate our legacy PHP system to a modern stack?",
+    ),
+    "domain_expertise": (
+        "Have you built an LMS or e-learning platform?",
+        "Do you have experience with fintech products?",
+        "Have you built healthcare or telemedicine apps?",
+        "Can you build an analytics dashboard for our sales team?",
+        "Have you built e-commerce stores with a custom cart and checkout?",
+        "Do you have real estate listing portal experience?",
+        "Have you worked on logistics or fleet tracking software?",
+        "Have you built a booking and scheduling system?",
+        "Do you have experience with marketplace platforms?",
+        "Have you built CRM or ERP systems?",
+    ),
+    "business_trust": (
+        "Why should we choose Brihaspati Infotech?",
+        "Do you have success stories with startups?",
+        "What do your clients say about you?",
+        "What are your ratings and reviews on Clutch?",
+        "Can you share case studies of past projects?",
+        "How many years has your company been in business?",
+        "Which well-known clients have you worked with?",
+        "What results did your clients get from your work?",
+        "Are you a reliable partner for a long-term project?",
+        "What makes you different from other agencies?",
+    ),
+    "engagement_hiring": (
+        "I want to hire two React developers.",
+        "What are your hourly rates?",
+        "How much would an MVP cost?",
+        "Can I get a quote for a mobile app?",
+        "Do you offer dedicated developers on a monthly basis?",
+        "What engagement models do you offer, fixed price or time and material?",
+        "How quickly can you put a team together?",
+        "Can we interview the developers before hiring?",
+        "What is the minimum contract length?",
+        "I need a full-time team for six months, what would that cost?",
+    ),
+    "process_communication": (
+        "How do you communicate during a project?",
+        "Do you follow agile and scrum sprints?",
+        "Will you sign an NDA?",
+        "Do you provide support and maintenance after launch?",
+        "How do you work with clients in a different time zone?",
+        "How often will we get progress updates?",
+        "Which project management tools do you use?",
+        "Who owns the source code and IP after the project?",
+        "How do you handle change requests during development?",
+        "What does your QA and testing process look like?",
+    ),
+    "general_chat": (
+        "Hi",
+        "Hello there!",
+        "Good morning",
+        "Thanks for your help",
+        "How are you?",
+        "Who am I talking to?",
+        "Okay, got it",
+        "Bye, have a nice day",
+        "Are you a bot?",
+        "Nice to meet you",
+    ),
+}
+
+# Cosine similarity gap between the best and second best intents below
+# which the LLM decides; 0 never asks the LLM, 1 always does
+DEFAULT_MARGIN_THRESHOLD = 0.04
+
+_classifier: Optional["CentroidIntentClassifier"] = None
+_classifier_lock = threading.Lock()
+
+
+@dataclass
+class IntentPrediction:
+    intent: str
+    confidence: float  # cosine similarity to the winning centroid
+    margin: float      # gap to the runner-up
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class CentroidIntentClassifier:
+    """Nearest intent centroid by cosine similarity"""
+
+    def __init__(self, centroids: Dict[str, Sequence[float]]):
+        self.intents: List[str] = list(centroids)
+        self.matrix = _normalize(np.array([centroids[i] for i in self.intents], dtype=np.float32))
+
+    @classmethod
+    def from_examples(
+        cls,
+        embeddings: Embeddings,
+        examples: Dict[str, Sequence[str]] = INTENT_EXAMPLES,
+    ) -> "CentroidIntentClassifier":
+        """
+        Embed every example in one request and average them per intent.
+
+        Args:
+            embeddings: The embedding model retrieval uses
+            examples: Intent -> example user messages
+
+        Returns:
+            A classifier with one centroid per intent
+        """
+        texts = [text for intent in examples for text in examples[intent]]
+        vectors = _normalize(np.array(embeddings.embed_documents(texts), dtype=np.float32))
+
+        centroids = {}
+        start = 0
+        for intent, items in examples.items():
+            centroids[intent] = vectors[start:start + len(items)].mean(axis=0)
+            start += len(items)
+        return cls(centroids)
+
+    def predict(self, embedding: Sequence[float]) -> IntentPrediction:
+        similarities = self.matrix @ _normalize(np.asarray(embedding, dtype=np.float32))
+        order = np.argsort(similarities)[::-1]
+        best, second = float(similarities[order[0]]), float(similarities[order[1]])
+        return IntentPrediction(
+            intent=self.intents[order[0]],
+            confidence=round(best, 4),
+            margin=round(best - second, 4),
+        )
+
+
+def get_intent_classifier(embeddings: Embeddings) -> CentroidIntentClassifier:
+    """Process-wide classifier, built with ``embeddings`` on first use"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = CentroidIntentClassifier.from_examples(embeddings)
+    return _classifier
+
+
+def margin_threshold() -> float:
+    return float(getattr(settings, "AGENTS_INTENT_MARGIN_THRESHOLD", DEFAULT_MARGIN_THRESHOLD))
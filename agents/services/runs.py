@@ -0,0 +1,518 @@
+"""
+Agent runs that outlive the HTTP request that started them.
+
+Each run executes ``supervisor_graph.astream`` on a dedicated event loop
+thread and appends its events to a ``RunEventBuffer``. HTTP responses only
+subscribe to that buffer, so a dropped connection can reconnect with
+``Last-Event-ID`` and replay from the buffer instead of re-running the
+intent -> retrieval -> generation pipeline.
+
+The chat admission controller doubles as the executor's worker pool: at
+most ``max_concurrent`` runs execute at once, later ones wait as "queued"
+on the agent loop (not in a request thread) and are rejected when the
+queue is full or their wait budget runs out.
+
+A client-supplied idempotency key maps a retried POST back to the run it
+already started, so load balancer or browser retries do not run the graph
+(and append a checkpoint turn) twice.
+
+When the last subscriber goes away (browser Stop, tab closed) and nobody
+reconnects within the grace period, the run's task is cancelled. The
+cancellation reaches the graph and the in-flight OpenAI request, so we stop
+paying for tokens nobody will read.
+
+Subscribers get an SSE comment heartbeat whenever the run has been quiet
+for ``heartbeat_seconds``, which keeps proxies from timing out the long
+pre-token phase and makes a vanished client fail its next write (and so
+detach) instead of holding its thread forever. A run that itself emits
+nothing for ``stall_seconds`` (a hung model call) is failed and releases
+its worker and pooled connection.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, List, Optional, Tuple
+
+from django.conf import settings
+
+from ..helpers import metrics
+from ..helpers.admission import AdmissionController, AdmissionRejected, get_chat_admission
+from ..helpers.cancellation import CancellationHandler, RunCancelled
+from ..helpers.coalescing import acoalesce
+from ..helpers.event_buffer import RunEventBuffer
+from ..helpers.stream_helper import astream_events, error_event
+from ..helpers.usage import UsageTracker
+from .checkpointer import async_leased_checkpointer
+from .graph_registry import bind_checkpointer
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request"""
+
+
+class ChatRun:
+    """One supervisor run and its event buffer"""
+
+    def __init__(self, session_id: str, buffer_size: int, model: Optional[str] = None):
+        self.run_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.model = model
+        self.buffer = RunEventBuffer(buffer_size)
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.future = None
+        self.started = False
+        self.on_finish: Optional[Callable[[], None]] = None
+        self.slot = None
+        # monotonic time of the last event; drives the stall watchdog
+        self.last_event_at = time.monotonic()
+        self.stalled = False
+        self.usage = UsageTracker()
+        self.cancellation = CancellationHandler()
+        # Live subscribers; a detach bumps the generation so stale timers no-op
+        self.subscribers = 0
+        self.detach_generation = 0
+        self.done = threading.Event()
+        # Final answer pieces for non-streaming callers (see result())
+        self.answer_parts: List[str] = []
+        self.sources: Optional[list] = None
+        self.error: Optional[dict] = None
+        self.final_usage: Optional[dict] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.finished_at is not None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Status snapshot for polling and run listings"""
+        return {
+            "run_id": self.run_id,
+            "session_id": self.session_id,
+            "model": self.model,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "last_event_id": self.buffer.last_event_id,
+            "subscribers": self.subscribers,
+            "usage": self.usage.as_event(),
+        }
+
+    def collect(self, event: Optional[dict]) -> None:
+        """Keep what result() needs from one event as it is emitted"""
+        if event is None:
+            return
+        kind = event["type"]
+        if kind == "streaming":
+            self.answer_parts.append(event["message"])
+        elif kind == "sources":
+            self.sources = event["sources"]
+        elif kind == "usage":
+            self.final_usage = event
+        elif kind == "error":
+            self.error = event
+
+    def result(self) -> Dict[str, Any]:
+        """The whole turn as one JSON object (answer, sources, usage, error)"""
+        usage = dict(self.final_usage or self.usage.as_event())
+        usage.pop("type", None)
+        error = None
+        if self.error is not None:
+            error = {key: self.error[key] for key in ("code", "message", "retry_after") if key in self.error}
+        return {
+            "run_id": self.run_id,
+            "session_id": self.session_id,
+            "model": self.model,
+            "status": self.status,
+            "answer": "".join(self.answer_parts),
+            "sources": self.sources or [],
+            "usage": usage,
+            "error": error,
+        }
+
+
+class RunManager:
+    """Starts runs on a background event loop and keeps them for replay"""
+
+    def __init__(
+        self,
+        admission: AdmissionController,
+        buffer_size: int,
+        retention_seconds: float,
+        detach_grace_seconds: float,
+        idempotency_window_seconds: float = 300,
+        coalesce_window: float = 0.02,
+        coalesce_max_tokens: int = 32,
+        heartbeat_seconds: float = 15,
+        stall_seconds: float = 120,
+    ):
+        self.admission = admission
+        self.buffer_size = buffer_size
+        self.retention_seconds = retention_seconds
+        self.detach_grace_seconds = detach_grace_seconds
+        self.idempotency_window_seconds = idempotency_window_seconds
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_tokens = coalesce_max_tokens
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stall_seconds = stall_seconds
+
+        self._runs: Dict[str, ChatRun] = {}
+        # (session_id, key) -> (run_id, request fingerprint, expires_at)
+        self._idempotency: Dict[Tuple[str, str], Tuple[str, Optional[str], float]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="agent-runs", daemon=True
+                )
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def start_run(
+        self,
+        graph,
+        session_id: str,
+        agent_input: Dict[str, Any],
+        config: Dict[str, Any],
+        on_finish: Optional[Callable[[], None]] = None,
+        idempotency_key: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> Tuple[ChatRun, bool]:
+        """
+        Start ``graph`` for one chat turn and return immediately.
+
+        Args:
+            graph: Compiled supervisor graph (checkpointer is bound per run)
+            session_id: Chat session (checkpoint thread) the run belongs to
+            agent_input: Graph input
+            config: Graph config with the thread_id
+            on_finish: Called once when the run ends, however it ends
+            idempotency_key: Client key; a repeat within the window returns
+                the run it started instead of starting another
+            fingerprint: Digest of the request body, checked on key reuse
+            model: Chat model the graph runs, for the run's metrics labels
+
+        Returns:
+            (run, created); ``created`` is False when the key matched an
+            earlier run. Follow the run with ``subscribe`` / ``asubscribe``
+
+        Raises:
+            AdmissionRejected: The worker pool and its queue are full
+            IdempotencyConflict: The key was used for a different request
+        """
+        self._prune()
+        loop = self._get_loop()
+
+        # Check and claim the key under one lock so concurrent duplicates
+        # cannot both start a run
+        with self._lock:
+            if idempotency_key:
+                existing = self._find_idempotent(session_id, idempotency_key, fingerprint)
+                if existing is not None:
+                    metrics.inc("agents_runs_idempotent_hits_total")
+                    return existing, False
+
+            # Claim a worker or a queue place now so a full queue is a fast 503
+            slot = self.admission.enqueue(loop)
+
+            run = ChatRun(session_id, self.buffer_size, model)
+            run.slot = slot
+            if slot.admitted:
+                run.status = "running"
+            run.on_finish = on_finish
+            run.buffer.append({"type": "run", "run_id": run.run_id})
+            self._runs[run.run_id] = run
+
+            if idempotency_key:
+                self._idempotency[(session_id, idempotency_key)] = (
+                    run.run_id,
+                    fingerprint,
+                    time.time() + self.idempotency_window_seconds,
+                )
+
+        run.future = asyncio.run_coroutine_threadsafe(
+            self._execute(run, graph, agent_input, config), loop
+        )
+        run.future.add_done_callback(lambda _: self._finish_if_never_started(run))
+
+        # Nobody subscribed yet; cancel if nobody does within the grace period
+        loop.call_soon_threadsafe(self._arm_detach_timer, run, run.detach_generation)
+
+        metrics.inc("agents_runs_started_total")
+        return run, True
+
+    def _find_idempotent(
+        self, session_id: str, key: str, fingerprint: Optional[str]
+    ) -> Optional[ChatRun]:
+        """Run an idempotency key points at (call with self._lock held)"""
+        entry = self._idempotency.get((session_id, key))
+        if entry is None:
+            return None
+        run_id, known_fingerprint, expires_at = entry
+        run = self._runs.get(run_id)
+        if run is None or expires_at < time.time():
+            del self._idempotency[(session_id, key)]
+            return None
+        if fingerprint and known_fingerprint and fingerprint != known_fingerprint:
+            raise IdempotencyConflict(f"Idempotency key {key!r} was used for a different message")
+        return run
+
+    async def _execute(self, run: ChatRun, graph, agent_input, config) -> None:
+        run.started = True
+        status = "completed"
+        # The cancellation handler reaches sync nodes running in executor
+        # threads; the usage tracker sees every model call in the graph
+        config = {**config, "callbacks": [*config.get("callbacks", []), run.cancellation, run.usage]}
+        final_event = None
+        watchdog = None
+        try:
+            await self.admission.wait_async(run.slot)
+            run.status = "running"
+            run.last_event_at = time.monotonic()
+            if self.stall_seconds:
+                watchdog = asyncio.ensure_future(self._watch_stall(run, asyncio.current_task()))
+            # One pooled connection for the whole run, released however it ends
+            async with async_leased_checkpointer() as checkpointer:
+                agent = bind_checkpointer(graph, checkpointer)
+                events = astream_events(
+                    agent, agent_input, config, usage=run.usage, labels=self._labels(run)
+                )
+                # Many tokens per frame: fewer encodes, ids and HTTP writes
+                async for event in acoalesce(events, self.coalesce_window, self.coalesce_max_tokens):
+                    if event["type"] == "error":
+                        status = "failed"
+                    run.collect(event)
+                    run.buffer.append(event)
+                    run.last_event_at = time.monotonic()
+        except (asyncio.CancelledError, RunCancelled) as e:
+            status = "cancelled"
+            if run.stalled:
+                # Cancelled by our own watchdog, not by the caller
+                status = "failed"
+                final_event = {
+                    "type": "error",
+                    "code": "stalled",
+                    "message": f"No progress for {self.stall_seconds:g}s, the run was stopped",
+                }
+            elif isinstance(e, asyncio.CancelledError):
+                raise
+        except AdmissionRejected as e:
+            status = "rejected"
+            final_event = {
+                "type": "error",
+                "code": "overloaded",
+                "message": "Server is busy, please retry shortly",
+                "retry_after": e.retry_after,
+            }
+        except Exception as e:
+            status = "failed"
+            final_event = error_event(e)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            self._finish(run, status, final_event)
+
+    async def _watch_stall(self, run: ChatRun, task: asyncio.Task) -> None:
+        """Cancel ``task`` once ``run`` has emitted nothing for stall_seconds"""
+        while True:
+            idle = time.monotonic() - run.last_event_at
+            if idle >= self.stall_seconds:
+                print(f"[RUNS] Run {run.run_id} stalled for {idle:.0f}s, stopping it")
+                metrics.inc("agents_runs_stalled_total")
+                run.stalled = True
+                run.cancellation.cancel()
+                task.cancel()
+                return
+            await asyncio.sleep(self.stall_seconds - idle)
+
+    def _finish_if_never_started(self, run: ChatRun) -> None:
+        # A run cancelled before its task started never reaches _execute's
+        # finally block; close it here so subscribers are not left waiting
+        if not run.started:
+            self._finish(run, "cancelled")
+
+    def _finish(self, run: ChatRun, status: str, final_event: Optional[dict] = None) -> None:
+        """Close the run exactly once and release what it holds"""
+        with self._lock:
+            if run.is_finished:
+                return
+            run.status = status
+            run.finished_at = time.time()
+
+        if status == "cancelled":
+            final_event = {"type": "cancelled", "run_id": run.run_id}
+        if final_event is not None:
+            run.collect(final_event)
+            run.buffer.append(final_event)
+        run.buffer.close()
+        run.done.set()
+        # Free the worker (or the queue place) for the next run
+        self.admission.discard(run.slot)
+        self._record_finish(run)
+
+        if run.on_finish is not None:
+            try:
+                run.on_finish()
+            except Exception as e:
+                print(f"[RUNS] on_finish failed for {run.run_id}: {e}")
+
+    @staticmethod
+    def _labels(run: ChatRun) -> Dict[str, str]:
+        # Per-model series, so latency and cost can be compared across models
+        return {"model": run.model} if run.model else {}
+
+    def _record_finish(self, run: ChatRun) -> None:
+        # Cancelled runs are reported separately so wasted spend is visible
+        metrics.inc("agents_runs_finished_total", status=run.status, **self._labels(run))
+        metrics.inc("agents_tokens_total", run.usage.prompt_tokens, kind="input", status=run.status)
+        metrics.inc("agents_tokens_total", run.usage.completion_tokens, kind="output", status=run.status)
+        run.usage.record(status=run.status)
+
+    def cancel(self, run_id: str) -> bool:
+        """Cancel a running run; returns False if it is unknown or already done"""
+        run = self.get_run(run_id)
+        if run is None or run.is_finished or run.future is None:
+            return False
+        print(f"[RUNS] Cancelling run {run_id}")
+        # Stop sync nodes at their next LLM token / call, then the async task
+        run.cancellation.cancel()
+        run.future.cancel()
+        return True
+
+    # ---- subscribers ----
+
+    def touch(self, run: ChatRun) -> None:
+        """
+        Note client interest from a poll; restarts the orphan grace period
+        so a client that polls instead of subscribing keeps its run alive.
+        """
+        with self._lock:
+            if run.subscribers > 0 or run.is_finished:
+                return
+            run.detach_generation += 1
+            generation = run.detach_generation
+        self._get_loop().call_soon_threadsafe(self._arm_detach_timer, run, generation)
+
+    def _attach(self, run: ChatRun) -> None:
+        with self._lock:
+            run.subscribers += 1
+
+    def _detach(self, run: ChatRun) -> None:
+        with self._lock:
+            run.subscribers -= 1
+        self.touch(run)
+
+    def _arm_detach_timer(self, run: ChatRun, generation: int) -> None:
+        # Runs on the agent loop
+        self._loop.call_later(
+            self.detach_grace_seconds, self._cancel_if_orphaned, run, generation
+        )
+
+    def _cancel_if_orphaned(self, run: ChatRun, generation: int) -> None:
+        with self._lock:
+            orphaned = (
+                run.subscribers == 0
+                and run.detach_generation == generation
+                and not run.is_finished
+            )
+        if orphaned:
+            metrics.inc("agents_runs_disconnect_cancels_total")
+            self.cancel(run.run_id)
+
+    def subscribe(self, run: ChatRun, last_id: int = 0) -> Generator[bytes, None, None]:
+        """Follow a run's events from a WSGI thread, tracking the subscriber"""
+        self._attach(run)
+        try:
+            yield from run.buffer.follow(last_id, self.heartbeat_seconds)
+        finally:
+            self._detach(run)
+
+    async def asubscribe(self, run: ChatRun, last_id: int = 0) -> AsyncGenerator[bytes, None]:
+        """Follow a run's events from an event loop, tracking the subscriber"""
+        self._attach(run)
+        try:
+            async for frame in run.buffer.afollow(last_id, self.heartbeat_seconds):
+                yield frame
+        finally:
+            self._detach(run)
+
+    def wait(self, run: ChatRun, timeout: Optional[float] = None) -> bool:
+        """
+        Block until ``run`` finishes; the caller counts as a subscriber
+        meanwhile, so the orphan timer leaves the run alone.
+
+        Returns:
+            False if ``timeout`` passed first
+        """
+        self._attach(run)
+        try:
+            return run.done.wait(timeout)
+        finally:
+            self._detach(run)
+
+    def get_run(self, run_id: str) -> Optional[ChatRun]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def list_runs(self, session_id: str, active_only: bool = False) -> List[ChatRun]:
+        """Runs of one session, newest first"""
+        self._prune()
+        with self._lock:
+            runs = [
+                run for run in self._runs.values()
+                if run.session_id == session_id and not (active_only and run.is_finished)
+            ]
+        return sorted(runs, key=lambda run: run.created_at, reverse=True)
+
+    def _prune(self) -> None:
+        """Forget finished runs once their replay window has passed"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                run_id for run_id, run in self._runs.items()
+                if run.is_finished and run.finished_at < cutoff
+            ]
+            for run_id in expired:
+                del self._runs[run_id]
+
+            now = time.time()
+            stale = [
+                key for key, (run_id, _, expires_at) in self._idempotency.items()
+                if expires_at < now or run_id not in self._runs
+            ]
+            for key in stale:
+                del self._idempotency[key]
+
+
+_run_manager: Optional[RunManager] = None
+_run_manager_lock = threading.Lock()
+
+
+def get_run_manager() -> RunManager:
+    """Process-wide run manager"""
+    global _run_manager
+    if _run_manager is None:
+        with _run_manager_lock:
+            if _run_manager is None:
+                _run_manager = RunManager(
+                    admission=get_chat_admission(),
+                    buffer_size=getattr(settings, "AGENTS_RUN_BUFFER_SIZE", 5000),
+                    retention_seconds=getattr(settings, "AGENTS_RUN_RETENTION_SECONDS", 300),
+                    detach_grace_seconds=getattr(settings, "AGENTS_RUN_DETACH_GRACE_SECONDS", 10),
+                    idempotency_window_seconds=getattr(
+                        settings, "AGENTS_RUN_IDEMPOTENCY_WINDOW_SECONDS", 300
+                    ),
+                    coalesce_window=getattr(settings, "AGENTS_STREAM_COALESCE_MS", 20) / 1000,
+                    coalesce_max_tokens=getattr(settings, "AGENTS_STREAM_COALESCE_MAX_TOKENS", 32),
+                    heartbeat_seconds=getattr(settings, "AGENTS_SSE_HEARTBEAT_SECONDS", 15),
+                    stall_seconds=getattr(settings, "AGENTS_RUN_STALL_SECONDS", 120),
+                )
+    return _run_manager
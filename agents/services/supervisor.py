@@ -1,20 +1,72 @@
+from langgraph.channels import UntrackedValue
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_chroma import Chroma
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_classic.retrievers import MultiQueryRetriever
 
-from typing import Optional, Annotated
+from typing import Any, Dict, List, Optional, Annotated
+import numpy as np
 from pydantic import BaseModel, Field
 from typing_extensions import TypedDict
 from pathlib import Path
 import operator
+import re
+import threading
+import time
 from dataclasses import dataclass
 
+from django.conf import settings
+
+from ..helpers import metrics, stages
+from ..helpers.cancellation import RunCancelled
+from ..helpers.stages import emit_event, emit_stage
+from .intent_classifier import get_intent_classifier, margin_threshold
+
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 CHROMA_DB_PATH = BASE_DIR / "agents/chroma_db"
 COLLECTION_NAME = 'project_portfolio'
+EMBEDDING_MODEL = "text-embedding-3-large"
+RETRIEVAL_MODEL = "gpt-4o-mini"
+SMALL_TALK_MODEL = "gpt-4.1-mini"
+# Earlier turns the small-talk responder sees
+SMALL_TALK_HISTORY = 6
+
+# Opened once per process: the Chroma client keeps its HNSW segments in
+# memory and the OpenAI clients keep their HTTP connection pools
+_vectorstore: Optional[Chroma] = None
+_retrieval_llm: Optional[ChatOpenAI] = None
+_small_talk_llm: Optional[ChatOpenAI] = None
+_clients_lock = threading.Lock()
+
+# Portfolio categories (the ingest taxonomy) that answer each intent;
+# general_chat has none, so its retrieval results are left alone
+INTENT_CATEGORIES: Dict[str, tuple] = {
+    "technical_capability": ("Technical_Capability",),
+    "domain_expertise": ("Domain_Expertise",),
+    "business_trust": ("Business_Impact_Trust",),
+    "engagement_hiring": ("Engagement_Hiring",),
+    "process_communication": ("Process_Communication",),
+}
+
+# A category-filtered search returning fewer hits than this is redone
+# over the whole collection
+DEFAULT_MIN_FILTERED_RESULTS = 2
+
+# Query rewrites searched besides the question itself, and the reciprocal
+# rank fusion constant their rankings are merged with
+DEFAULT_QUERY_VARIANTS = 3
+RRF_K = 60
+
+QUERY_VARIANTS_PROMPT = """You are an AI language model assistant. Write {n} different versions of
+the user question below to retrieve relevant documents from the project
+portfolio of a software development company. Looking at the question from
+several angles helps overcome the limits of distance-based similarity
+search. Return one version per line, without numbering.
+Original question: {question}"""
 
 
 # Use TypedDict for state schema (not BaseModel) - LangChain v1 requirement
@@ -26,7 +78,11 @@ class SupervisorState(TypedDict):
     next_agent: str
     task_description: str
     rag_data: Optional[list]  # Added for storing retrieval results
+    rag_scores: Optional[Dict[str, float]]  # Relevance by document id, for the sources event
     user_message: str  # Added to track current user message
+    # Embedding of user_message, shared by intent classification and
+    # retrieval within one run; never checkpointed (3072 floats)
+    query_embedding: Annotated[Optional[list], UntrackedValue(list)]
 
 @dataclass
 class AgentContext:
@@ -45,19 +101,273 @@ class RouteQuery(BaseModel):
     )
 
 
+SMALL_TALK_SYSTEM_PROMPT = """
+You are the website assistant of Brihaspati Infotech, a software development
+company. The user is making small talk. Reply warmly in one or two short
+sentences, and offer to help with questions about our services, projects,
+technologies or hiring. Do not state facts about the company.
+"""
+
+INTENT_SYSTEM_PROMPT = """
+        You are a sophisticated intent classifier for Brihaspati Infotech.
+        Map the user's question to the correct category:
+
+        1. 'engagement_hiring': hire, developers, quote, cost, rate, hourly, team.
+        2. 'process_communication': communication, agile, sprint, NDA, support, maintenance, how do you work.
+        3. 'technical_capability': React, Node, AWS, scaling, security, integrations.
+        4. 'business_trust': startups, success stories, ratings, reviews, why choose you.
+        5. 'domain_expertise': dashboard, LMS, cart, fintech, healthcare.
+        6. 'general_chat': greetings and small talk.
+        """
+
+
 def get_vectorstore() -> Chroma:
     """
-    Re-open the existing Chroma collection using the same settings
-    used when creating the embeddings.
+    Process-wide handle on the existing Chroma collection, opened with the
+    same settings used when creating the embeddings.
     """
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    global _vectorstore
+    if _vectorstore is None:
+        with _clients_lock:
+            if _vectorstore is None:
+                embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+                _vectorstore = Chroma(
+                    collection_name=COLLECTION_NAME,
+                    embedding_function=embeddings,
+                    persist_directory=str(CHROMA_DB_PATH),
+                )
+    return _vectorstore
 
-    vectorstore = Chroma(
-        collection_name=COLLECTION_NAME,
-        embedding_function=embeddings,
-        persist_directory=str(CHROMA_DB_PATH),
-    )
-    return vectorstore
+
+def get_retrieval_llm() -> ChatOpenAI:
+    """Process-wide model that writes the multi-query rewrites"""
+    global _retrieval_llm
+    if _retrieval_llm is None:
+        with _clients_lock:
+            if _retrieval_llm is None:
+                _retrieval_llm = ChatOpenAI(temperature=0, model=RETRIEVAL_MODEL)
+    return _retrieval_llm
+
+
+def get_small_talk_llm() -> ChatOpenAI:
+    """Process-wide small model that answers general_chat turns"""
+    global _small_talk_llm
+    if _small_talk_llm is None:
+        with _clients_lock:
+            if _small_talk_llm is None:
+                model = getattr(settings, "AGENTS_SMALL_TALK_MODEL", SMALL_TALK_MODEL)
+                _small_talk_llm = ChatOpenAI(temperature=0.3, model=model)
+    return _small_talk_llm
+
+
+def classify_intent_llm(llm, user_message: str, config: Optional[dict] = None) -> RouteQuery:
+    """The chat model picks the intent (structured output)"""
+    llm_with_structure = llm.with_structured_output(RouteQuery)
+    return llm_with_structure.invoke([
+        SystemMessage(content=INTENT_SYSTEM_PROMPT),
+        HumanMessage(content=user_message)
+    ], config=config)
+
+
+class ScoredMMRRetriever(BaseRetriever):
+    """
+    MMR search over the portfolio collection (same as
+    ``as_retriever(search_type="mmr")``) that also remembers each hit's
+    relevance score by document id, for the ``sources`` event.
+    Queries found in ``query_embeddings`` are not embedded again.
+
+    With a ``where`` filter the candidates come from the matching chunks
+    only; a query for which that yields fewer than ``min_filtered_results``
+    is searched again without it (counted in ``unfiltered_fallbacks``).
+    """
+
+    vectorstore: Chroma
+    k: int = 6
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    scores: Dict[str, float] = Field(default_factory=dict)
+    query_embeddings: Dict[str, List[float]] = Field(default_factory=dict)
+    where: Optional[Dict] = None
+    min_filtered_results: int = DEFAULT_MIN_FILTERED_RESULTS
+    unfiltered_fallbacks: int = 0
+
+    def _query(self, embeddings: List[List[float]], where: Optional[Dict]) -> List[dict]:
+        """Candidates for each embedding, from one Chroma query"""
+        results = self.vectorstore._collection.query(
+            query_embeddings=embeddings,
+            n_results=self.fetch_k,
+            where=where,
+            include=["metadatas", "documents", "distances", "embeddings"],
+        )
+        keys = ("ids", "documents", "metadatas", "distances", "embeddings")
+        return [{key: results[key][i] for key in keys} for i in range(len(embeddings))]
+
+    def _search(self, embeddings: List[List[float]]) -> List[List[Document]]:
+        """MMR-ranked documents for each query embedding"""
+        candidates = self._query(embeddings, self.where)
+        if self.where:
+            short = [i for i, hits in enumerate(candidates) if len(hits["ids"]) < self.min_filtered_results]
+            if short:
+                print(f"[RAG] {len(short)}/{len(embeddings)} queries short of hits for {self.where}, searching unfiltered")
+                self.unfiltered_fallbacks += len(short)
+                for i, hits in zip(short, self._query([embeddings[i] for i in short], None)):
+                    candidates[i] = hits
+        relevance = self.vectorstore._select_relevance_score_fn()
+
+        ranked = []
+        for embedding, hits in zip(embeddings, candidates):
+            selected = maximal_marginal_relevance(
+                np.array(embedding, dtype=np.float32),
+                hits["embeddings"],
+                k=self.k,
+                lambda_mult=self.lambda_mult,
+            )
+            docs = []
+            for index in selected:
+                doc_id = hits["ids"][index]
+                score = relevance(hits["distances"][index])
+                # A document found by several query variants keeps its best score
+                self.scores[doc_id] = max(score, self.scores.get(doc_id, score))
+                docs.append(Document(
+                    id=doc_id,
+                    page_content=hits["documents"][index],
+                    metadata=hits["metadatas"][index] or {},
+                ))
+            ranked.append(docs)
+        return ranked
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        embedding = self.query_embeddings.get(query)
+        if embedding is None:
+            embedding = self.vectorstore.embeddings.embed_query(query)
+        return self._search([embedding])[0]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = RRF_K) -> List[Document]:
+    """
+    Merge ranked lists by reciprocal rank fusion: a document scores
+    ``sum(1 / (k + rank))`` over the lists it appears in (rank from 1).
+    Ties keep the order in which documents were first seen.
+    """
+    fused: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            fused[doc.id] = fused.get(doc.id, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(doc.id, doc)
+    order = sorted(fused, key=fused.get, reverse=True)
+    return [docs[doc_id] for doc_id in order]
+
+
+class FusionRetriever(ScoredMMRRetriever):
+    """
+    Multi-query retrieval in one pass. The LLM writes ``num_variants``
+    rewrites of the question (none when 0); every query not already in
+    ``query_embeddings`` is embedded in a single ``embed_documents`` call;
+    all queries are searched in one batched Chroma query; the per-query MMR
+    rankings are merged with reciprocal rank fusion and the top ``k`` kept.
+
+    ``timings`` holds the milliseconds spent per stage of the last call.
+    """
+
+    llm: Optional[Any] = None
+    num_variants: int = DEFAULT_QUERY_VARIANTS
+    rrf_k: int = RRF_K
+    timings: Dict[str, float] = Field(default_factory=dict)
+
+    def generate_variants(self, question: str, run_manager=None) -> List[str]:
+        """Up to ``num_variants`` rewrites of the question, one LLM call"""
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        response = self.llm.invoke(
+            QUERY_VARIANTS_PROMPT.format(n=self.num_variants, question=question),
+            config=config,
+        )
+        text = response.content if hasattr(response, "content") else str(response)
+        lines = [re.sub(r"^\s*(?:\d+[.)]|[-*])\s*", "", line).strip() for line in text.splitlines()]
+        variants = [line for line in dict.fromkeys(lines) if line and line != question]
+        return variants[:self.num_variants]
+
+    def _lap(self, stage: str, started: float) -> float:
+        now = time.perf_counter()
+        self.timings[stage] = round((now - started) * 1000, 1)
+        return now
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        self.timings = {}
+        started = time.perf_counter()
+
+        variants = []
+        if self.num_variants > 0 and self.llm is not None:
+            try:
+                variants = self.generate_variants(query, run_manager)
+            except RunCancelled:
+                raise
+            except Exception as e:
+                # The original question alone still retrieves
+                print(f"[RAG] Query variants failed: {str(e)}")
+        started = self._lap("variants_ms", started)
+
+        queries = [query, *variants]
+        missing = [q for q in queries if q not in self.query_embeddings]
+        if missing:
+            vectors = self.vectorstore.embeddings.embed_documents(missing)
+            self.query_embeddings.update(zip(missing, vectors))
+        started = self._lap("embed_ms", started)
+
+        rankings = self._search([self.query_embeddings[q] for q in queries])
+        started = self._lap("search_ms", started)
+
+        docs = reciprocal_rank_fusion(rankings, self.rrf_k)[:self.k]
+        self._lap("fuse_ms", started)
+        print(f"[RAG] {len(queries)} queries, {sum(map(len, rankings))} hits fused to {len(docs)}: {self.timings}")
+        return docs
+
+
+def intent_where(intent: str) -> Optional[Dict]:
+    """Chroma ``where`` filter on the categories of an intent, if it has any"""
+    categories = INTENT_CATEGORIES.get(intent)
+    if not categories:
+        return None
+    if len(categories) == 1:
+        return {"category": categories[0]}
+    return {"category": {"$in": list(categories)}}
+
+
+def min_filtered_results() -> int:
+    return int(getattr(settings, "AGENTS_RAG_MIN_FILTERED_RESULTS", DEFAULT_MIN_FILTERED_RESULTS))
+
+
+def filter_by_intent(docs: List[Document], intent: str, min_results: int = 1) -> List[Document]:
+    """
+    Keep the documents whose category matches the classified intent.
+
+    When the LLM settles the intent, retrieval has run unfiltered alongside
+    it, so this is applied once both are in. If fewer than ``min_results``
+    match (or the intent has no categories) the documents are returned
+    unchanged, the same fallback the filtered search uses.
+    """
+    categories = INTENT_CATEGORIES.get(intent)
+    if not categories:
+        return docs
+    matching = [doc for doc in docs if doc.metadata.get("category") in categories]
+    return matching if len(matching) >= max(min_results, 1) else docs
+
+
+def sources_event(docs: List[Document], scores: Dict[str, float]) -> dict:
+    """Compact citation list for the client: metadata and scores, no text"""
+    return {
+        "type": "sources",
+        "sources": [
+            {
+                "id": doc.id,
+                "category": doc.metadata.get("category"),
+                "sub_type": doc.metadata.get("sub_type"),
+                "project_ref": doc.metadata.get("project_ref"),
+                "score": round(scores[doc.id], 4) if doc.id in scores else None,
+            }
+            for doc in docs
+        ],
+    }
 
 
 def create_supervisor_agent(llm, message_agent, checkpointer):
@@ -73,85 +383,150 @@ def create_supervisor_agent(llm, message_agent, checkpointer):
         Compiled supervisor graph
     """
 
-    def intent_classifier_node(state: SupervisorState) -> SupervisorState:
-        """Classify user intent using structured output"""
-        system_prompt = """
-        You are a sophisticated intent classifier for Brihaspati Infotech.
-        Map the user's question to the correct category:
+    def embed_query_node(state: SupervisorState) -> SupervisorState:
+        """Embed the user message once for intent classification and retrieval"""
+        print("[CALLED EMBED QUERY NODE].................")
+        try:
+            embedding = get_vectorstore().embeddings.embed_query(state.get("user_message", ""))
+        except Exception as e:
+            # Both consumers fall back to their own path without it
+            print(f"[EMBED Error] {str(e)}")
+            embedding = None
+        return {"query_embedding": embedding}
+
+    def classified(intent: str, confidence: float, source: str, margin: Optional[float]) -> SupervisorState:
+        print(f"[RESPONSE INETNT CATGH] {intent} via {source} (margin {margin})")
+        metrics.inc("agents_intent_classified_total", source=source, intent=intent)
+        emit_stage(
+            stages.INTENT_CLASSIFIED,
+            intent=intent,
+            confidence=confidence,
+            source=source,
+            margin=margin,
+        )
+        return {"intent": intent, "confidence": confidence}
 
-        1. 'engagement_hiring': hire, developers, quote, cost, rate, hourly, team.
-        2. 'process_communication': communication, agile, sprint, NDA, support, maintenance, how do you work.
-        3. 'technical_capability': React, Node, AWS, scaling, security, integrations.
-        4. 'business_trust': startups, success stories, ratings, reviews, why choose you.
-        5. 'domain_expertise': dashboard, LMS, cart, fintech, healthcare.
-        6. 'general_chat': greetings and small talk.
+    def intent_classifier_node(state: SupervisorState) -> SupervisorState:
         """
+        Classify user intent against the intent centroids. When the nearest
+        two are too close to call the intent is left empty and intent_llm
+        decides, in parallel with retrieval.
+        """
+        embedding = state.get("query_embedding")
 
         print("[CALLED INTENT CLASSIFIER NODE].................", state.get("user_message", ""))
 
-        # Use with_structured_output for structured output
-        llm_with_structure = llm.with_structured_output(RouteQuery)
-        
-        llm_response = llm_with_structure.invoke([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=state.get("user_message", ""))
-        ])
+        prediction = None
+        if embedding is not None:
+            try:
+                prediction = get_intent_classifier(get_vectorstore().embeddings).predict(embedding)
+            except Exception as e:
+                print(f"[INTENT Error] {str(e)}")
 
-        print("[RESPONSE INETNT CATGH].................", llm_response)
+        if prediction is None or prediction.margin < margin_threshold():
+            print(f"[INTENT] Undecided locally ({prediction}), asking the LLM")
+            return {"intent": "", "confidence": 0.0}
+        return classified(prediction.intent, prediction.confidence, "embedding", prediction.margin)
 
-        return {
-            "intent": llm_response.intent,
-            "confidence": llm_response.confidence or 0.0,
-        }
+    def intent_llm_node(state: SupervisorState) -> SupervisorState:
+        """Classify user intent using structured output"""
+        print("[CALLED INTENT LLM NODE].................")
+        llm_response = classify_intent_llm(llm, state.get("user_message", ""))
+        return classified(llm_response.intent, llm_response.confidence or 0.0, "llm", None)
 
-    def rag_executor_node(state: SupervisorState) -> SupervisorState:
-        """Execute RAG retrieval based on intent"""
+    def route_after_intent(state: SupervisorState):
+        """Small talk skips retrieval; an undecided intent is settled while retrieving"""
         intent = state.get("intent", "")
-        confidence = state.get("confidence", 0.0)
+        if intent == "general_chat":
+            return "small_talk"
+        if intent:
+            return "rag_executor"
+        return ["intent_llm", "rag_executor"]
+
+    def rag_executor_node(state: SupervisorState) -> SupervisorState:
+        """
+        Execute RAG retrieval, scoped to the intent's categories when it is
+        already known (otherwise in parallel with the LLM classifier)
+        """
         user_message = state.get("user_message", "")
+        embedding = state.get("query_embedding")
+        where = intent_where(state.get("intent", ""))
 
-        print("[CALLED RAG CLASSIFIER NODE].................")
+        print("[CALLED RAG CLASSIFIER NODE].................", where)
 
-        if not intent:
-            # Low confidence - return empty results
-            return {"rag_data": []}
-        
+        emit_stage(stages.RETRIEVAL_STARTED)
+        started = time.monotonic()
         try:
             vectorstore = get_vectorstore()
             
-            base_retriever = vectorstore.as_retriever(
-                search_type="mmr", 
-                search_kwargs={
-                    "k": 6,          # How many unique docs to return per query
-                    "fetch_k": 20,   # Pool of docs to select from
-                }
+            num_variants = int(getattr(settings, "AGENTS_RAG_QUERY_VARIANTS", DEFAULT_QUERY_VARIANTS))
+            # The question and its rewrites, embedded in one call (the
+            # question's embedding is already known), searched together
+            # and merged by rank fusion
+            retriever = FusionRetriever(
+                vectorstore=vectorstore,
+                llm=get_retrieval_llm() if num_variants > 0 else None,
+                num_variants=num_variants,
+                k=6,          # How many unique docs to return
+                fetch_k=20,   # Pool of docs to select from, per query
+                query_embeddings={user_message: embedding} if embedding is not None else {},
+                where=where,
+                min_filtered_results=min_filtered_results(),
             )
 
-            retrieval_llm = ChatOpenAI(temperature=0, model="gpt-4o-mini")
+            # Invoke returns List[Document], best first
+            unique_docs = retriever.invoke(user_message)
 
-            # MultiQueryRetriever
-            advanced_retriever = MultiQueryRetriever.from_llm(
-                retriever=base_retriever,
-                llm=retrieval_llm
+            if where is None:
+                scope = "all"
+            elif retriever.unfiltered_fallbacks:
+                scope = "fallback"
+            else:
+                scope = "category"
+            print(f"[RAG] Retrieved {len(unique_docs)} documents ({scope})")
+            metrics.inc("agents_retrieval_scope_total", scope=scope)
+            emit_stage(
+                stages.RETRIEVAL_FINISHED,
+                docs=len(unique_docs),
+                latency_ms=round((time.monotonic() - started) * 1000, 1),
+                scope=scope,
+                timings=retriever.timings,
             )
+            return {"rag_data": unique_docs, "rag_scores": dict(retriever.scores)}
 
-            # Invoke returns List[Document]
-            unique_docs = advanced_retriever.invoke(user_message)
-
-            print(f"[RAG] Retrieved {len(unique_docs)} documents")
-
-            return {"rag_data": unique_docs}
-        
+        except RunCancelled:
+            raise
         except Exception as e:
             print(f"[RAG Error] {str(e)}")
-            return {"rag_data": []}
+            emit_stage(
+                stages.RETRIEVAL_FINISHED,
+                docs=0,
+                latency_ms=round((time.monotonic() - started) * 1000, 1),
+                error=str(e),
+            )
+            return {"rag_data": [], "rag_scores": {}}
 
     def route_task(state: SupervisorState) -> SupervisorState:
-        """Analyze task and decide which agent to route to"""
+        """
+        Join point of intent classification and retrieval: narrow the
+        retrieved documents to the intent, then decide which agent to route to
+        """
         messages = state.get("messages", [])
+        intent = state.get("intent", "")
 
         print("[CALLED ROUTE TASK].................")
 
+        if intent == "general_chat":
+            # The LLM settled an undecided intent as small talk
+            return {"next_agent": "small_talk", "rag_data": []}
+
+        retrieved = state.get("rag_data") or []
+        rag_data = filter_by_intent(retrieved, intent, min_filtered_results())
+        if len(rag_data) != len(retrieved):
+            print(f"[RAG] Kept {len(rag_data)}/{len(retrieved)} documents for intent {intent}")
+        # Citations for the UI, sent once per answer
+        emit_event(sources_event(rag_data, state.get("rag_scores") or {}))
+
         if not messages:
             return {
                 "next_agent": "end",
@@ -167,7 +542,8 @@ def create_supervisor_agent(llm, message_agent, checkpointer):
 
         return {
             "next_agent": "message_agent",
-            "task_description": task_text
+            "task_description": task_text,
+            "rag_data": rag_data,
         }
 
     def message_generator_node(state: SupervisorState) -> SupervisorState:
@@ -185,6 +561,7 @@ def create_supervisor_agent(llm, message_agent, checkpointer):
         rag_data = state.get("rag_data", [])
 
         print("[MESSAGE GENERATOR NODE].................")
+        emit_stage(stages.GENERATION_STARTED)
         print(f"[MESSAGE GENERATOR] Processing {len(messages)} messages with {len(rag_data)} RAG docs")
         
         try:
@@ -235,7 +612,10 @@ def create_supervisor_agent(llm, message_agent, checkpointer):
             return {
                 "messages": [AIMessage(content=agent_response)]
             }
-            
+
+        except RunCancelled:
+            # Not an answer: let the run end as cancelled
+            raise
         except Exception as e:
             print(f"[MESSAGE GENERATOR ERROR] {str(e)}")
             import traceback
@@ -244,6 +624,31 @@ def create_supervisor_agent(llm, message_agent, checkpointer):
                 "messages": [AIMessage(content=f"Error processing request: {str(e)}")]
             }
     
+    def small_talk_node(state: SupervisorState) -> SupervisorState:
+        """
+        Answer greetings and small talk with a small model and a short
+        prompt: no retrieval, no RAG context, no message agent.
+        """
+        messages = state.get("messages", [])
+
+        print("[SMALL TALK NODE].................")
+        emit_stage(stages.GENERATION_STARTED, path="small_talk")
+        try:
+            # Tokens stream from this node; the returned message is the same
+            # one, so it is not sent twice
+            response = get_small_talk_llm().invoke(
+                [SystemMessage(content=SMALL_TALK_SYSTEM_PROMPT), *messages[-SMALL_TALK_HISTORY:]]
+            )
+            return {"messages": [response], "rag_data": []}
+        except RunCancelled:
+            raise
+        except Exception as e:
+            print(f"[SMALL TALK ERROR] {str(e)}")
+            return {
+                "messages": [AIMessage(content=f"Error processing request: {str(e)}")],
+                "rag_data": [],
+            }
+
     def should_route(state: SupervisorState) -> str:
         """Determine next step based on routing decision"""
         next_agent = state.get("next_agent", "end")
@@ -255,14 +660,32 @@ def create_supervisor_agent(llm, message_agent, checkpointer):
     workflow = StateGraph(SupervisorState)
     
     # Add nodes
+    workflow.add_node("embed_query", embed_query_node)
     workflow.add_node("intent_classifier", intent_classifier_node)
+    workflow.add_node("intent_llm", intent_llm_node)
+    workflow.add_node("small_talk", small_talk_node)
     workflow.add_node("rag_executor", rag_executor_node)
     workflow.add_node("router", route_task)
     workflow.add_node("message_agent", message_generator_node)
 
-    # Add edges
-    workflow.add_edge(START, "intent_classifier")
-    workflow.add_edge("intent_classifier", "rag_executor")
+    # Add edges: the user message is embedded once and classified locally.
+    # Small talk goes straight to its responder, other intents to retrieval;
+    # an undecided intent goes to the LLM and retrieval in the same step, and
+    # the router runs once both are done.
+    workflow.add_edge(START, "embed_query")
+    workflow.add_edge("embed_query", "intent_classifier")
+    workflow.add_conditional_edges(
+        "intent_classifier",
+        route_after_intent,
+        ["small_talk", "rag_executor", "intent_llm"],
+    )
+    # Two plain edges, not a join: with a known intent rag_executor runs
+    # alone and a join on ["intent_llm", "rag_executor"] would never fire.
+    # When both run they are started by the same conditional edge, so they
+    # share one superstep; a superstep ends only after all of its nodes have
+    # finished, whatever their timing, and the router then runs once with
+    # both writes.
+    workflow.add_edge("intent_llm", "router")
     workflow.add_edge("rag_executor", "router")
     
     # Conditional routing based on classification
@@ -271,12 +694,14 @@ def create_supervisor_agent(llm, message_agent, checkpointer):
         should_route,
         {
             "message_agent": "message_agent",
+            "small_talk": "small_talk",
             "end": END
         }
     )
     
     # Message agent goes to end
     workflow.add_edge("message_agent", END)
+    workflow.add_edge("small_talk", END)
     
     # Compile the graph with checkpointer
     supervisor_graph = workflow.compile(checkpointer=checkpointer)
@@ -0,0 +1,168 @@
+"""
+Opt-in warm-up of the agent stack at worker boot.
+
+Without it the first chat request on a fresh worker pays for importing the
+agent stack, compiling the supervisor graph, opening the Chroma persistent
+client (and loading its HNSW segments), building the OpenAI HTTP clients,
+loading tiktoken encodings and embedding the intent examples.
+``start_warmup`` does all of that, plus one dummy retrieval, on a
+background thread; the readiness endpoint reports ready only once it has
+finished, so a rolling deploy does not route live traffic to a cold worker.
+If a step fails the worker is reported ``degraded`` (not ready) with the
+failing steps, so the deploy holds traffic rather than sending it to a
+worker whose Chroma or OpenAI setup is broken.
+
+The warm-up is started by ``service_advisor/wsgi.py`` / ``asgi.py``, so it
+runs in server processes only, never for management commands or tests.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from ..helpers import metrics
+
+
+# Models whose tiktoken encodings the agent stack uses
+TIKTOKEN_MODELS = ("gpt-4.1", "gpt-4o-mini", "text-embedding-3-large")
+
+_state = {
+    "status": "idle",  # idle -> warming -> ready | degraded
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},
+    "failed": [],
+}
+_state_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def _warm_agent_stack() -> None:
+    # Imports langchain / langgraph / OpenAI and compiles the shared graph,
+    # which also builds the OpenAI chat client and its HTTP connection pool
+    from ..helpers.chat_models import chat_models
+    from .graph_registry import get_supervisor_graph
+
+    # One compiled graph per model a request may pick
+    for model_name in set(chat_models().values()):
+        get_supervisor_graph(model_name=model_name)
+
+
+def _warm_openai_clients() -> None:
+    from .supervisor import get_retrieval_llm, get_small_talk_llm
+
+    get_retrieval_llm()
+    get_small_talk_llm()
+
+
+def _warm_vectorstore() -> None:
+    from .supervisor import get_vectorstore
+
+    get_vectorstore()
+
+
+def _warm_intent_classifier() -> None:
+    # Embeds the labelled examples once to build the intent centroids
+    from .intent_classifier import get_intent_classifier
+    from .supervisor import get_vectorstore
+
+    get_intent_classifier(get_vectorstore().embeddings)
+
+
+def _warm_tiktoken() -> None:
+    import tiktoken
+
+    for model in TIKTOKEN_MODELS:
+        tiktoken.encoding_for_model(model)
+
+
+def _warm_retrieval() -> None:
+    # One real query: embeds through the OpenAI client (TLS handshake,
+    # keep-alive connection) and loads the collection's HNSW index
+    from .supervisor import get_vectorstore
+
+    get_vectorstore().similarity_search(
+        getattr(settings, "AGENTS_WARMUP_QUERY", "web application development"), k=1
+    )
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("agent_stack", _warm_agent_stack),
+    ("openai_clients", _warm_openai_clients),
+    ("vectorstore", _warm_vectorstore),
+    ("intent_classifier", _warm_intent_classifier),
+    ("tiktoken", _warm_tiktoken),
+    ("retrieval", _warm_retrieval),
+]
+
+
+def run_warmup() -> Dict[str, dict]:
+    """
+    Run every warm-up step in order and mark the worker ready.
+
+    A failing step is recorded and logged but does not stop the others;
+    the worker is then marked ``degraded`` instead of ready, with the
+    failing steps listed under ``failed``.
+
+    Returns:
+        Per-step results: {"seconds": float, "error": str | None}
+    """
+    with _state_lock:
+        _state["status"] = "warming"
+        _state["started_at"] = time.time()
+
+    for name, step in WARMUP_STEPS:
+        started = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as e:
+            error = str(e)
+            print(f"[WARMUP] Step {name} failed: {e}")
+        elapsed = time.perf_counter() - started
+        metrics.observe("agents_warmup_seconds", elapsed, step=name)
+        print(f"[WARMUP] {name} took {elapsed * 1000:.0f} ms")
+        with _state_lock:
+            _state["steps"][name] = {"seconds": round(elapsed, 4), "error": error}
+
+    with _state_lock:
+        _state["failed"] = [name for name, result in _state["steps"].items() if result["error"]]
+        _state["status"] = "degraded" if _state["failed"] else "ready"
+        _state["finished_at"] = time.time()
+        if _state["failed"]:
+            print(f"[WARMUP] Degraded, failed steps: {', '.join(_state['failed'])}")
+        return dict(_state["steps"])
+
+
+def start_warmup() -> None:
+    """Run the warm-up once per process on a background thread"""
+    global _thread
+    with _state_lock:
+        if _thread is not None:
+            return
+        _state["status"] = "warming"
+        _thread = threading.Thread(target=run_warmup, name="agents-warmup", daemon=True)
+    _thread.start()
+
+
+def warmup_enabled() -> bool:
+    return getattr(settings, "AGENTS_WARMUP_ON_STARTUP", False)
+
+
+def readiness() -> dict:
+    """
+    Readiness snapshot; ``ready`` is False while an enabled warm-up has
+    not finished yet and, with ``status: "degraded"``, when any of its
+    steps failed.
+    """
+    with _state_lock:
+        state = {**_state, "steps": dict(_state["steps"]), "failed": list(_state["failed"])}
+    if not warmup_enabled() and state["status"] == "idle":
+        return {"ready": True, "warmup": "disabled"}
+    result = {"ready": state["status"] == "ready", "warmup": state}
+    if state["status"] == "degraded":
+        result["status"] = "degraded"
+        result["failed"] = state["failed"]
+    return result
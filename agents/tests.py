@@ -1,3 +1,993 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.test import Client, SimpleTestCase, override_settings
+from langchain_chroma import Chroma
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from .helpers import coalescing
+from .helpers.admission import AdmissionController, AdmissionRejected
+from .helpers.cancellation import CancellationHandler, RunCancelled
+from .helpers.event_buffer import HEARTBEAT_FRAME, RunEventBuffer
+from .helpers.stream_helper import AnswerStreamFilter
+from .helpers.usage import UsageTracker, estimate_cost
+from .services import graph_registry, runs, supervisor
+from .services.intent_classifier import CentroidIntentClassifier
+
+
+class _CountingHandler(BaseCallbackHandler):
+    """Records every chat model call"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        with self._lock:
+            self.calls.append(messages)
+
+
+def _answer_graph(handler):
+    """One-node graph standing in for the supervisor"""
+    model = GenericFakeChatModel(
+        messages=itertools.cycle([AIMessage(content="hello from the agent")]),
+        callbacks=[handler],
+    )
+
+    def answer(state: MessagesState):
+        return {"messages": [model.invoke(state["messages"])]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("answer", answer)
+    builder.add_edge(START, "answer")
+    builder.add_edge("answer", END)
+    return builder.compile()
+
+
+class _FakeAgentTestCase(SimpleTestCase):
+    """Runs the one-node fake graph through a private RunManager"""
+
+    def setUp(self):
+        self.handler = _CountingHandler()
+        self.manager = runs.RunManager(
+            admission=AdmissionController("test", 4, 10, 5, 1),
+            buffer_size=100,
+            retention_seconds=60,
+            detach_grace_seconds=60,
+            idempotency_window_seconds=60,
+        )
+        saver = InMemorySaver()
+
+        @asynccontextmanager
+        async def lease():
+            yield saver
+
+        graph = _answer_graph(self.handler)
+        for patcher in (
+            mock.patch.object(runs, "async_leased_checkpointer", lease),
+            mock.patch.object(graph_registry, "get_supervisor_graph", lambda **kwargs: graph),
+            mock.patch.object(runs, "get_run_manager", lambda: self.manager),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class IdempotentChatPostTests(_FakeAgentTestCase):
+    def _post(self, message="hi", key=None, barrier=None):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        if barrier is not None:
+            barrier.wait()
+        return Client().post(
+            "/api/chat", {"session_id": "s1", "user_message": message}, **headers
+        )
+
+    def _wait(self, run_id):
+        run = self.manager.get_run(run_id)
+        frames = list(self.manager.subscribe(run))
+        self.assertTrue(run.is_finished)
+        return run, frames
+
+    def test_concurrent_duplicates_share_one_run(self):
+        attempts = 8
+        barrier = threading.Barrier(attempts)
+        with ThreadPoolExecutor(attempts) as pool:
+            responses = list(pool.map(
+                lambda _: self._post(key="retry-1", barrier=barrier), range(attempts)
+            ))
+
+        run_ids = {response.json()["run_id"] for response in responses}
+        self.assertEqual(len(run_ids), 1)
+        self.assertEqual(sorted(r.status_code for r in responses), [200] * (attempts - 1) + [202])
+
+        run, _ = self._wait(run_ids.pop())
+        self.assertEqual(run.status, "completed")
+        self.assertEqual(len(self.handler.calls), 1)
+
+    def test_duplicate_after_finish_replays_the_run(self):
+        first = self._post(key="retry-2").json()
+        _, frames = self._wait(first["run_id"])
+
+        repeat = self._post(key="retry-2")
+        self.assertEqual(repeat.status_code, 200)
+        self.assertTrue(repeat.json()["duplicate"])
+        self.assertEqual(repeat.json()["run_id"], first["run_id"])
+
+        run, replayed = self._wait(repeat.json()["run_id"])
+        self.assertEqual(replayed, frames)
+        self.assertEqual(len(self.handler.calls), 1)
+
+    def test_key_reused_for_another_message_is_rejected(self):
+        first = self._post(message="hi", key="retry-3").json()
+        response = self._post(message="something else", key="retry-3")
+        self.assertEqual(response.status_code, 422)
+        self._wait(first["run_id"])
+
+    def test_posts_without_a_key_start_separate_runs(self):
+        first = self._post().json()["run_id"]
+        second = self._post().json()["run_id"]
+        self.assertNotEqual(first, second)
+        self._wait(first)
+        self._wait(second)
+        self.assertEqual(len(self.handler.calls), 2)
+
+
+class ChatJsonAndBatchTests(_FakeAgentTestCase):
+    def _post_json(self, path, body):
+        return Client().post(path, json.dumps(body), content_type="application/json")
+
+    def test_chat_json_answers_in_one_response(self):
+        response = self._post_json("/api/chat/json", {"session_id": "s1", "user_message": "hi"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "completed")
+        self.assertEqual(len(self.handler.calls), 1)
+
+    def test_chat_json_rejects_a_bad_model(self):
+        for model in ("gpt-unknown", ["default"], {"name": "default"}, 3):
+            response = self._post_json(
+                "/api/chat/json", {"session_id": "s1", "user_message": "hi", "model": model}
+            )
+            self.assertEqual(response.status_code, 400, model)
+            self.assertIn("models", response.json())
+        self.assertEqual(self.handler.calls, [])
+
+    def test_chat_json_rejects_a_non_string_session_id(self):
+        response = self._post_json("/api/chat/json", {"session_id": ["s1"], "user_message": "hi"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_valid_batch(self):
+        items = [
+            {"session_id": "a", "user_message": "first"},
+            {"session_id": "a", "user_message": "second"},
+            {"session_id": "b", "user_message": "hi", "model": "fast"},
+        ]
+        response = self._post_json("/api/chat/batch", {"items": items, "parallelism": 2})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["succeeded"], body["failed"]), (3, 0))
+        self.assertEqual([r["index"] for r in body["results"]], [0, 1, 2])
+        self.assertTrue(all(r["status"] == "completed" for r in body["results"]))
+        self.assertEqual(len(self.handler.calls), 3)
+
+    def test_mixed_batch_marks_bad_items_invalid(self):
+        items = [
+            {"session_id": "a", "user_message": "hi"},
+            {"session_id": ["a"], "user_message": "hi"},
+            {"session_id": {"id": "a"}, "user_message": "hi"},
+            {"session_id": "b", "user_message": "hi", "model": ["fast"]},
+            {"session_id": "c", "user_message": "hi", "model": "gpt-unknown"},
+            {"session_id": "d"},
+            "not an object",
+            {"session_id": "e", "user_message": "hi"},
+        ]
+        response = self._post_json("/api/chat/batch", {"items": items})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(
+            [r["status"] for r in body["results"]],
+            ["completed"] + ["invalid"] * 6 + ["completed"],
+        )
+        self.assertEqual((body["succeeded"], body["failed"]), (2, 6))
+        for result in body["results"][1:7]:
+            self.assertFalse(result["ok"])
+            self.assertEqual(result["error"]["code"], "bad_request")
+        self.assertEqual(len(self.handler.calls), 2)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    async def test_full_queue_is_rejected(self):
+        loop = asyncio.get_running_loop()
+        admission = AdmissionController("test", 1, 1, 5, 7)
+        running = admission.enqueue(loop)
+        queued = admission.enqueue(loop)
+        self.assertTrue(running.granted)
+        self.assertFalse(queued.granted)
+
+        with self.assertRaises(AdmissionRejected) as raised:
+            admission.enqueue(loop)
+        self.assertEqual(raised.exception.reason, "queue_full")
+        self.assertEqual(raised.exception.retry_after, 7)
+        self.assertEqual(admission.stats()["active"], 1)
+        self.assertEqual(admission.stats()["queued"], 1)
+
+    async def test_queued_waiter_times_out(self):
+        loop = asyncio.get_running_loop()
+        admission = AdmissionController("test", 1, 1, 0.05, 1)
+        running = admission.enqueue(loop)
+        await admission.wait_async(running)
+        queued = admission.enqueue(loop)
+
+        with self.assertRaises(AdmissionRejected) as raised:
+            await admission.wait_async(queued)
+        self.assertEqual(raised.exception.reason, "timeout")
+        self.assertEqual(admission.stats()["queued"], 0)
+
+        # The timed-out waiter holds nothing: freeing the slot empties the controller
+        admission.discard(queued)
+        admission.discard(running)
+        self.assertEqual(admission.stats()["active"], 0)
+
+    async def test_discard_hands_the_slot_to_the_oldest_waiter(self):
+        loop = asyncio.get_running_loop()
+        admission = AdmissionController("test", 1, 2, 5, 1)
+        running = admission.enqueue(loop)
+        first, second = admission.enqueue(loop), admission.enqueue(loop)
+
+        admission.discard(running)
+        await admission.wait_async(first)
+        self.assertTrue(first.admitted)
+        self.assertFalse(second.granted)
+        self.assertEqual(admission.stats()["active"], 1)
+
+        # Discarding twice, or a waiter still queued, never frees extra slots
+        admission.discard(running)
+        admission.discard(second)
+        admission.discard(first)
+        self.assertEqual(admission.stats()["active"], 0)
+        self.assertEqual(admission.stats()["queued"], 0)
+
+
+def _filled_buffer(count, max_events=100):
+    buffer = RunEventBuffer(max_events)
+    for n in range(1, count + 1):
+        buffer.append({"type": "streaming", "message": f"t{n}"})
+    return buffer
+
+
+def _frame_events(frames):
+    """(id or None, event) per SSE frame"""
+    events = []
+    for frame in frames:
+        event_id, data = None, frame
+        if frame.startswith(b"id: "):
+            head, data = frame.split(b"\n", 1)
+            event_id = int(head[4:])
+        events.append((event_id, json.loads(data[len(b"data: "):])))
+    return events
+
+
+class RunEventBufferTests(SimpleTestCase):
+    def test_resume_after_last_event_id(self):
+        buffer = _filled_buffer(5)
+        buffer.close()
+        events = _frame_events(buffer.follow(3))
+        self.assertEqual([event_id for event_id, _ in events], [4, 5])
+        self.assertEqual(events[0][1], {"type": "streaming", "message": "t4"})
+        self.assertEqual(list(buffer.follow(5)), [])
+
+    async def test_async_resume_matches_the_sync_replay(self):
+        buffer = _filled_buffer(5)
+        buffer.close()
+        frames = [frame async for frame in buffer.afollow(2)]
+        self.assertEqual(frames, list(buffer.follow(2)))
+
+    async def test_heartbeat_while_the_run_is_quiet(self):
+        buffer = _filled_buffer(1)
+        stream = buffer.afollow(1, heartbeat=0.01)
+        # One right away to flush the headers, then one per quiet interval
+        self.assertEqual(await anext(stream), HEARTBEAT_FRAME)
+        self.assertEqual(await anext(stream), HEARTBEAT_FRAME)
+
+        buffer.append({"type": "streaming", "message": "t2"})
+        frame = await anext(stream)
+        self.assertEqual(_frame_events([frame]), [(2, {"type": "streaming", "message": "t2"})])
+        buffer.close()
+        self.assertEqual([frame async for frame in stream], [])
+
+    def test_heartbeat_from_a_thread(self):
+        buffer = _filled_buffer(1)
+        stream = buffer.follow(1, heartbeat=0.01)
+        self.assertEqual([next(stream), next(stream)], [HEARTBEAT_FRAME, HEARTBEAT_FRAME])
+        buffer.close()
+        self.assertEqual(list(stream), [])
+
+    def test_evicted_events_are_reported_as_truncated(self):
+        buffer = _filled_buffer(10, max_events=4)
+        buffer.close()
+
+        events = _frame_events(buffer.follow(2))
+        self.assertEqual(events[0], (None, {"type": "replay_truncated", "first_event_id": 7}))
+        self.assertEqual([event_id for event_id, _ in events[1:]], [7, 8, 9, 10])
+
+        # A client that saw everything before the first kept event lost nothing
+        events = _frame_events(buffer.follow(6))
+        self.assertEqual([event_id for event_id, _ in events], [7, 8, 9, 10])
+
+
+class _BlockingGraph:
+    """Stands in for the supervisor: starts streaming, then never progresses"""
+
+    def __init__(self):
+        self.started = threading.Event()
+
+    def copy(self, update=None):
+        return self
+
+    async def astream(self, agent_input=None, config=None, **kwargs):
+        self.started.set()
+        await asyncio.Event().wait()
+        yield
+
+
+class RunManagerTransitionTests(SimpleTestCase):
+    def setUp(self):
+        @asynccontextmanager
+        async def lease():
+            yield InMemorySaver()
+
+        patcher = mock.patch.object(runs, "async_leased_checkpointer", lease)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _manager(self, admission=None, stall_seconds=0):
+        return runs.RunManager(
+            admission=admission or AdmissionController("test", 4, 10, 5, 1),
+            buffer_size=100,
+            retention_seconds=60,
+            detach_grace_seconds=60,
+            heartbeat_seconds=0,
+            stall_seconds=stall_seconds,
+        )
+
+    def _start(self, manager, graph, session_id="s1"):
+        run, _ = manager.start_run(
+            graph, session_id, {}, {"configurable": {"thread_id": session_id}}
+        )
+        return run
+
+    def _final_event(self, manager, run):
+        self.assertTrue(manager.wait(run, 5))
+        return _frame_events(manager.subscribe(run))[-1][1]
+
+    def test_cancel_stops_a_blocked_run(self):
+        manager, graph = self._manager(), _BlockingGraph()
+        run = self._start(manager, graph)
+        self.assertTrue(graph.started.wait(5))
+
+        self.assertTrue(manager.cancel(run.run_id))
+        self.assertEqual(self._final_event(manager, run), {"type": "cancelled", "run_id": run.run_id})
+        self.assertEqual(run.status, "cancelled")
+        self.assertEqual(manager.admission.stats()["active"], 0)
+        self.assertFalse(manager.cancel(run.run_id))
+
+    def test_watchdog_fails_a_stalled_run(self):
+        manager, graph = self._manager(stall_seconds=0.05), _BlockingGraph()
+        run = self._start(manager, graph)
+
+        event = self._final_event(manager, run)
+        self.assertEqual(event["type"], "error")
+        self.assertEqual(event["code"], "stalled")
+        self.assertEqual(run.status, "failed")
+        self.assertEqual(run.result()["error"]["code"], "stalled")
+        self.assertEqual(manager.admission.stats()["active"], 0)
+
+    def test_queued_run_is_rejected_when_its_wait_runs_out(self):
+        manager = self._manager(admission=AdmissionController("test", 1, 1, 0.5, 3))
+        blocking = _BlockingGraph()
+        running = self._start(manager, blocking, "s1")
+        self.assertTrue(blocking.started.wait(5))
+        queued = self._start(manager, _BlockingGraph(), "s2")
+        self.assertEqual(queued.status, "queued")
+
+        # The single queue place is taken: a third run is refused outright
+        with self.assertRaises(AdmissionRejected):
+            self._start(manager, _BlockingGraph(), "s3")
+
+        event = self._final_event(manager, queued)
+        self.assertEqual(event, {
+            "type": "error",
+            "code": "overloaded",
+            "message": "Server is busy, please retry shortly",
+            "retry_after": 3,
+        })
+        self.assertEqual(queued.status, "rejected")
+        self.assertEqual(running.status, "running")
+
+        manager.cancel(running.run_id)
+        self.assertTrue(manager.wait(running, 5))
+        self.assertEqual(manager.admission.stats()["active"], 0)
+
+
+def _tokens(*texts):
+    return [{"type": "streaming", "message": text} for text in texts]
+
+
+class TokenCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(coalescing.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_window_expiry_flushes(self):
+        coalescer = coalescing.TokenCoalescer(window_seconds=0.02, max_tokens=32)
+        self.assertEqual(coalescer.add(_tokens("a")[0]), [])
+        self.now += 0.01
+        self.assertEqual(coalescer.add(_tokens("b")[0]), [])
+        self.assertAlmostEqual(coalescer.time_left(), 0.01)
+
+        self.now += 0.01
+        self.assertEqual(coalescer.add(_tokens("c")[0]), _tokens("abc"))
+        self.assertIsNone(coalescer.time_left())
+
+    def test_max_tokens_flushes(self):
+        coalescer = coalescing.TokenCoalescer(window_seconds=10, max_tokens=3)
+        events = [out for event in _tokens(*"abcdefg") for out in coalescer.add(event)]
+        self.assertEqual(events, _tokens("abc", "def"))
+        self.assertEqual(coalescer.flush(), _tokens("g"))
+
+    def test_other_events_flush_and_pass_through_in_order(self):
+        coalescer = coalescing.TokenCoalescer(window_seconds=10, max_tokens=32)
+        stage = {"type": "stage", "stage": "first_token"}
+        usage = {"type": "usage", "total_tokens": 3}
+        events = []
+        for event in [stage, *_tokens("a", "b"), usage, *_tokens("c")]:
+            events.extend(coalescer.add(event))
+        events.extend(coalescer.flush())
+        self.assertEqual(events, [stage, *_tokens("ab"), usage, *_tokens("c")])
+
+    def test_disabled_coalescer_passes_tokens_through(self):
+        coalescer = coalescing.TokenCoalescer(window_seconds=0, max_tokens=32)
+        self.assertEqual(coalescer.add(_tokens("a")[0]), _tokens("a"))
+
+
+class AcoalesceTests(SimpleTestCase):
+    async def test_window_flushes_while_the_producer_waits(self):
+        resume = asyncio.Event()
+
+        async def events():
+            for event in _tokens("a", "b"):
+                yield event
+            # The model is thinking: the pending text must not wait for it
+            await resume.wait()
+            yield {"type": "usage"}
+
+        stream = coalescing.acoalesce(events(), window_seconds=0.01, max_tokens=32)
+        self.assertEqual(await anext(stream), _tokens("ab")[0])
+        resume.set()
+        self.assertEqual([event async for event in stream], [{"type": "usage"}])
+
+    async def test_producer_errors_reach_the_consumer(self):
+        async def events():
+            yield _tokens("a")[0]
+            raise RuntimeError("model failed")
+
+        with self.assertRaises(RuntimeError):
+            [event async for event in coalescing.acoalesce(events(), 0.01, 32)]
+
+
+class UsageTrackerTests(SimpleTestCase):
+    def _call(self, tracker, node, model, input_tokens, output_tokens, namespace=""):
+        run_id = uuid.uuid4()
+        tracker.on_chat_model_start(
+            {}, [],
+            run_id=run_id,
+            metadata={"langgraph_node": node, "langgraph_checkpoint_ns": namespace, "ls_model_name": model},
+        )
+        message = AIMessage(content="", usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+        tracker.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+
+    def test_totals_per_node_and_model(self):
+        tracker = UsageTracker()
+        self._call(tracker, "intent_llm", "gpt-4.1-mini", 100, 10, "intent_llm:1")
+        self._call(tracker, "model", "gpt-4.1", 1000, 200, "message_agent:2|model:3")
+        self._call(tracker, "model", "gpt-4.1", 500, 100, "message_agent:4|model:5")
+
+        event = tracker.as_event()
+        self.assertEqual((event["input_tokens"], event["output_tokens"]), (1600, 310))
+        self.assertEqual(event["total_tokens"], 1910)
+        self.assertEqual(
+            event["by_node"]["message_agent/model"],
+            {"calls": 2, "input_tokens": 1500, "output_tokens": 300},
+        )
+        self.assertEqual(event["by_node"]["intent_llm"]["calls"], 1)
+        self.assertEqual(event["by_model"]["gpt-4.1"]["calls"], 2)
+        self.assertAlmostEqual(event["by_model"]["gpt-4.1"]["cost_usd"], 0.0054)
+        self.assertAlmostEqual(event["cost_usd"], 0.0054 + 0.000056)
+        self.assertTrue(event["cost_complete"])
+        self.assertEqual(tracker.output_tokens_of("message_agent/model"), 300)
+
+    def test_unpriced_model_makes_the_cost_a_lower_bound(self):
+        tracker = UsageTracker()
+        self._call(tracker, "model", "gpt-4.1", 1000, 0)
+        self._call(tracker, "model", "some-local-model", 1000, 1000)
+        event = tracker.as_event()
+        self.assertIsNone(event["by_model"]["some-local-model"]["cost_usd"])
+        self.assertAlmostEqual(event["cost_usd"], 0.002)
+        self.assertFalse(event["cost_complete"])
+
+    def test_estimate_cost(self):
+        self.assertAlmostEqual(estimate_cost("gpt-4.1", 1_000_000, 1_000_000), 10.0)
+        # Dated snapshots take their family's price, the longest prefix wins
+        self.assertAlmostEqual(estimate_cost("gpt-4.1-2025-04-14", 1_000_000, 0), 2.0)
+        self.assertAlmostEqual(estimate_cost("gpt-4.1-mini", 1_000_000, 0), 0.4)
+        self.assertAlmostEqual(estimate_cost("gpt-4.1-mini-2025-04-14", 0, 1_000_000), 1.6)
+        self.assertIsNone(estimate_cost("gpt-4.10", 1, 1))
+        self.assertIsNone(estimate_cost("unknown", 1, 1))
+
+    @override_settings(AGENTS_MODEL_PRICING={"gpt-4.1": (1.0, 4.0), "custom": (1.0, 1.0)})
+    def test_settings_override_prices(self):
+        self.assertAlmostEqual(estimate_cost("gpt-4.1", 1_000_000, 1_000_000), 5.0)
+        self.assertAlmostEqual(estimate_cost("custom", 500_000, 500_000), 1.0)
+        self.assertAlmostEqual(estimate_cost("gpt-4o-mini", 1_000_000, 0), 0.15)
+
+
+# (id, category, embedding) of the stub portfolio
+_PORTFOLIO = [
+    ("t1", "Technical_Capability", [1.0, 0.0, 0.0]),
+    ("t2", "Technical_Capability", [0.9, 0.1, 0.0]),
+    ("t3", "Technical_Capability", [0.8, 0.0, 0.2]),
+    ("e1", "Engagement_Hiring", [0.0, 1.0, 0.0]),
+    ("d1", "Domain_Expertise", [0.0, 0.0, 1.0]),
+]
+_QUERY_VECTORS = {
+    "question": [1.0, 0.0, 0.0],
+    "variant one": [0.0, 1.0, 0.0],
+    "variant two": [0.0, 0.0, 1.0],
+    # Between technical_capability and engagement_hiring (margin ~0.036)
+    "build or hire": [1.0, 0.95, 0.0],
+}
+
+
+def _cosine_distance(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return 1.0 - float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+class _StubEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [_QUERY_VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class _StubCollection:
+    """Answers ``query`` like Chroma: cosine distance, optional category filter"""
+
+    def __init__(self):
+        self.calls = []
+
+    def query(self, query_embeddings, n_results, where=None, include=()):
+        self.calls.append((len(query_embeddings), where))
+        categories = None
+        if where:
+            category = where["category"]
+            categories = category["$in"] if isinstance(category, dict) else [category]
+        docs = [doc for doc in _PORTFOLIO if categories is None or doc[1] in categories]
+
+        results = {key: [] for key in ("ids", "documents", "metadatas", "distances", "embeddings")}
+        for query in query_embeddings:
+            hits = sorted((_cosine_distance(query, vector), doc_id, category, vector)
+                          for doc_id, category, vector in docs)[:n_results]
+            results["ids"].append([doc_id for _, doc_id, _, _ in hits])
+            results["documents"].append([f"text of {doc_id}" for _, doc_id, _, _ in hits])
+            results["metadatas"].append([{"category": category} for _, _, category, _ in hits])
+            results["distances"].append([distance for distance, _, _, _ in hits])
+            results["embeddings"].append([vector for _, _, _, vector in hits])
+        return results
+
+
+class _StubVectorstore(Chroma):
+    """Chroma without a client: the stub collection and embeddings above"""
+
+    def __init__(self):
+        self._chroma_collection = _StubCollection()
+        self._embedding_function = _StubEmbeddings()
+        self.override_relevance_score_fn = lambda distance: 1.0 - distance
+
+
+class ScoredMMRRetrieverTests(SimpleTestCase):
+    def _retriever(self, **kwargs):
+        # lambda_mult=1: plain similarity order, so rankings are easy to read
+        return supervisor.ScoredMMRRetriever(
+            vectorstore=_StubVectorstore(), k=2, lambda_mult=1.0, **kwargs
+        )
+
+    def test_filtered_search_keeps_to_the_intent(self):
+        retriever = self._retriever(where=supervisor.intent_where("technical_capability"))
+        docs = retriever.invoke("variant one")
+        self.assertEqual([doc.id for doc in docs], ["t2", "t1"])
+        self.assertEqual(retriever.vectorstore._collection.calls, [(1, {"category": "Technical_Capability"})])
+        self.assertEqual(retriever.unfiltered_fallbacks, 0)
+
+    def test_too_few_filtered_hits_fall_back_to_unfiltered(self):
+        retriever = self._retriever(where=supervisor.intent_where("engagement_hiring"))
+        docs = retriever.invoke("question")
+        self.assertEqual([doc.id for doc in docs], ["t1", "t2"])
+        self.assertEqual(
+            retriever.vectorstore._collection.calls,
+            [(1, {"category": "Engagement_Hiring"}), (1, None)],
+        )
+        self.assertEqual(retriever.unfiltered_fallbacks, 1)
+
+    def test_known_query_embedding_is_not_embedded_again(self):
+        retriever = self._retriever(query_embeddings={"question": _QUERY_VECTORS["question"]})
+        docs = retriever.invoke("question")
+        self.assertEqual([doc.id for doc in docs], ["t1", "t2"])
+        self.assertEqual(retriever.vectorstore.embeddings.calls, [])
+        self.assertAlmostEqual(retriever.scores["t1"], 1.0)
+
+
+class _FailingLLM:
+    def invoke(self, *args, **kwargs):
+        raise RuntimeError("rate limited")
+
+
+class FusionRetrieverTests(SimpleTestCase):
+    def _retriever(self, variants=None, **kwargs):
+        """``variants``: what the rewrite LLM answers"""
+        if variants is not None:
+            kwargs["llm"] = GenericFakeChatModel(messages=iter([AIMessage(content=variants)]))
+        return supervisor.FusionRetriever(
+            vectorstore=_StubVectorstore(), **{"k": 2, "lambda_mult": 1.0, **kwargs}
+        )
+
+    def test_reciprocal_rank_fusion(self):
+        a, b, c = (Document(id=doc_id, page_content=doc_id) for doc_id in "abc")
+        fused = supervisor.reciprocal_rank_fusion([[a, b, c], [b, c], [c]])
+        self.assertEqual([doc.id for doc in fused], ["c", "b", "a"])
+        # Equal scores keep first-seen order; a document appears once
+        fused = supervisor.reciprocal_rank_fusion([[a, b], [b, a]])
+        self.assertEqual([doc.id for doc in fused], ["a", "b"])
+
+    def test_variants_are_embedded_and_searched_in_one_batch(self):
+        retriever = self._retriever("1. variant one\n- variant two\nquestion\nvariant one")
+        docs = retriever.invoke("question")
+
+        self.assertEqual(retriever.vectorstore.embeddings.calls, [["question", "variant one", "variant two"]])
+        self.assertEqual(retriever.vectorstore._collection.calls, [(3, None)])
+        self.assertEqual(set(retriever.timings), {"variants_ms", "embed_ms", "search_ms", "fuse_ms"})
+        # t2 is second for both the question and "variant one": fusion puts
+        # it above t1, the question's own best hit
+        self.assertEqual([doc.id for doc in docs], ["t2", "t1"])
+
+    def test_documents_found_by_several_queries_appear_once(self):
+        retriever = self._retriever("variant one\nvariant two", k=5)
+        docs = retriever.invoke("question")
+        ids = [doc.id for doc in docs]
+        self.assertEqual(sorted(ids), ["d1", "e1", "t1", "t2", "t3"])
+        # Each document keeps its best score over the queries
+        self.assertAlmostEqual(retriever.scores["e1"], 1.0)
+        self.assertAlmostEqual(retriever.scores["t1"], 1.0)
+
+    def test_each_short_filtered_query_falls_back(self):
+        retriever = self._retriever(
+            "variant one\nvariant two", where=supervisor.intent_where("engagement_hiring")
+        )
+        docs = retriever.invoke("question")
+        self.assertEqual(
+            retriever.vectorstore._collection.calls,
+            [(3, {"category": "Engagement_Hiring"}), (3, None)],
+        )
+        self.assertEqual(retriever.unfiltered_fallbacks, 3)
+        self.assertEqual([doc.id for doc in docs], ["t2", "t1"])
+
+    def test_question_alone_when_variants_fail(self):
+        retriever = self._retriever(llm=_FailingLLM())
+        docs = retriever.invoke("question")
+        self.assertEqual(retriever.vectorstore.embeddings.calls, [["question"]])
+        self.assertEqual([doc.id for doc in docs], ["t1", "t2"])
+
+
+_CENTROIDS = {
+    "technical_capability": [1.0, 0.0, 0.0],
+    "engagement_hiring": [0.0, 1.0, 0.0],
+    "domain_expertise": [0.0, 0.0, 1.0],
+}
+
+
+class CentroidIntentClassifierTests(SimpleTestCase):
+    def test_centroids_are_built_from_examples_in_one_call(self):
+        embeddings = _StubEmbeddings()
+        classifier = CentroidIntentClassifier.from_examples(embeddings, {
+            "technical_capability": ("question", "build or hire"),
+            "engagement_hiring": ("variant one",),
+        })
+        self.assertEqual(embeddings.calls, [["question", "build or hire", "variant one"]])
+        self.assertEqual(classifier.intents, ["technical_capability", "engagement_hiring"])
+        self.assertEqual(classifier.predict([3.0, 0.1, 0.0]).intent, "technical_capability")
+        self.assertEqual(classifier.predict([0.0, 2.0, 0.0]).intent, "engagement_hiring")
+
+    def test_confidence_and_margin(self):
+        classifier = CentroidIntentClassifier(_CENTROIDS)
+        clear = classifier.predict(_QUERY_VECTORS["question"])
+        self.assertEqual((clear.intent, clear.confidence, clear.margin), ("technical_capability", 1.0, 1.0))
+
+        close = classifier.predict(_QUERY_VECTORS["build or hire"])
+        self.assertEqual(close.intent, "technical_capability")
+        self.assertAlmostEqual(close.confidence, 0.725, places=3)
+        self.assertAlmostEqual(close.margin, 0.036, places=3)
+
+
+class _RouteLLM:
+    """Structured-output chat model that always answers ``intent``"""
+
+    def __init__(self, intent, delay=0.0):
+        self.intent = intent
+        self.delay = delay
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    def invoke(self, messages, config=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        return supervisor.RouteQuery(intent=self.intent, confidence=0.9)
+
+
+class _AnswerAgent:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, state, context=None):
+        self.calls += 1
+        return {"messages": [AIMessage(content="answer")]}
+
+
+@override_settings(AGENTS_RAG_QUERY_VARIANTS=0)
+class IntentRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.vectorstore = _StubVectorstore()
+        classifier = CentroidIntentClassifier(_CENTROIDS)
+        for patcher in (
+            mock.patch.object(supervisor, "get_vectorstore", lambda: self.vectorstore),
+            mock.patch.object(supervisor, "get_intent_classifier", lambda embeddings: classifier),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _classify(self, message, llm_intent="engagement_hiring"):
+        """The intent_classified stage events of one run, and the LLM"""
+        llm = _RouteLLM(llm_intent)
+        graph = supervisor.create_supervisor_agent(llm, _AnswerAgent(), None)
+        events = graph.stream(
+            {"messages": [HumanMessage(content=message)], "user_message": message},
+            stream_mode="custom",
+        )
+        classified = [e for e in events if e.get("stage") == "intent_classified"]
+        return classified, llm
+
+    def test_clear_margin_is_decided_locally(self):
+        classified, llm = self._classify("question")
+        self.assertEqual([(e["intent"], e["source"]) for e in classified], [("technical_capability", "embedding")])
+        self.assertEqual(llm.calls, 0)
+
+    def test_narrow_margin_falls_back_to_the_llm(self):
+        classified, llm = self._classify("build or hire")
+        self.assertEqual([(e["intent"], e["source"]) for e in classified], [("engagement_hiring", "llm")])
+        self.assertEqual(llm.calls, 1)
+
+    def test_threshold_setting_moves_the_decision(self):
+        with override_settings(AGENTS_INTENT_MARGIN_THRESHOLD=0.03):
+            classified, llm = self._classify("build or hire")
+        self.assertEqual([e["source"] for e in classified], ["embedding"])
+        self.assertEqual(llm.calls, 0)
+
+        with override_settings(AGENTS_INTENT_MARGIN_THRESHOLD=1.01):
+            classified, llm = self._classify("question")
+        self.assertEqual([e["source"] for e in classified], ["llm"])
+        self.assertEqual(llm.calls, 1)
+
+    def test_router_runs_once_on_every_path(self):
+        # A slow LLM finishes long after retrieval when the intent is undecided
+        for message in ("question", "build or hire"):
+            llm = _RouteLLM("engagement_hiring", delay=0.05)
+            graph = supervisor.create_supervisor_agent(llm, _AnswerAgent(), None)
+            updates = graph.stream(
+                {"messages": [HumanMessage(content=message)], "user_message": message},
+                stream_mode="updates",
+            )
+            nodes = [node for update in updates for node in update]
+            self.assertEqual(nodes.count("router"), 1, message)
+            self.assertEqual(nodes.count("message_agent"), 1, message)
+
+    def test_failed_embedding_falls_back_to_the_llm(self):
+        classified, llm = self._classify("not embeddable")
+        self.assertEqual([(e["intent"], e["source"]) for e in classified], [("engagement_hiring", "llm")])
+        self.assertEqual(llm.calls, 1)
+
+
+class _CancellingLLM:
+    """Cancels the run, then calls a chat model: the model start raises"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.model = GenericFakeChatModel(messages=itertools.cycle([AIMessage(content="reply")]))
+
+    def invoke(self, prompt, config=None):
+        self.handler.cancel()
+        return self.model.invoke(prompt, config=config)
+
+
+class _CancellingAgent(_AnswerAgent):
+    def __init__(self, handler):
+        super().__init__()
+        self.llm = _CancellingLLM(handler)
+
+    def invoke(self, state, context=None):
+        self.llm.invoke(state["messages"])
+        return super().invoke(state, context)
+
+
+@override_settings(AGENTS_RAG_QUERY_VARIANTS=1)
+class NodeCancellationTests(SimpleTestCase):
+    """A cancelled run stops inside the node instead of being handled as an error"""
+
+    def setUp(self):
+        self.handler = CancellationHandler()
+        self.vectorstore = _StubVectorstore()
+        self.classifier = CentroidIntentClassifier(_CENTROIDS)
+        self.retrieval_llm = GenericFakeChatModel(messages=itertools.cycle([AIMessage(content="variant one")]))
+        for patcher in (
+            mock.patch.object(supervisor, "get_vectorstore", lambda: self.vectorstore),
+            mock.patch.object(supervisor, "get_intent_classifier", lambda embeddings: self.classifier),
+            mock.patch.object(supervisor, "get_retrieval_llm", lambda: self.retrieval_llm),
+            mock.patch.object(supervisor, "get_small_talk_llm", lambda: _CancellingLLM(self.handler)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _run_until_cancelled(self, message_agent, message="question"):
+        """Every (mode, chunk) streamed before the run raised RunCancelled"""
+        graph = supervisor.create_supervisor_agent(_RouteLLM("engagement_hiring"), message_agent, None)
+        seen = []
+        with self.assertRaises(RunCancelled):
+            for item in graph.stream(
+                {"messages": [HumanMessage(content=message)], "user_message": message},
+                {"callbacks": [self.handler]},
+                stream_mode=["custom", "updates"],
+            ):
+                seen.append(item)
+        return seen
+
+    def _stages(self, seen):
+        return [chunk["stage"] for mode, chunk in seen if mode == "custom" and chunk["type"] == "stage"]
+
+    def _updated_nodes(self, seen):
+        return [node for mode, chunk in seen if mode == "updates" for node in chunk]
+
+    def test_cancelled_query_variants_stop_retrieval(self):
+        self.retrieval_llm = _CancellingLLM(self.handler)
+        agent = _AnswerAgent()
+        seen = self._run_until_cancelled(agent)
+
+        self.assertIn("retrieval_started", self._stages(seen))
+        self.assertNotIn("retrieval_finished", self._stages(seen))
+        # Only the question was embedded (by embed_query); nothing was searched
+        self.assertEqual(self.vectorstore.embeddings.calls, [["question"]])
+        self.assertEqual(self.vectorstore._collection.calls, [])
+        self.assertNotIn("rag_executor", self._updated_nodes(seen))
+        self.assertEqual(agent.calls, 0)
+
+    def test_cancelled_generation_is_not_turned_into_an_answer(self):
+        seen = self._run_until_cancelled(_CancellingAgent(self.handler))
+        self.assertEqual(self._updated_nodes(seen), ["embed_query", "intent_classifier", "rag_executor", "router"])
+        self.assertNotIn("message_agent", self._updated_nodes(seen))
+
+    def test_cancelled_small_talk_is_not_turned_into_an_answer(self):
+        self.classifier = CentroidIntentClassifier({
+            "general_chat": [1.0, 0.0, 0.0],
+            "engagement_hiring": [0.0, 1.0, 0.0],
+        })
+        seen = self._run_until_cancelled(_AnswerAgent())
+        self.assertIn("generation_started", self._stages(seen))
+        self.assertEqual(self._updated_nodes(seen), ["embed_query", "intent_classifier"])
+
+
+def _step(node, message, subgraph=None):
+    """One ``(namespace, "messages", (message, metadata))`` step"""
+    namespace = (f"{subgraph}:0a1b",) if subgraph else ()
+    return namespace, "messages", (message, {"langgraph_node": node})
+
+
+class AnswerStreamFilterTests(SimpleTestCase):
+    def setUp(self):
+        self.filter = AnswerStreamFilter(UsageTracker())
+
+    def _events(self, *steps):
+        return [event for step in steps for event in self.filter.events(step)]
+
+    def _streamed(self, events):
+        return [event["message"] for event in events if event["type"] == "streaming"]
+
+    def test_internal_chunks_are_dropped_and_counted(self):
+        events = self._events(
+            _step("intent_llm", AIMessageChunk(content='{"intent": "business_trust"}')),
+            _step("rag_executor", AIMessageChunk(content="variant one")),
+            _step("rag_executor", AIMessageChunk(content="variant two")),
+            _step("rewrite", AIMessageChunk(content="rewritten question"), subgraph="message_agent"),
+        )
+        self.assertEqual(events, [])
+        self.assertEqual(
+            self.filter.dropped,
+            {"intent_llm": 1, "rag_executor": 2, "message_agent/rewrite": 1},
+        )
+        self.assertFalse(self.filter.streamed_answer)
+
+    def test_answer_model_tokens_stream_after_a_first_token_stage(self):
+        events = self._events(
+            _step("model", AIMessageChunk(content="Hel"), subgraph="message_agent"),
+            _step("model", AIMessageChunk(content="lo"), subgraph="message_agent"),
+        )
+        self.assertEqual([event["type"] for event in events], ["stage", "streaming", "streaming"])
+        self.assertEqual(events[0]["stage"], "first_token")
+        self.assertEqual(self._streamed(events), ["Hel", "lo"])
+        self.assertEqual(self.filter.answer_chunks, 2)
+
+    def test_supervisor_copy_of_a_streamed_answer_is_suppressed(self):
+        events = self._events(
+            _step("model", AIMessageChunk(content="Hello"), subgraph="message_agent"),
+            _step("message_agent", AIMessage(content="Hello")),
+        )
+        self.assertEqual(self._streamed(events), ["Hello"])
+
+    def test_answer_is_sent_whole_when_nothing_streamed(self):
+        events = self._events(_step("message_agent", AIMessage(content="Whole answer")))
+        self.assertEqual([event["type"] for event in events], ["stage", "streaming"])
+        self.assertEqual(self._streamed(events), ["Whole answer"])
+
+    def test_small_talk_streams_once(self):
+        events = self._events(
+            _step("small_talk", AIMessageChunk(content="Hi")),
+            _step("small_talk", AIMessageChunk(content=" there")),
+            _step("small_talk", AIMessage(content="Hi there")),
+        )
+        self.assertEqual(self._streamed(events), ["Hi", " there"])
+        self.assertEqual(self.filter.dropped, {})
+
+    def test_tool_call_chunks_are_dropped(self):
+        tool_call = AIMessageChunk(
+            content="Looking that up",
+            tool_call_chunks=[{"name": "search", "args": "{}", "id": "call-1", "index": 0}],
+        )
+        events = self._events(
+            _step("model", tool_call, subgraph="message_agent"),
+            _step("model", AIMessageChunk(content="Found it"), subgraph="message_agent"),
+        )
+        self.assertEqual(self._streamed(events), ["Found it"])
+        self.assertEqual(self.filter.answer_chunks, 1)
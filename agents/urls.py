@@ -7,7 +7,18 @@ urlpatterns = [
     # page
     path("", views.index, name="home"),
     path("start-chat", views.chatbot_view, name="chat"),
-    path("api/chat", views.chat_asistance, name="chat-stream")
+    path("api/chat", views.chat_asistance, name="chat-stream"),
+    path("api/chat/async", views.chat_asistance_async, name="chat-stream-async"),
+    path("api/chat/json", views.chat_json, name="chat-json"),
+    path("api/chat/batch", views.chat_batch, name="chat-batch"),
+    path("api/chat/runs", views.chat_runs, name="chat-runs"),
+    path("api/chat/runs/<str:run_id>", views.chat_run_status, name="chat-run-status"),
+    path("api/chat/runs/<str:run_id>/events", views.chat_run_events, name="chat-run-events"),
+    path("api/chat/runs/<str:run_id>/cancel", views.chat_run_cancel, name="chat-run-cancel"),
+    path("api/chat/async/runs/<str:run_id>/events", views.chat_run_events_async, name="chat-run-events-async"),
+    path("api/metrics", views.metrics_view, name="metrics"),
+    path("api/health", views.health_view, name="health"),
+    path("api/ready", views.ready_view, name="ready"),
 
 ]
 
@@ -1,118 +1,463 @@
 import os
 import json
+import hashlib
+import time
 import traceback
-from psycopg_pool import ConnectionPool
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
-from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.postgres import PostgresSaver
-from .helpers.stream_helper import stream_generator
+from .helpers import metrics
+from .helpers.admission import AdmissionRejected, overloaded_response
+from .helpers.chat_models import UnknownChatModel, chat_models, default_chat_model, resolve_chat_model
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
-from langchain.agents import AgentState
+from django.views.decorators.http import require_GET, require_POST
 from django.http import HttpRequest, JsonResponse,StreamingHttpResponse
-from langchain_core.messages import HumanMessage
+from django.urls import reverse
 
-from .services.message_agent import create_message_agent
-from .services.email_agent import create_email_agent
-from .services.supervisor import create_supervisor_agent
+# The agent stack (langchain, langgraph, OpenAI, Chroma, psycopg) is imported
+# inside the views that need it, so importing this module (URL loading,
+# manage.py commands, worker boot) stays cheap. Checkpoint tables are
+# created by `manage.py setup_checkpointer`, not at import.
 
-# Initialize langchain short memory
-if os.getenv("ENV_TYPE") == 'localhost':
-    DB_URI = os.getenv("POSTGRES_URL")
-else:
-    DB_URI = os.getenv("POSTGRES_URL_PROD")
 
-# Initialize connection pool
-connection_pool = ConnectionPool(DB_URI, min_size=1, max_size=5)
+def index(request: HttpRequest):
+    """Render home page"""
+    return render(request, "index.html")
 
-def init_checkpointer():
-    with connection_pool.connection() as conn:
-        conn.autocommit = True
-        checkpointer = PostgresSaver(conn)
-        checkpointer.setup()
-        print("INIT CHECKPOINTER #####")
 
+def chatbot_view(request: HttpRequest):
+    """Render chatbot page"""
+    return render(request, "chat.html", {
+        "chat_models": list(chat_models()),
+        "default_model": default_chat_model(),
+    })
 
-# Call once at startup
-try:
-    init_checkpointer()
-except Exception as e:
-    print(f"⚠ Warning during checkpointer init: {e}")
-    # Don't crash the app - tables might already exist
 
+def _run_manager():
+    """Process-wide run manager; imports the agent stack on first use"""
+    from .services.runs import get_run_manager
 
+    return get_run_manager()
 
 
-# LOAD ENV VARIABLE
-load_dotenv()
+def _sse_response(stream, run) -> StreamingHttpResponse:
+    """Wrap a run subscription in an SSE response"""
+    response = StreamingHttpResponse(
+        stream,
+        content_type="text/event-stream",
+        charset="utf-8",
+    )
+    # No caching, no compression or buffering by proxies (nginx honours
+    # X-Accel-Buffering); heartbeats keep idle timeouts from firing
+    response['Cache-Control'] = 'no-cache, no-transform'
+    response['X-Accel-Buffering'] = 'no'
+    response['X-Run-Id'] = run.run_id
+    heartbeat = _run_manager().heartbeat_seconds
+    if heartbeat:
+        # Lets the client treat a longer silence as a stalled connection
+        response['X-Heartbeat-Interval'] = str(heartbeat)
+    return response
 
-class CustomAgentState(AgentState):
-    """Custom state with messages + custom fields"""
-    categories: list = []
-    context_snippets: list = []
-    base64_string: str = ""
-    file_name: str | None = None
 
-def index(request: HttpRequest):
-    """Render home page"""
-    return render(request, "index.html")
+def _last_event_id(request: HttpRequest) -> int:
+    """Resume point from the Last-Event-ID header (or ?last_event_id=)"""
+    raw = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id") or 0
+    try:
+        return max(0, int(raw))
+    except (TypeError, ValueError):
+        return 0
 
 
-def chatbot_view(request: HttpRequest):
-    """Render chatbot page"""
-    return render(request, "chat.html")
+def _chat_request(data):
+    """
+    (session_id, agent_input, config, model_name) from request fields.
+
+    Raises:
+        ValueError: A required field is missing or not a string, or the
+            model is not allowed
+    """
+    from langchain_core.messages import HumanMessage
+
+    session_id = data.get("session_id")
+    user_message = data.get("user_message")
+
+    if not session_id:
+        raise ValueError("session_id is required")
+    if not isinstance(session_id, str):
+        raise ValueError("session_id must be a string")
+    if not user_message:
+        raise ValueError("user_message is required")
+    if not isinstance(user_message, str):
+        raise ValueError("user_message must be a string")
+    _, model_name = resolve_chat_model(data.get("model"))
+
+    config = {"configurable": {"thread_id": session_id}}
+
+    agent_input = {
+        "messages": [HumanMessage(content=user_message)],
+        "user_message": user_message
+    }
+    return session_id, agent_input, config, model_name
+
+
+def _parse_chat_request(data):
+    """Return (session_id, agent_input, config, model_name) or a 400 JsonResponse"""
+    try:
+        return _chat_request(data)
+    except UnknownChatModel as e:
+        return JsonResponse({"error": str(e), "models": list(chat_models())}, status=400)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+def _request_data(request: HttpRequest):
+    """Fields of a JSON body, or of a form POST"""
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            raise ValueError("Request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise ValueError("Request body must be a JSON object")
+        return data
+    return request.POST
+
+
+def _idempotency(request: HttpRequest, data=None):
+    """(key, fingerprint) from the Idempotency-Key header or idempotency_key field"""
+    data = request.POST if data is None else data
+    key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+    if not key:
+        return None, None
+    user_message = data.get("user_message") or ""
+    # Same key with another model is a different request too
+    model = data.get("model") or default_chat_model()
+    return key, hashlib.sha256(f"{model}\n{user_message}".encode("utf-8")).hexdigest()
+
+
+def _start_run(parsed, idempotency_key=None, fingerprint=None):
+    """Start (or re-attach to) the run for a parsed chat request -> (run, created)"""
+    from .services.graph_registry import get_supervisor_graph
+
+    session_id, agent_input, config, model_name = parsed
+    return _run_manager().start_run(
+        # One compiled graph per allowed model, cached by the registry
+        graph=get_supervisor_graph(model_name=model_name),
+        model=model_name,
+        session_id=session_id,
+        agent_input=agent_input,
+        config=config,
+        idempotency_key=idempotency_key,
+        fingerprint=fingerprint,
+    )
+
+
+def _run_created_response(
+    request: HttpRequest, run, events_route: str, created: bool = True
+) -> JsonResponse:
+    """202 with the run id and where to follow / poll it (200 for a repeat)"""
+    return JsonResponse(
+        {
+            "run_id": run.run_id,
+            "status": run.status,
+            "events_url": request.build_absolute_uri(reverse(events_route, args=[run.run_id])),
+            "status_url": request.build_absolute_uri(reverse("chat-run-status", args=[run.run_id])),
+            "duplicate": not created,
+        },
+        status=202 if created else 200,
+    )
+
+
+def _start_chat_run(request: HttpRequest, events_route: str) -> JsonResponse:
+    """Parse a chat POST, start (or re-attach to) its run and describe it"""
+    from .services.runs import IdempotencyConflict
+
+    parsed = _parse_chat_request(request.POST)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    idempotency_key, fingerprint = _idempotency(request)
+
+    try:
+        run, created = _start_run(parsed, idempotency_key, fingerprint)
+    except AdmissionRejected as e:
+        # Every worker is busy and the queue is full
+        return overloaded_response(e)
+    except IdempotencyConflict as e:
+        return JsonResponse({"error": str(e)}, status=422)
+    except Exception as e:
+        print(f"Error in agent: {e}")
+        error_detail = traceback.format_exc()
+        return JsonResponse(
+            {"error": str(e), "detail": error_detail}, 
+            status=400
+        )
+    return _run_created_response(request, run, events_route, created)
+
+
+def _run_to_completion(run, timeout: float) -> dict:
+    """Wait for a run and return its result; cancels it on timeout"""
+    manager = _run_manager()
+    if not manager.wait(run, timeout):
+        manager.cancel(run.run_id)
+        result = run.result()
+        result["status"] = "timeout"
+        result["error"] = {"code": "timeout", "message": f"No answer within {timeout:g}s"}
+        return result
+    return run.result()
 
 
 @csrf_exempt
 @require_POST
 def chat_asistance(request: HttpRequest):
-    """Handle chat with dual output: JSON structure + formatted response."""
-    
-    # ---- Parse request ----
-    session_id = request.POST.get("session_id")
-    user_message = request.POST.get("user_message")
+    """
+    Start a chat run in the background and return its id.
+
+    The run executes on the run executor's bounded worker pool and owns the
+    pooled connection until it finishes; clients follow it separately via
+    ``events_url`` (SSE) or poll ``status_url``, so no request worker is
+    held while the model generates.
+
+    A retried POST with the same ``Idempotency-Key`` gets the original run
+    (200, ``duplicate: true``): live runs can be followed, finished ones
+    replay their buffered events.
+    """
+    return _start_chat_run(request, "chat-run-events")
+
+
+@csrf_exempt
+@require_POST
+async def chat_asistance_async(request: HttpRequest):
+    """
+    Async variant of chat_asistance for ASGI deployments.
+
+    Starting a run imports the agent stack and compiles the graph on first
+    use, so it runs on a worker thread rather than the event loop; the
+    returned ``events_url`` is the async events endpoint.
+    """
+    return await sync_to_async(_start_chat_run)(request, "chat-run-events-async")
+
+
+# HTTP status of a non-streaming answer by run status
+JSON_RESULT_STATUS = {"completed": 200, "rejected": 503, "timeout": 504}
 
+
+def _json_timeout() -> float:
+    return getattr(settings, "AGENTS_CHAT_JSON_TIMEOUT_SECONDS", 120)
+
+
+@csrf_exempt
+@require_POST
+def chat_json(request: HttpRequest):
+    """
+    Request/response chat: run one turn and return the whole answer.
+
+    Takes the same fields as ``chat_asistance`` (form or JSON body) and
+    answers with ``{answer, sources, usage, status, error}`` once the run
+    finishes. The run goes through the same worker pool, admission control
+    and checkpointed session as streamed chats; a run that takes longer
+    than AGENTS_CHAT_JSON_TIMEOUT_SECONDS is cancelled (504).
+    """
+    from .services.runs import IdempotencyConflict
+
+    try:
+        data = _request_data(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    parsed = _parse_chat_request(data)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    idempotency_key, fingerprint = _idempotency(request, data)
+
+    try:
+        run, _ = _start_run(parsed, idempotency_key, fingerprint)
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    except IdempotencyConflict as e:
+        return JsonResponse({"error": str(e)}, status=422)
+    except Exception as e:
+        print(f"Error in agent: {e}")
+        return JsonResponse({"error": str(e)}, status=400)
+
+    result = _run_to_completion(run, _json_timeout())
+    response = JsonResponse(result, status=JSON_RESULT_STATUS.get(result["status"], 502))
+    if result["status"] == "rejected" and result["error"]:
+        response["Retry-After"] = str(result["error"].get("retry_after", ""))
+    return response
+
+
+def _batch_item(index: int, item, timeout: float) -> dict:
+    """Run one batch item to completion; failures become part of its result"""
+    started = time.monotonic()
+    try:
+        if not isinstance(item, dict):
+            raise ValueError("Each item must be an object")
+        run, _ = _start_run(_chat_request(item))
+        result = _run_to_completion(run, timeout)
+    except AdmissionRejected as e:
+        result = {
+            "status": "rejected",
+            "error": {"code": "overloaded", "message": str(e), "retry_after": e.retry_after},
+        }
+    except ValueError as e:
+        result = {"status": "invalid", "error": {"code": "bad_request", "message": str(e)}}
+    except Exception as e:
+        print(f"[BATCH] Item {index} failed: {e}")
+        result = {"status": "failed", "error": {"code": "error", "message": str(e)}}
+
+    result.update(
+        index=index,
+        ok=result["status"] == "completed",
+        latency_ms=round((time.monotonic() - started) * 1000, 1),
+    )
+    return result
+
+
+@csrf_exempt
+@require_POST
+def chat_batch(request: HttpRequest):
+    """
+    Answer many chat messages in one request (JSON body).
+
+    Body: ``{"items": [{"session_id", "user_message", "model"?}, ...],
+    "parallelism": n}``. Items run concurrently, at most ``parallelism``
+    at a time (capped by AGENTS_CHAT_BATCH_MAX_PARALLEL); items of the same
+    session run one after another, in order, so each sees the previous
+    turn. Every item gets its own result with ``ok``, ``latency_ms`` and
+    ``error``; one failing item never fails the batch.
+    """
+    try:
+        data = _request_data(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    items = data.get("items")
+    max_items = getattr(settings, "AGENTS_CHAT_BATCH_MAX_ITEMS", 100)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "items must be a non-empty list"}, status=400)
+    if len(items) > max_items:
+        return JsonResponse({"error": f"At most {max_items} items per batch"}, status=400)
+
+    max_parallel = getattr(settings, "AGENTS_CHAT_BATCH_MAX_PARALLEL", 4)
+    try:
+        parallelism = int(data.get("parallelism") or max_parallel)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "parallelism must be an integer"}, status=400)
+    parallelism = max(1, min(parallelism, max_parallel))
+
+    # Items of one session share a checkpoint thread: keep them sequential
+    groups: Dict[Any, List[int]] = {}
+    for index, item in enumerate(items):
+        session_id = item.get("session_id") if isinstance(item, dict) else None
+        # A malformed session_id (list, object...) runs alone and comes back invalid
+        if not isinstance(session_id, str) or not session_id:
+            session_id = ("item", index)
+        groups.setdefault(session_id, []).append(index)
+
+    timeout = _json_timeout()
+    results: List[Optional[dict]] = [None] * len(items)
+
+    def run_group(indexes: List[int]) -> None:
+        for index in indexes:
+            results[index] = _batch_item(index, items[index], timeout)
+
+    started = time.monotonic()
+    workers = min(parallelism, len(groups))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-batch") as pool:
+        list(pool.map(run_group, groups.values()))
+
+    succeeded = sum(1 for result in results if result["ok"])
+    metrics.inc("agents_batch_items_total", succeeded, outcome="ok")
+    metrics.inc("agents_batch_items_total", len(results) - succeeded, outcome="failed")
+    return JsonResponse({
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "parallelism": workers,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    })
+
+
+@require_GET
+def chat_runs(request: HttpRequest):
+    """
+    List a session's runs, newest first (``?active=1`` for unfinished only).
+
+    A second tab of the same session uses this to find and follow the run
+    that is already in flight instead of starting a duplicate.
+    """
+    session_id = request.GET.get("session_id")
     if not session_id:
         return JsonResponse({"error": "session_id is required"}, status=400)
+    active_only = request.GET.get("active") in ("1", "true")
+    runs = _run_manager().list_runs(session_id, active_only=active_only)
+    return JsonResponse({"runs": [run.as_dict() for run in runs]})
 
-    config = {"configurable": {"thread_id": session_id}}
 
-    # ---- Create model ----
-    model = ChatOpenAI(model="gpt-4.1", temperature=0.1)
+@require_GET
+def chat_run_status(request: HttpRequest, run_id: str):
+    """Poll a run's status; polling keeps an unsubscribed run alive"""
+    manager = _run_manager()
+    run = manager.get_run(run_id)
+    if run is None:
+        return JsonResponse({"error": "Unknown or expired run"}, status=404)
+    manager.touch(run)
+    return JsonResponse(run.as_dict())
 
-    
-    # Create agent with checkpointer
-    with connection_pool.connection() as conn:
-        checkpointer = PostgresSaver(conn)
-        # Create specialist agents
-        message_agent = create_message_agent(model, checkpointer)
-        # email_agent = create_email_agent(model, checkpointer)
 
-        # Create supervisor
-        supervisor_agent = create_supervisor_agent(model, message_agent, checkpointer)
+@require_GET
+def chat_run_events(request: HttpRequest, run_id: str):
+    """
+    Follow a run's event stream (SSE).
 
-        agent_input = {
-            "messages": [HumanMessage(content=user_message)],
-            "user_message": user_message
-        }
-        
-        try:
-            response = StreamingHttpResponse(
-                stream_generator(
-                    agent=supervisor_agent,
-                    agent_input=agent_input,
-                    config=config,
-                ),
-                content_type="text/event-stream",
-                charset="utf-8",
-            )
-            response['Cache-Control'] = 'no-cache'
-            return response
-        except Exception as e:
-            print(f"Error in agent: {e}")
-            error_detail = traceback.format_exc()
-            return JsonResponse(
-                {"error": str(e), "detail": error_detail}, 
-                status=400
-            )
\ No newline at end of file
+    Replays every event after ``Last-Event-ID`` from the run buffer and then
+    follows the live run, so reconnecting repeats no LLM calls and any
+    number of tabs can watch the same run.
+    """
+    run = _run_manager().get_run(run_id)
+    if run is None:
+        return JsonResponse({"error": "Unknown or expired run"}, status=404)
+    return _sse_response(_run_manager().subscribe(run, _last_event_id(request)), run)
+
+
+@require_GET
+async def chat_run_events_async(request: HttpRequest, run_id: str):
+    """Async variant of chat_run_events for ASGI deployments"""
+    run = _run_manager().get_run(run_id)
+    if run is None:
+        return JsonResponse({"error": "Unknown or expired run"}, status=404)
+    return _sse_response(_run_manager().asubscribe(run, _last_event_id(request)), run)
+
+
+@csrf_exempt
+@require_POST
+def chat_run_cancel(request: HttpRequest, run_id: str):
+    """Stop a run now (the browser's Stop button) instead of after the detach grace period"""
+    manager = _run_manager()
+    run = manager.get_run(run_id)
+    if run is None:
+        return JsonResponse({"error": "Unknown or expired run"}, status=404)
+    cancelled = manager.cancel(run_id)
+    return JsonResponse({"run_id": run_id, "cancelled": cancelled, "status": run.status})
+
+
+@require_GET
+def metrics_view(request: HttpRequest):
+    """Per-process counters, gauges, timers and connection pool stats"""
+    return JsonResponse(metrics.snapshot())
+
+
+@require_GET
+def health_view(request: HttpRequest):
+    """Liveness: the process is up and serving requests"""
+    return JsonResponse({"status": "ok"})
+
+
+@require_GET
+def ready_view(request: HttpRequest):
+    """Readiness: 503 until the (opt-in) startup warm-up has finished, or if it failed"""
+    from .services.warmup import readiness
+
+    state = readiness()
+    return JsonResponse(state, status=200 if state["ready"] else 503)
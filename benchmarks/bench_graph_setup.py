@@ -0,0 +1,82 @@
+"""
+Per-request graph setup cost: build-per-request vs. the process-wide registry.
+
+Usage:
+    python -m benchmarks.bench_graph_setup [--iterations 50]
+
+No network calls are made; ChatOpenAI only needs an API key to be set.
+"""
+import argparse
+import os
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agents.services.graph_registry import (
+    bind_checkpointer,
+    build_supervisor_graph,
+    clear_graph_registry,
+    get_supervisor_graph,
+)
+
+
+def per_request_build():
+    """What chat_asistance used to do on every POST."""
+    graph = build_supervisor_graph()
+    return bind_checkpointer(graph, InMemorySaver())
+
+
+def per_request_registry():
+    """What chat_asistance does now."""
+    return bind_checkpointer(get_supervisor_graph(), InMemorySaver())
+
+
+def measure(fn, iterations: int) -> dict:
+    timings = []
+    tracemalloc.start()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "peak_kib": peak / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    # Warm imports so neither side pays for them
+    clear_graph_registry()
+    per_request_build()
+
+    before = measure(per_request_build, args.iterations)
+
+    clear_graph_registry()
+    get_supervisor_graph()  # first-use build happens once per process
+    after = measure(per_request_registry, args.iterations)
+
+    print(f"{'setup':<22}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak KiB':>12}")
+    for label, row in (("build per request", before), ("registry + bind", after)):
+        print(
+            f"{label:<22}{row['mean_ms']:>10.3f}{row['p50_ms']:>10.3f}"
+            f"{row['p95_ms']:>10.3f}{row['peak_kib']:>12.1f}"
+        )
+    print(f"speedup: {before['mean_ms'] / after['mean_ms']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Worker cold-start import cost, measured with ``python -X importtime``.
+
+Each sample is a fresh interpreter that runs ``django.setup()`` and imports
+the target modules, i.e. what a worker pays at boot before its first
+request. ``agents.urls`` is what URL loading imports; ``agents.services.runs``
+and ``agents.services.graph_registry`` are the agent stack the first chat
+request loads.
+
+Usage:
+    python -m benchmarks.bench_import_time [--iterations 5] [--top 15]
+        [--module agents.urls --module agents.services.runs ...]
+
+No database or network access is needed.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_TARGETS = (
+    "agents.urls",
+    "agents.services.runs",
+    "agents.services.graph_registry",
+)
+
+
+def run_importtime(module: str) -> tuple:
+    """One cold interpreter; returns (wall seconds, parsed importtime rows)"""
+    code = (
+        "import django; django.setup(); "
+        f"import importlib; importlib.import_module({module!r})"
+    )
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "service_advisor.settings",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-benchmark"),
+    }
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return wall, parse_importtime(result.stderr)
+
+
+def parse_importtime(stderr: str) -> list:
+    """Rows of (self_us, cumulative_us, module) from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return rows
+
+
+def top_level_packages(rows: list) -> dict:
+    """Self time summed per top-level package"""
+    totals = defaultdict(int)
+    for self_us, _, name in rows:
+        totals[name.strip().split(".")[0]] += self_us
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--module", action="append", dest="modules")
+    args = parser.parse_args()
+
+    baseline_wall, baseline_rows = run_importtime("django")
+    baseline_us = sum(row[0] for row in baseline_rows)
+    print(f"django.setup() baseline: {baseline_us / 1000:.1f} ms imports, {baseline_wall * 1000:.0f} ms wall\n")
+
+    print(f"{'target':<34}{'imports ms':>12}{'modules':>10}{'wall p50 ms':>14}{'wall max ms':>14}")
+    breakdowns = {}
+    for module in args.modules or DEFAULT_TARGETS:
+        walls, import_ms = [], []
+        for _ in range(args.iterations):
+            wall, rows = run_importtime(module)
+            walls.append(wall * 1000)
+            import_ms.append(sum(row[0] for row in rows) / 1000)
+        breakdowns[module] = rows
+        print(
+            f"{module:<34}{statistics.median(import_ms):>12.1f}{len(rows):>10}"
+            f"{statistics.median(walls):>14.0f}{max(walls):>14.0f}"
+        )
+
+    for module, rows in breakdowns.items():
+        print(f"\nheaviest packages for {module} (self time, ms):")
+        totals = sorted(top_level_packages(rows).items(), key=lambda item: item[1], reverse=True)
+        for package, self_us in totals[: args.top]:
+            print(f"  {package:<32}{self_us / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
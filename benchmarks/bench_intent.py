@@ -0,0 +1,163 @@
+"""
+Intent classification: embedding centroids (with LLM fallback) vs. the
+``RouteQuery`` structured-output call, on the labelled eval set.
+
+Every eval message is classified both ways once; each margin threshold is
+then scored from those results, so a sweep costs no extra API calls. Per
+threshold we report accuracy, how often the LLM is still asked, latency
+and cost per 1,000 messages. Latency and cost of the embedding path count
+only the centroid lookup (plus the LLM fallbacks): in the graph the query
+embedding is computed anyway, for retrieval. The embedding call itself is
+reported on its own line.
+
+Usage:
+    python -m benchmarks.bench_intent [--model gpt-4.1]
+        [--thresholds 0,0.02,0.04,0.06,1] [--limit N] [--show-errors]
+
+Needs OPENAI_API_KEY and network access (about two API calls per message
+plus one to embed the centroid examples).
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from pathlib import Path
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "service_advisor.settings")
+
+import django
+
+django.setup()
+
+import tiktoken
+from langchain_openai import ChatOpenAI
+
+from agents.helpers.usage import UsageTracker, estimate_cost
+from agents.services.intent_classifier import INTENT_EXAMPLES, CentroidIntentClassifier
+from agents.services.supervisor import EMBEDDING_MODEL, classify_intent_llm, get_vectorstore
+
+
+EVAL_SET = Path(__file__).resolve().parent / "data" / "intent_eval.jsonl"
+# USD per 1M tokens of EMBEDDING_MODEL (text-embedding-3-large). The usage
+# tracker only sees chat model calls, so the embedding price lives here
+EMBEDDING_PRICE_PER_M = 0.13
+
+
+def load_eval_set(path: Path, limit: int = None) -> list:
+    with open(path) as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return items[:limit] if limit else items
+
+
+def embedding_cost(tokens: int) -> float:
+    return tokens * EMBEDDING_PRICE_PER_M / 1_000_000
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def ms(values: list) -> str:
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"p50 {statistics.median(values) * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--eval", default=str(EVAL_SET))
+    parser.add_argument("--model", default="gpt-4.1", help="Model behind the RouteQuery call")
+    parser.add_argument("--thresholds", default="0,0.02,0.04,0.06,1")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    items = load_eval_set(Path(args.eval), args.limit)
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    embeddings = get_vectorstore().embeddings
+    llm = ChatOpenAI(model=args.model, temperature=0.1)
+    encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+
+    classifier, build_s = timed(CentroidIntentClassifier.from_examples, embeddings)
+    example_tokens = sum(len(encoding.encode(t)) for texts in INTENT_EXAMPLES.values() for t in texts)
+    print(
+        f"{len(items)} eval messages; centroids from "
+        f"{sum(map(len, INTENT_EXAMPLES.values()))} examples built in {build_s * 1000:.0f} ms "
+        f"(${embedding_cost(example_tokens):.6f}, once per process)"
+    )
+
+    rows = []
+    usage = UsageTracker()
+    for item in items:
+        embedding, embed_s = timed(embeddings.embed_query, item["text"])
+        prediction, predict_s = timed(classifier.predict, embedding)
+        before = usage.prompt_tokens, usage.completion_tokens
+        route, llm_s = timed(classify_intent_llm, llm, item["text"], {"callbacks": [usage]})
+        rows.append({
+            **item,
+            "local": prediction.intent,
+            "margin": prediction.margin,
+            "llm": route.intent,
+            "embed_s": embed_s,
+            "predict_s": predict_s,
+            "llm_s": llm_s,
+            "llm_cost": estimate_cost(
+                args.model,
+                usage.prompt_tokens - before[0],
+                usage.completion_tokens - before[1],
+            ) or 0.0,
+            "embed_tokens": len(encoding.encode(item["text"])),
+        })
+
+    embed_cost = embedding_cost(sum(r["embed_tokens"] for r in rows))
+    print(f"  query embedding     {ms([r['embed_s'] for r in rows])}  "
+          f"${embed_cost / len(rows) * 1000:.4f}/1k msgs (shared with retrieval)")
+    print(f"  centroid lookup     {ms([r['predict_s'] for r in rows])}")
+    print()
+
+    llm_accuracy = sum(r["llm"] == r["intent"] for r in rows) / len(rows)
+    llm_cost = sum(r["llm_cost"] for r in rows)
+    print(f"{'classifier':<22}{'accuracy':>9}{'LLM calls':>11}{'p50 ms':>10}{'p95 ms':>10}{'$/1k msgs':>12}")
+    llm_latency = sorted(r["llm_s"] for r in rows)
+    print(
+        f"{'RouteQuery ' + args.model:<22}{llm_accuracy:>9.1%}{1:>11.0%}"
+        f"{statistics.median(llm_latency) * 1000:>10.0f}"
+        f"{llm_latency[min(len(rows) - 1, int(len(rows) * 0.95))] * 1000:>10.0f}"
+        f"{llm_cost / len(rows) * 1000:>12.4f}"
+    )
+    for threshold in thresholds:
+        correct = fallbacks = 0
+        latency, cost = [], 0.0
+        for r in rows:
+            if r["margin"] >= threshold:
+                correct += r["local"] == r["intent"]
+                latency.append(r["predict_s"])
+            else:
+                fallbacks += 1
+                correct += r["llm"] == r["intent"]
+                latency.append(r["predict_s"] + r["llm_s"])
+                cost += r["llm_cost"]
+        latency.sort()
+        print(
+            f"{f'centroids @ {threshold:g}':<22}{correct / len(rows):>9.1%}{fallbacks / len(rows):>11.0%}"
+            f"{statistics.median(latency) * 1000:>10.0f}"
+            f"{latency[min(len(rows) - 1, int(len(rows) * 0.95))] * 1000:>10.0f}"
+            f"{cost / len(rows) * 1000:>12.4f}"
+        )
+
+    if args.show_errors:
+        print()
+        confusion = Counter((r["intent"], r["local"]) for r in rows if r["local"] != r["intent"])
+        for (expected, got), count in confusion.most_common():
+            print(f"  {expected:<22} -> {got:<22} x{count}")
+        for r in rows:
+            if r["local"] != r["intent"]:
+                print(f"  [{r['margin']:.3f}] {r['text']!r}: {r['local']} (expected {r['intent']}, LLM {r['llm']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+// Chat answer rendering cost over a long streamed answer, without a browser.
+//
+// Compares what the client does per streamed chunk:
+//   - full escape:   escapeHtml(wholeText) on every token (the old renderer)
+//   - full markdown: re-render the whole answer as markdown on every token
+//   - incremental:   MarkdownStream, flushed on every token
+//   - incremental/frame: MarkdownStream, flushed once per animation frame
+//                    (--per-frame tokens per frame)
+// For each we report total and worst single-update time, and the HTML
+// bytes handed to innerHTML, which is what the browser has to re-parse.
+// The incremental output is checked against a one-shot render.
+//
+// Usage:
+//   node benchmarks/bench_render.js [--tokens 5000] [--per-frame 4]
+'use strict';
+
+const path = require('path');
+const { performance } = require('perf_hooks');
+const { MarkdownStream } = require(path.join(__dirname, '..', 'static', 'agents', 'js', 'render.js'));
+
+function arg(name, fallback) {
+  const i = process.argv.indexOf(`--${name}`);
+  return i >= 0 ? Number(process.argv[i + 1]) : fallback;
+}
+
+const TOKENS = arg('tokens', 5000);
+const PER_FRAME = arg('per-frame', 4);
+
+// A markdown answer cut into ~4 character tokens, like model output
+function syntheticTokens(count) {
+  const sections = [
+    '## Our React & Node <stack>\n\n',
+    'We built the **platform** with `Next.js`, *PostgreSQL* and [AWS](https://aws.amazon.com) for the client\'s team.\n\n',
+    '- Server-side rendering for SEO\n- Background jobs with Celery\n- 99.9% uptime & alerting\n\n',
+    '1. Discovery\n2. Design sprint\n3. Delivery in two-week cycles\n\n',
+    '```python\ndef handler(event):\n    return {"status": 200}\n\n# blank line above stays in the block\n```\n\n',
+    '> Delivered on time and under budget.\n\n',
+  ];
+  const tokens = [];
+  let section = 0;
+  while (tokens.length < count) {
+    const text = sections[section++ % sections.length];
+    for (let i = 0; i < text.length && tokens.length < count; i += 4) tokens.push(text.slice(i, i + 4));
+  }
+  return tokens;
+}
+
+function escapeHtml(s) {
+  // the old chat.js escaper
+  return s
+    .replaceAll('&', '&amp;')
+    .replaceAll('<', '&lt;')
+    .replaceAll('>', '&gt;')
+    .replaceAll('"', '&quot;')
+    .replaceAll("'", '&#39;')
+    .replaceAll('\n', '<br/>');
+}
+
+function renderAll(text) {
+  const stream = new MarkdownStream();
+  stream.push(text);
+  const { done, tail } = stream.flush();
+  return done + tail;
+}
+
+function measure(tokens, update) {
+  let worst = 0;
+  let htmlBytes = 0;
+  const start = performance.now();
+  for (let i = 0; i < tokens.length; i++) {
+    const t0 = performance.now();
+    htmlBytes += update(tokens[i], i === tokens.length - 1);
+    worst = Math.max(worst, performance.now() - t0);
+  }
+  return { total: performance.now() - start, worst, htmlBytes };
+}
+
+const strategies = {
+  'full escape': () => {
+    let text = '';
+    return (token) => {
+      text += token;
+      return escapeHtml(text).length;
+    };
+  },
+  'full markdown': () => {
+    let text = '';
+    return (token) => {
+      text += token;
+      return renderAll(text).length;
+    };
+  },
+  incremental: () => {
+    const stream = new MarkdownStream();
+    return (token) => {
+      stream.push(token);
+      const { done, tail } = stream.flush();
+      return done.length + tail.length;
+    };
+  },
+  'incremental/frame': () => {
+    const stream = new MarkdownStream();
+    let pending = 0;
+    return (token, last) => {
+      stream.push(token);
+      if (++pending < PER_FRAME && !last) return 0;
+      pending = 0;
+      const { done, tail } = stream.flush();
+      return done.length + tail.length;
+    };
+  },
+};
+
+function check(tokens) {
+  const stream = new MarkdownStream();
+  let html = '';
+  let tail = '';
+  for (const token of tokens) {
+    stream.push(token);
+    const out = stream.flush();
+    html += out.done;
+    tail = out.tail;
+  }
+  if (html + tail !== renderAll(tokens.join(''))) {
+    throw new Error('incremental render differs from one-shot render');
+  }
+}
+
+const tokens = syntheticTokens(TOKENS);
+check(tokens);
+console.log(`${tokens.length} tokens, ${tokens.join('').length} chars; frame = ${PER_FRAME} tokens`);
+console.log(`${'strategy'.padEnd(20)}${'total ms'.padStart(10)}${'worst ms'.padStart(10)}${'HTML KiB'.padStart(12)}`);
+for (const [label, make] of Object.entries(strategies)) {
+  make(); // warm up the JIT on a throwaway instance
+  const r = measure(tokens, make());
+  console.log(
+    `${label.padEnd(20)}${r.total.toFixed(1).padStart(10)}${r.worst.toFixed(2).padStart(10)}` +
+    `${(r.htmlBytes / 1024).toFixed(0).padStart(12)}`
+  );
+}
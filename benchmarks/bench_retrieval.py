@@ -0,0 +1,139 @@
+"""
+Multi-query retrieval: the old sequential pipeline vs. FusionRetriever.
+
+sequential  one LLM call for the rewrites, then per query (the question and
+            each rewrite) its own embedding request and MMR search, in
+            turn; unique union of the results (what MultiQueryRetriever did)
+fusion      the same LLM call, one embed_documents request for every
+            query, one batched Chroma search, reciprocal rank fusion
+
+Both run against the real collection and OpenAI, on the non-small-talk
+questions of the intent eval set, for each ``--variants`` count. Per stage
+(rewrites, embedding, search, merge) and in total we report the median and
+p95 latency, plus how many documents each returns and how much the two
+result sets overlap.
+
+Usage:
+    python -m benchmarks.bench_retrieval [--variants 0,1,3] [--limit 20]
+
+Needs OPENAI_API_KEY and network access.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "service_advisor.settings")
+
+import django
+
+django.setup()
+
+from agents.services.supervisor import (
+    FusionRetriever,
+    ScoredMMRRetriever,
+    get_retrieval_llm,
+    get_vectorstore,
+)
+
+
+EVAL_SET = Path(__file__).resolve().parent / "data" / "intent_eval.jsonl"
+STAGES = ("variants_ms", "embed_ms", "search_ms", "fuse_ms", "total_ms")
+
+
+def load_questions(limit: int) -> list:
+    with open(EVAL_SET) as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [item["text"] for item in items if item["intent"] != "general_chat"][:limit]
+
+
+def sequential(question: str, num_variants: int) -> tuple:
+    """The MultiQueryRetriever flow: one query at a time, unique union"""
+    vectorstore = get_vectorstore()
+    timings = {}
+    started = time.perf_counter()
+
+    variants = []
+    if num_variants:
+        helper = FusionRetriever(vectorstore=vectorstore, llm=get_retrieval_llm(), num_variants=num_variants)
+        variants = helper.generate_variants(question)
+    timings["variants_ms"] = (time.perf_counter() - started) * 1000
+
+    searcher = ScoredMMRRetriever(vectorstore=vectorstore, k=6, fetch_k=20)
+    embed_s = search_s = 0.0
+    docs = {}
+    for query in [*variants, question]:
+        t0 = time.perf_counter()
+        embedding = vectorstore.embeddings.embed_query(query)
+        t1 = time.perf_counter()
+        for doc in searcher._search([embedding])[0]:
+            docs.setdefault(doc.id, doc)
+        t2 = time.perf_counter()
+        embed_s += t1 - t0
+        search_s += t2 - t1
+    timings["embed_ms"] = embed_s * 1000
+    timings["search_ms"] = search_s * 1000
+    timings["fuse_ms"] = 0.0
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    return list(docs.values()), timings
+
+
+def fusion(question: str, num_variants: int) -> tuple:
+    retriever = FusionRetriever(
+        vectorstore=get_vectorstore(),
+        llm=get_retrieval_llm() if num_variants else None,
+        num_variants=num_variants,
+        k=6,
+        fetch_k=20,
+    )
+    started = time.perf_counter()
+    docs = retriever.invoke(question)
+    return docs, {**retriever.timings, "total_ms": (time.perf_counter() - started) * 1000}
+
+
+def summary(label: str, runs: list) -> None:
+    cells = []
+    for stage in STAGES:
+        values = sorted(r[stage] for r in runs)
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        cells.append(f"{statistics.median(values):7.0f}/{p95:<6.0f}")
+    print(f"  {label:<12}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", default="0,1,3")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    questions = load_questions(args.limit)
+    # Opens Chroma and the HTTP clients outside the measurements
+    fusion(questions[0], 1)
+
+    print(f"{len(questions)} questions; p50/p95 ms per stage")
+    print(f"  {'':<12}" + "".join(f"{stage[:-3]:<14}" for stage in STAGES))
+    for num_variants in [int(v) for v in args.variants.split(",")]:
+        print(f"{num_variants} variants")
+        results = {"sequential": [], "fusion": []}
+        docs = {"sequential": [], "fusion": []}
+        for question in questions:
+            for label, fn in (("sequential", sequential), ("fusion", fusion)):
+                found, timings = fn(question, num_variants)
+                results[label].append(timings)
+                docs[label].append({doc.id for doc in found})
+        for label in results:
+            summary(label, results[label])
+        overlap = statistics.mean(
+            len(a & b) / len(a | b) if a | b else 1.0
+            for a, b in zip(docs["sequential"], docs["fusion"])
+        )
+        print(
+            f"  docs/question: sequential {statistics.mean(map(len, docs['sequential'])):.1f}, "
+            f"fusion {statistics.mean(map(len, docs['fusion'])):.1f}; overlap (Jaccard) {overlap:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+SSE framing cost per streamed answer: one frame per token vs. coalesced.
+
+A synthetic token source stands in for the model (no network, no graph):
+``--tokens`` tokens arrive ``--burst`` at a time every ``--interval-ms``.
+Events go through the real run path (coalescer -> RunEventBuffer -> one
+live ``afollow`` subscriber); for each strategy we count frames and bytes
+delivered and measure CPU time (``time.process_time``) for the whole
+answer, paced and unpaced. The per-frame encoder cost of json.dumps vs.
+orjson is reported separately.
+
+Usage:
+    python -m benchmarks.bench_sse_coalescing [--tokens 2000] [--interval-ms 5]
+        [--burst 1] [--window-ms 20] [--max-tokens 32]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from agents.helpers.coalescing import acoalesce
+from agents.helpers.event_buffer import RunEventBuffer
+from agents.helpers.stream_helper import emit_sse
+
+TOKEN = " token"
+
+
+def legacy_emit_sse(obj: dict, event_id: int) -> str:
+    """The previous encoder: json.dumps to a str frame"""
+    return f"id: {event_id}\ndata: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+
+async def token_source(tokens: int, interval: float, burst: int):
+    for index in range(tokens):
+        yield {"type": "streaming", "message": TOKEN}
+        if interval and (index + 1) % burst == 0:
+            await asyncio.sleep(interval)
+    yield {"type": "usage", "input_tokens": 900, "output_tokens": tokens, "total_tokens": 900 + tokens}
+
+
+async def passthrough(events, *_):
+    async for event in events:
+        yield event
+
+
+STRATEGIES = (
+    ("source only", None),
+    ("one frame per token", passthrough),
+    ("coalesced", acoalesce),
+)
+
+
+async def measure(strategy, args, interval: float) -> dict:
+    """Source -> strategy -> run buffer -> one live subscriber (the real path)"""
+    buffer = RunEventBuffer(max_events=100_000)
+    received = {"frames": 0, "bytes": 0}
+
+    async def subscriber():
+        async for frame in buffer.afollow():
+            received["frames"] += 1
+            received["bytes"] += len(frame)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    reader = asyncio.ensure_future(subscriber())
+    source = token_source(args.tokens, interval, args.burst)
+    if strategy is None:
+        # Pacing overhead of the synthetic source alone, to subtract
+        async for event in source:
+            pass
+    else:
+        async for event in strategy(source, args.window_ms / 1000, args.max_tokens):
+            buffer.append(event)
+    buffer.close()
+    await reader
+    wall = time.perf_counter() - wall_start
+    return {
+        "frames": received["frames"],
+        "kib": received["bytes"] / 1024,
+        "cpu_ms": (time.process_time() - cpu_start) * 1000,
+        "wall_s": wall,
+        "frames_per_s": received["frames"] / wall if wall else 0.0,
+    }
+
+
+def print_table(title: str, rows: list) -> None:
+    print(title)
+    print(f"{'strategy':<22}{'frames':>8}{'KiB':>9}{'CPU ms':>9}{'wall s':>9}{'frames/s':>12}")
+    for label, row in rows:
+        print(
+            f"{label:<22}{row['frames']:>8}{row['kib']:>9.1f}{row['cpu_ms']:>9.1f}"
+            f"{row['wall_s']:>9.2f}{row['frames_per_s']:>12.0f}"
+        )
+    print()
+
+
+def encoder_comparison(frames: int) -> None:
+    event = {"type": "streaming", "message": TOKEN}
+    print(f"encoder: {frames} token frames")
+    for label, encode in (
+        ("json.dumps -> str", lambda i: legacy_emit_sse(event, i)),
+        ("orjson -> bytes", lambda i: emit_sse(event, i)),
+    ):
+        start = time.perf_counter()
+        for i in range(frames):
+            encode(i)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<20}{elapsed / frames * 1e6:>8.2f} us/frame")
+    print()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--window-ms", type=float, default=20.0)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    encoder_comparison(args.tokens * 10)
+
+    paced = [(label, await measure(fn, args, args.interval_ms / 1000)) for label, fn in STRATEGIES]
+    print_table(
+        f"paced: {args.tokens} tokens, {args.burst} every {args.interval_ms} ms "
+        f"(window {args.window_ms} ms / {args.max_tokens} tokens)",
+        paced,
+    )
+
+    unpaced = [(label, await measure(fn, args, 0)) for label, fn in STRATEGIES]
+    print_table("unpaced: as fast as the pipeline goes", unpaced)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
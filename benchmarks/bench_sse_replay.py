@@ -0,0 +1,159 @@
+"""
+Load-test the SSE path with recorded agent streams instead of OpenAI.
+
+A recording made with ``manage.py record_stream`` is replayed by
+``ReplayAgent``, standing in for the supervisor graph, through the same
+code the chat endpoints use: ``RunManager`` runs it on the agent loop
+(admission, answer filter, coalescer, ``RunEventBuffer`` with ``id:``
+framing) and each client reads frames through ``asubscribe`` /
+``buffer.afollow`` on its own loop, as the async events view does.
+``--concurrency`` runs go at once. Per stream we report frames, bytes,
+time to the first answer frame and total time; overall, CPU time (agent
+loop included) and frames per second; then the cost of replaying one
+finished run from its buffer, what a reconnecting client gets. ``--dump``
+writes one stream's SSE bytes to a file for the frontend parser /
+renderer benchmarks.
+
+Usage:
+    python manage.py record_stream "What tech stack do you use?" -o tech.jsonl.gz
+    python -m benchmarks.bench_sse_replay tech.jsonl.gz [--speed 0] [--concurrency 50]
+        [--window-ms 20] [--max-tokens 32] [--dump tech.sse]
+
+``--speed 1`` keeps the recorded pacing, ``--speed 10`` is ten times
+faster, ``--speed 0`` (the default) replays as fast as possible. No network
+or database access is needed: runs lease an in-memory checkpointer.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from contextlib import asynccontextmanager
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "service_advisor.settings")
+
+import django
+
+django.setup()
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agents.helpers.admission import AdmissionController
+from agents.helpers.replay import ReplayAgent
+from agents.services import runs
+
+
+@asynccontextmanager
+async def in_memory_checkpointer():
+    # Stands in for the Postgres lease; ReplayAgent persists nothing anyway
+    yield InMemorySaver()
+
+
+def make_manager(args) -> runs.RunManager:
+    return runs.RunManager(
+        # Every stream gets a worker: this measures streaming, not queueing
+        admission=AdmissionController("bench", args.concurrency, 0, 60, 1),
+        buffer_size=100_000,
+        retention_seconds=3600,
+        detach_grace_seconds=3600,
+        coalesce_window=args.window_ms / 1000,
+        coalesce_max_tokens=args.max_tokens,
+        heartbeat_seconds=0,
+        stall_seconds=0,
+    )
+
+
+async def one_stream(manager: runs.RunManager, agent: ReplayAgent, index: int, dump: list = None) -> dict:
+    started = time.perf_counter()
+    run, _ = manager.start_run(
+        agent, f"bench-{index}", {}, {"configurable": {"thread_id": f"bench-{index}"}}
+    )
+    frames = size = 0
+    first_answer = None
+    async for frame in manager.asubscribe(run):
+        frames += 1
+        size += len(frame)
+        if first_answer is None and b'"type":"streaming"' in frame:
+            first_answer = time.perf_counter() - started
+        if dump is not None:
+            dump.append(frame)
+    return {
+        "run": run,
+        "frames": frames,
+        "bytes": size,
+        "first_answer_s": first_answer,
+        "total_s": time.perf_counter() - started,
+    }
+
+
+async def replay_finished(run: runs.ChatRun) -> float:
+    """Read a finished run's whole buffer, as a client resuming from id 0"""
+    started = time.perf_counter()
+    async for _ in run.buffer.afollow(0):
+        pass
+    return time.perf_counter() - started
+
+
+def summary(label: str, values: list) -> str:
+    values = [v for v in values if v is not None]
+    if not values:
+        return f"  {label:<18} n/a"
+    values.sort()
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return (
+        f"  {label:<18} mean {statistics.mean(values) * 1000:8.1f} ms"
+        f"  p95 {p95 * 1000:8.1f} ms  max {values[-1] * 1000:8.1f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--window-ms", type=float, default=20.0)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--dump", help="Write the first stream's SSE bytes here")
+    args = parser.parse_args()
+
+    runs.async_leased_checkpointer = in_memory_checkpointer
+    manager = make_manager(args)
+    agent = ReplayAgent(args.recording, speed=args.speed or None)
+    messages = sum(1 for _, (_, mode, _) in agent.steps if mode == "messages")
+    recorded_s = sum(dt for dt, _ in agent.steps)
+    print(
+        f"recording: {len(agent.steps)} steps ({messages} message chunks), "
+        f"{recorded_s:.2f} s recorded; replay speed "
+        f"{'max' if not args.speed else f'{args.speed:g}x'}, {args.concurrency} concurrent"
+    )
+
+    dump = [] if args.dump else None
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    results = await asyncio.gather(*(
+        one_stream(manager, agent, index, dump if index == 0 else None)
+        for index in range(args.concurrency)
+    ))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    frames = sum(r["frames"] for r in results)
+    size = sum(r["bytes"] for r in results)
+    statuses = {r["run"].status for r in results}
+    print(f"  frames/stream      {results[0]['frames']}  ({results[0]['bytes'] / 1024:.1f} KiB), runs {', '.join(sorted(statuses))}")
+    print(summary("first answer frame", [r["first_answer_s"] for r in results]))
+    print(summary("stream total", [r["total_s"] for r in results]))
+    print(
+        f"  overall            {wall:.2f} s wall, {cpu * 1000:.0f} ms CPU, "
+        f"{frames / wall:.0f} frames/s, {size / wall / 1024:.0f} KiB/s"
+    )
+    print(summary("buffer replay", [await replay_finished(r["run"]) for r in results]))
+
+    if dump is not None:
+        with open(args.dump, "wb") as out:
+            out.writelines(dump)
+        print(f"  wrote {args.dump}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
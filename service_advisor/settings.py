@@ -10,11 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
+import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# LOAD ENV VARIABLE (before anything reads POSTGRES_URL / OPENAI_API_KEY)
+load_dotenv()
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -124,4 +131,81 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CSRF_TRUSTED_ORIGINS = ["http://localhost:8000", "http://127.0.0.1:8000", "https://3db73a1b424f.ngrok-free.app"]
-CORS_ORIGIN_ALLOW_ALL = True
\ No newline at end of file
+CORS_ORIGIN_ALLOW_ALL = True
+
+
+# Checkpointer connection pool (per worker process)
+AGENTS_DB_POOL_MIN_SIZE = int(os.getenv("AGENTS_DB_POOL_MIN_SIZE", 1))
+AGENTS_DB_POOL_MAX_SIZE = int(os.getenv("AGENTS_DB_POOL_MAX_SIZE", 5))
+AGENTS_DB_POOL_TIMEOUT = float(os.getenv("AGENTS_DB_POOL_TIMEOUT", 30))
+AGENTS_DB_POOL_MAX_WAITING = int(os.getenv("AGENTS_DB_POOL_MAX_WAITING", 0))
+
+# Admission control for /api/chat (per worker process). MAX_CONCURRENT is the
+# size of the background run pool; queued runs wait on the agent loop.
+AGENTS_CHAT_MAX_CONCURRENT = int(os.getenv("AGENTS_CHAT_MAX_CONCURRENT", AGENTS_DB_POOL_MAX_SIZE))
+AGENTS_CHAT_MAX_QUEUE = int(os.getenv("AGENTS_CHAT_MAX_QUEUE", 20))
+AGENTS_CHAT_QUEUE_TIMEOUT = float(os.getenv("AGENTS_CHAT_QUEUE_TIMEOUT", 10))
+AGENTS_CHAT_RETRY_AFTER = int(os.getenv("AGENTS_CHAT_RETRY_AFTER", 5))
+
+# Agent runs: per-run SSE replay buffer and how long finished runs stay resumable
+AGENTS_RUN_BUFFER_SIZE = int(os.getenv("AGENTS_RUN_BUFFER_SIZE", 5000))
+AGENTS_RUN_RETENTION_SECONDS = float(os.getenv("AGENTS_RUN_RETENTION_SECONDS", 300))
+# Cancel a run when no client has been subscribed for this long
+AGENTS_RUN_DETACH_GRACE_SECONDS = float(os.getenv("AGENTS_RUN_DETACH_GRACE_SECONDS", 10))
+# Repeat POSTs with the same Idempotency-Key within this window reuse the run
+AGENTS_RUN_IDEMPOTENCY_WINDOW_SECONDS = float(os.getenv("AGENTS_RUN_IDEMPOTENCY_WINDOW_SECONDS", 300))
+
+# Checkpoint tables are created by `manage.py setup_checkpointer`; set this to
+# also run that (idempotent) setup when the app loads, e.g. in local dev
+AGENTS_SETUP_CHECKPOINTER_ON_STARTUP = os.getenv("AGENTS_SETUP_CHECKPOINTER_ON_STARTUP", "false").lower() == "true"
+
+# Warm the agent stack (graph, Chroma, OpenAI clients, tiktoken, one dummy
+# retrieval) when a worker boots; /api/ready returns 503 until it finishes
+# and stays 503 ("degraded") if a step failed
+AGENTS_WARMUP_ON_STARTUP = os.getenv("AGENTS_WARMUP_ON_STARTUP", "false").lower() == "true"
+AGENTS_WARMUP_QUERY = os.getenv("AGENTS_WARMUP_QUERY", "web application development")
+
+# Answer tokens are merged into one SSE frame per window / per N tokens
+# (0 disables coalescing)
+AGENTS_STREAM_COALESCE_MS = float(os.getenv("AGENTS_STREAM_COALESCE_MS", 20))
+AGENTS_STREAM_COALESCE_MAX_TOKENS = int(os.getenv("AGENTS_STREAM_COALESCE_MAX_TOKENS", 32))
+
+# Model prices in USD per 1M tokens, {"model": [input, output]}, on top of
+# the built-in table in agents/helpers/usage.py (used for cost_usd)
+AGENTS_MODEL_PRICING = json.loads(os.getenv("AGENTS_MODEL_PRICING", "{}"))
+
+# SSE comment heartbeat while a run is quiet (intent, multi-query expansion,
+# model latency), so proxies do not buffer or time out the stream; 0 disables
+AGENTS_SSE_HEARTBEAT_SECONDS = float(os.getenv("AGENTS_SSE_HEARTBEAT_SECONDS", 15))
+# Fail a run (and release its worker and pooled connection) when it has
+# emitted no event for this long; 0 disables
+AGENTS_RUN_STALL_SECONDS = float(os.getenv("AGENTS_RUN_STALL_SECONDS", 120))
+
+# Chat models a request may pick ({"public name": "OpenAI model"}); the UI's
+# model selector lists the names. Unknown names are rejected with a 400.
+AGENTS_CHAT_MODELS = json.loads(os.getenv(
+    "AGENTS_CHAT_MODELS", '{"default": "gpt-4.1", "fast": "gpt-4.1-mini"}'
+))
+AGENTS_CHAT_DEFAULT_MODEL = os.getenv("AGENTS_CHAT_DEFAULT_MODEL", "default")
+
+# Non-streaming chat (/api/chat/json, /api/chat/batch): per-answer time limit,
+# batch size and how many batch items run at once (keep it within the pool)
+AGENTS_CHAT_JSON_TIMEOUT_SECONDS = float(os.getenv("AGENTS_CHAT_JSON_TIMEOUT_SECONDS", 120))
+AGENTS_CHAT_BATCH_MAX_ITEMS = int(os.getenv("AGENTS_CHAT_BATCH_MAX_ITEMS", 100))
+AGENTS_CHAT_BATCH_MAX_PARALLEL = int(os.getenv("AGENTS_CHAT_BATCH_MAX_PARALLEL", 4))
+
+# Intent is picked locally from the query embedding; when the best two intents
+# are closer than this (cosine similarity) the LLM decides. 0 = never ask the
+# LLM, 1 = always ask it. See benchmarks/bench_intent.py.
+AGENTS_INTENT_MARGIN_THRESHOLD = float(os.getenv("AGENTS_INTENT_MARGIN_THRESHOLD", 0.04))
+
+# Model for general_chat turns, which skip retrieval and the message agent
+AGENTS_SMALL_TALK_MODEL = os.getenv("AGENTS_SMALL_TALK_MODEL", "gpt-4.1-mini")
+
+# Retrieval is limited to the chunks of the intent's category; a query whose
+# filtered search finds fewer hits than this searches the whole collection
+AGENTS_RAG_MIN_FILTERED_RESULTS = int(os.getenv("AGENTS_RAG_MIN_FILTERED_RESULTS", 2))
+
+# LLM rewrites of the question searched alongside it (one LLM call); 0 skips
+# the call and searches the question alone
+AGENTS_RAG_QUERY_VARIANTS = int(os.getenv("AGENTS_RAG_QUERY_VARIANTS", 3))
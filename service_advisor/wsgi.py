@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'service_advisor.settings')
 
 application = get_wsgi_application()
+
+# Warm the agent stack here rather than in AppConfig.ready(): only server
+# processes load this module (runserver loads it in the serving child, not
+# the autoreloader), so management commands and tests never warm up
+from agents.services.warmup import start_warmup, warmup_enabled  # noqa: E402
+
+if warmup_enabled():
+    start_warmup()
@@ -4,7 +4,7 @@ const sessionId =
   '-' +
   Date.now().toString(36);
 // ---------- Config ----------
-const STREAM_URL = '/api/chat'; // endpoint that uses your stream_generator
+const STREAM_URL = '/api/chat'; // starts a run; events come from its events_url
 const messagesEl = document.getElementById('messages');
 const usedTokensEl = document.getElementById('usedTokens');
 const tokenLimitEl = document.getElementById('tokenLimit');
@@ -18,6 +18,7 @@ const emptyState = document.getElementById('emptyState');
 
 let controller = null; // AbortController for the current streaming fetch
 let currentAgentMessageId = null;
+let currentRunId = null; // server-side run behind the current stream
 
 
 
@@ -141,9 +142,15 @@ function appendBubble(author, text, meta = '') {
     body.className = 'chat-body';
     body.innerHTML = text;
 
+    // citations, filled by the run's sources event
+    const sources = document.createElement('div');
+    sources.className = 'chat-sources';
+    sources.style.display = 'none';
+
     card.appendChild(header);
     card.appendChild(subtitle);
     card.appendChild(body);
+    card.appendChild(sources);
 
     // footer
     const footer = document.createElement('div');
@@ -174,19 +181,64 @@ function appendBubble(author, text, meta = '') {
     messagesEl.appendChild(row);
     scrollToBottom();
 
-    // return both the wrapper and the body element we will stream into
-    return { wrapper: row, body };
+    // return the wrapper, the body element we will stream into and the
+    // elements that show pipeline progress / timings
+    return { wrapper: row, body, subtitle, time, footerRight, sources };
   }
 }
 
-// SSE-like parser for fetch streaming body (handles "data: {...}\n\n" chunks)
+// Missed heartbeats before an open stream counts as stalled
+const STALL_HEARTBEATS = 3;
+
+// SSE-like parser for fetch streaming body (handles "id: N\ndata: {...}\n\n" chunks)
+// onEvent(payload, eventId) gets the numeric id when the server sent one.
 async function streamResponseToEvents(response, onEvent) {
   const reader = response.body.getReader();
   const decoder = new TextDecoder();
   let buffer = '';
 
+  const handlePart = (part) => {
+    // part contains lines like: id: 7 / data: {"type":"...","..."}
+    const lines = part.split(/\n/).filter(Boolean);
+    let eventId = null;
+    for (const line of lines) {
+      const idMatch = line.match(/^id:\s*(\d+)$/);
+      if (idMatch) {
+        eventId = parseInt(idMatch[1], 10);
+        continue;
+      }
+      // only support "data: " lines
+      const m = line.match(/^data:\s*(.*)$/);
+      if (!m) continue;
+      try {
+        const payload = JSON.parse(m[1]);
+        onEvent(payload, eventId);
+      } catch (err) {
+        console.warn('Failed parse payload:', m[1], err);
+      }
+    }
+  };
+
+  // The server sends a keepalive comment every X-Heartbeat-Interval
+  // seconds; a silence of several intervals means the connection stalled
+  // somewhere on the way, so drop it and let the caller resume the run.
+  const heartbeat = parseFloat(response.headers.get('X-Heartbeat-Interval'));
+  const idleTimeoutMs = heartbeat > 0 ? heartbeat * 1000 * STALL_HEARTBEATS : 0;
+
+  const read = () => {
+    if (!idleTimeoutMs) return reader.read();
+    let timer;
+    const stalled = new Promise((_, reject) => {
+      timer = setTimeout(() => {
+        reader.cancel().catch(() => {});
+        reject(new Error('stream stalled'));
+      }, idleTimeoutMs);
+    });
+    return Promise.race([reader.read(), stalled]).finally(() => clearTimeout(timer));
+  };
+
   while (true) {
-    const { value, done } = await reader.read();
+    const { value, done } = await read();
     if (done) break;
     buffer += decoder.decode(value, { stream: true });
 
@@ -196,38 +248,112 @@ async function streamResponseToEvents(response, onEvent) {
     buffer = parts.pop();
 
     for (const part of parts) {
-      // part contains lines like: data: {"type":"...","..."}
-      const lines = part.split(/\n/).filter(Boolean);
-      for (const line of lines) {
-        // only support "data: " lines
-        const m = line.match(/^data:\s*(.*)$/);
-        if (!m) continue;
-        try {
-          const payload = JSON.parse(m[1]);
-          onEvent(payload);
-        } catch (err) {
-          console.warn('Failed parse payload:', m[1], err);
-        }
-      }
+      handlePart(part);
     }
   }
 
   // if any leftover buffer contains one last event
   if (buffer.trim()) {
-    const lines = buffer.split(/\n/).filter(Boolean);
-    for (const line of lines) {
-      const m = line.match(/^data:\s*(.*)$/);
-      if (!m) continue;
-      try {
-        const payload = JSON.parse(m[1]);
-        onEvent(payload);
-      } catch (err) {
-        console.warn('Failed parse last payload:', m[1], err);
-      }
+    handlePart(buffer);
+  }
+}
+
+// Reconnect to a run after a dropped connection and replay from lastEventId.
+const RECONNECT_ATTEMPTS = 5;
+const RECONNECT_DELAY_MS = 1000;
+
+function runEventsUrl(runId) {
+  return `${STREAM_URL}/runs/${encodeURIComponent(runId)}/events`;
+}
+
+// Tell the server to stop generating; aborting the fetch alone only
+// cancels the run after the server's reconnect grace period.
+function cancelRun(runId) {
+  if (!runId) return;
+  fetch(`${STREAM_URL}/runs/${encodeURIComponent(runId)}/cancel`, {
+    method: 'POST',
+    keepalive: true,
+  }).catch((err) => console.warn('Cancel failed:', err));
+}
+
+function abortCurrentStream() {
+  if (controller) {
+    try {
+      controller.abort();
+    } catch (_) {}
+  }
+  cancelRun(currentRunId);
+  currentRunId = null;
+}
+
+async function resumeRun(runId, getLastEventId, onEvent, isFinished, signal) {
+  for (let attempt = 1; attempt <= RECONNECT_ATTEMPTS && !isFinished(); attempt++) {
+    await new Promise((resolve) => setTimeout(resolve, RECONNECT_DELAY_MS * attempt));
+    connStatusEl.textContent = 'reconnecting';
+    try {
+      const resp = await fetch(runEventsUrl(runId), {
+        headers: { 'Last-Event-ID': String(getLastEventId()) },
+        signal,
+      });
+      if (resp.status === 404) break; // run expired, nothing left to replay
+      if (!resp.ok) continue;
+      connStatusEl.textContent = 'streaming';
+      await streamResponseToEvents(resp, onEvent);
+    } catch (err) {
+      if (err.name === 'AbortError') throw err;
+      console.warn('Reconnect attempt failed:', err);
     }
   }
 }
 
+// ---------- pipeline stages ----------
+function formatSeconds(ms) {
+  return (ms / 1000).toFixed(1) + 's';
+}
+
+function stageLabel(event) {
+  switch (event.stage) {
+    case 'intent_classified':
+      return `01 Intent: ${(event.intent || 'unknown').replaceAll('_', ' ')}`;
+    case 'retrieval_started':
+      return '02 Searching the portfolio…';
+    case 'retrieval_finished':
+      return event.error
+        ? '02 Search failed, answering without sources'
+        : `02 Found ${event.docs} documents in ${formatSeconds(event.latency_ms || 0)}`;
+    case 'generation_started':
+      return '03 Writing the answer…';
+    case 'first_token':
+      return `03 Writing the answer… (first token after ${formatSeconds(event.elapsed_ms)})`;
+    case 'done':
+      return `Done in ${formatSeconds(event.elapsed_ms)}`;
+    default:
+      return null;
+  }
+}
+
+// One chip per retrieved document; details in the tooltip
+function showSources(bubble, sources) {
+  bubble.sources.innerHTML = '';
+  (sources || []).forEach((source) => {
+    const chip = document.createElement('span');
+    chip.className = 'chat-source';
+    chip.textContent = [source.project_ref, source.sub_type].filter(Boolean).join(' · ') || source.id;
+    const score = source.score != null ? ` • score ${source.score.toFixed(2)}` : '';
+    chip.title = `${(source.category || 'General').replaceAll('_', ' ')}${score}`;
+    bubble.sources.appendChild(chip);
+  });
+  bubble.sources.style.display = bubble.sources.childElementCount ? '' : 'none';
+}
+
+function showTimings(bubble, usage) {
+  if (usage.latency_ms != null) bubble.time.textContent = formatSeconds(usage.latency_ms);
+  const parts = [];
+  if (usage.ttft_ms != null) parts.push(`TTFT ${formatSeconds(usage.ttft_ms)}`);
+  if (usage.tokens_per_second != null) parts.push(`${Math.round(usage.tokens_per_second)} tok/s`);
+  bubble.footerRight.textContent = parts.join(' • ');
+}
+
 // ---------- main streaming logic ----------
 async function startStream(e) {
 
@@ -244,25 +370,29 @@ async function startStream(e) {
   connStatusEl.classList.remove('text-green-600');
   connStatusEl.classList.add('text-yellow-600');
 
-  // if previous controller exists, abort it
-  if (controller) {
-    try {
-      controller.abort();
-    } catch (_) {}
-  }
+  // if a previous stream is running, abort it and cancel its run
+  abortCurrentStream();
   controller = new AbortController();
+  const signal = controller.signal;
   stopBtn.classList.remove('hidden');
 
     // Create a place-holder for agent streaming text
   const agentBubble = appendBubble('Agent', '');
   const agentWrapper = agentBubble.wrapper;
   const agentBody = agentBubble.body;
-  let streamedText = '';
+  agentBubble.subtitle.textContent = 'Queued…';
+  // incremental markdown renderer for the answer, created on the first token
+  let answer = null;
 
   const formData = new FormData();
 
   formData.append('user_message', text);
   formData.append('session_id', sessionId);
+  // validated against the server's allowlist (AGENTS_CHAT_MODELS)
+  if (model) formData.append('model', model);
+  const idempotencyKey = window.crypto && crypto.randomUUID
+    ? crypto.randomUUID()
+    : `${sessionId}-${Date.now()}-${Math.random().toString(36).slice(2)}`;
 
   // Build request body to match your backend's expected agent_input/config
   // const payload = {
@@ -271,16 +401,23 @@ async function startStream(e) {
   //   config: { model }
   // };
 
-  // fetch (POST) and stream
+  // start the run (POST), then follow its event stream
   try {
     const resp = await fetch(STREAM_URL, {
       method: 'POST',
       body: formData,
-      signal: controller.signal
+      // a retried POST for this message re-attaches to the same run
+      headers: { 'Idempotency-Key': idempotencyKey },
+      signal
     });
 
     if (!resp.ok) {
-      agentBody.textContent = `Error: ${resp.status} ${resp.statusText}`;
+      if (resp.status === 503) {
+        const retryAfter = resp.headers.get('Retry-After') || 'a few';
+        agentBody.textContent = `Server is busy, please retry in ${retryAfter} seconds.`;
+      } else {
+        agentBody.textContent = `Error: ${resp.status} ${resp.statusText}`;
+      }
       connStatusEl.textContent = 'error';
       connStatusEl.classList.remove('text-yellow-600');
       connStatusEl.classList.add('text-red-600');
@@ -296,17 +433,38 @@ async function startStream(e) {
     messageInput.style.height = 'auto';
     messageInput.style.height = '40px';
 
+    // The server answers with the background run's id and its events URL
+    const created = await resp.json();
+    // Resume state: the run id and the last event id we rendered
+    let runId = created.run_id;
+    currentRunId = runId;
+    let lastEventId = 0;
+    let finished = false;
+    let truncatedNotice = null;
+
     // parse SSE-like streamed events
-    await streamResponseToEvents(resp, (event) => {
-      // event is the object you emitted in stream_generator
+    const onEvent = (event, eventId) => {
+      if (eventId !== null) {
+        // replays can overlap what we already rendered
+        if (eventId <= lastEventId) return;
+        lastEventId = eventId;
+      }
+      // event is the object the run's astream_events emitted
       const type = event.type || 'message';
 
-      if (type === 'streaming') {
+      if (type === 'run') {
+        runId = event.run_id;
+        currentRunId = runId;
+      } else if (type === 'stage') {
+        const label = stageLabel(event);
+        if (label) agentBubble.subtitle.textContent = label;
+      } else if (type === 'sources') {
+        showSources(agentBubble, event.sources);
+      } else if (type === 'streaming') {
         // live partial message content
-        const chunk = event.message || '';
-        streamedText += chunk;
-        // update agent bubble in place
-        agentBody.innerHTML = escapeHtml(streamedText);
+        // appended in place; rendered at most once per animation frame
+        if (!answer) answer = ChatRender.createStreamRenderer(agentBody);
+        answer.push(event.message || '');
       }else if (type === 'usage') {
         // update tokens
         const inT = event.input_tokens || 0;
@@ -315,16 +473,46 @@ async function startStream(e) {
         updateTokenUsage(
           total,
           parseInt(tokenLimitEl.textContent || '4096'),
-          estimateCost(total)
+          event.cost_usd != null ? event.cost_usd : estimateCost(total)
         );
-        
+        estimatedCostEl.title = costBreakdown(event.by_model);
+        showTimings(agentBubble, event);
+        finished = true;
       } else if (type === 'error') {
         const errEl = document.createElement('div');
         errEl.className = 'mt-2 text-sm text-red-600';
-        errEl.textContent = 'Error: ' + (event.message || 'unknown');
+        errEl.textContent = event.code === 'overloaded'
+          ? `Server is busy, please retry in ${event.retry_after || 'a few'} seconds.`
+          : 'Error: ' + (event.message || 'unknown');
         agentWrapper.appendChild(errEl);
+        finished = true;
+      } else if (type === 'cancelled') {
+        finished = true;
+      } else if (type === 'replay_truncated') {
+        // The server's buffer no longer holds the events we missed while
+        // disconnected, so part of the answer text above is missing
+        if (!truncatedNotice) {
+          truncatedNotice = document.createElement('div');
+          truncatedNotice.className = 'mt-2 text-xs text-yellow-700';
+          truncatedNotice.textContent = 'Part of this answer was lost while reconnecting; ask again to see it in full.';
+          agentWrapper.appendChild(truncatedNotice);
+        }
       }
-    });
+    };
+
+    try {
+      const events = await fetch(created.events_url || runEventsUrl(runId), { signal });
+      if (!events.ok) throw new Error(`${events.status} ${events.statusText}`);
+      await streamResponseToEvents(events, onEvent);
+    } catch (err) {
+      if (err.name === 'AbortError') throw err;
+      console.warn('Stream dropped, resuming run', runId, err);
+    }
+
+    // Connection closed before the run finished: replay from the buffer
+    if (!finished && runId) {
+      await resumeRun(runId, () => lastEventId, onEvent, () => finished, signal);
+    }
 
     // streaming finished
     connStatusEl.textContent = 'connected';
@@ -350,8 +538,13 @@ async function startStream(e) {
       connStatusEl.classList.add('text-red-600');
     }
   } finally {
+    // render the last buffered tokens without waiting for a frame
+    if (answer) answer.finish();
     stopBtn.classList.add('hidden');
-    controller = null;
+    if (controller && controller.signal === signal) {
+      controller = null;
+      currentRunId = null;
+    }
     scrollToBottom();
   }
 
@@ -365,12 +558,11 @@ clearBtn.addEventListener('click', () => {
   usageBarEl.style.width = '0%';
   usagePercentEl.textContent = '0%';
   estimatedCostEl.textContent = '$0.0000';
+  estimatedCostEl.title = '';
 });
 
 stopBtn.addEventListener('click', () => {
-  if (controller) {
-    controller.abort();
-  }
+  abortCurrentStream();
 });
 
 function updateTokenUsage(used, limit, cost) {
@@ -382,7 +574,18 @@ function updateTokenUsage(used, limit, cost) {
   estimatedCostEl.textContent = '$' + cost.toFixed(4);
 }
 
-// Very small cost estimator placeholder — replace with your pricing formula
+// Per-model lines for the cost tooltip (server-side pricing)
+function costBreakdown(byModel) {
+  if (!byModel) return '';
+  return Object.entries(byModel)
+    .map(([model, u]) => {
+      const cost = u.cost_usd != null ? '$' + u.cost_usd.toFixed(4) : 'no price';
+      return `${model}: ${u.input_tokens} in / ${u.output_tokens} out, ${cost}`;
+    })
+    .join('\n');
+}
+
+// Fallback when the server sent no cost (older runs)
 function estimateCost(tokens) {
   // example: $0.000002 per token
   return tokens * 0.000002;
@@ -0,0 +1,187 @@
+// Incremental markdown rendering for streamed answers.
+//
+// Re-escaping and re-parsing the whole answer on every token is O(n²) over
+// an answer. Here each chunk is escaped once, on arrival; the text is cut
+// into markdown blocks (paragraphs, lists, headings, quotes, code fences)
+// and a block is rendered to HTML once, when the block after it starts.
+// Only the still-open last block is re-rendered, and DOM writes happen at
+// most once per animation frame.
+//
+// MarkdownStream is DOM-free (and runs under node for the benchmark);
+// createStreamRenderer binds it to an element.
+(function (root) {
+  'use strict';
+
+  function escapeText(s) {
+    return s
+      .replaceAll('&', '&amp;')
+      .replaceAll('<', '&lt;')
+      .replaceAll('>', '&gt;')
+      .replaceAll('"', '&quot;')
+      .replaceAll("'", '&#39;');
+  }
+
+  const FENCE = '```';
+
+  // ---------- inline markdown (input is already escaped) ----------
+  function renderInline(text) {
+    // code spans first so nothing inside them is formatted
+    return text
+      .split(/(`[^`\n]+`)/)
+      .map((part, i) => {
+        if (i % 2) return `<code>${part.slice(1, -1)}</code>`;
+        return part
+          .replace(/\[([^\]\n]+)\]\((https?:\/\/[^\s)]+)\)/g,
+            '<a href="$2" target="_blank" rel="noopener noreferrer">$1</a>')
+          .replace(/\*\*([^*\n]+)\*\*/g, '<strong>$1</strong>')
+          .replace(/(^|[^*\w])\*([^*\n]+)\*(?!\w)/g, '$1<em>$2</em>')
+          .replace(/(^|[^\w])_([^_\n]+)_(?!\w)/g, '$1<em>$2</em>');
+      })
+      .join('');
+  }
+
+  // ---------- one block (input is already escaped) ----------
+  function renderFence(block) {
+    const lines = block.split('\n');
+    const lang = lines[0].slice(FENCE.length).trim();
+    let body = lines.slice(1);
+    if (body.length && body[body.length - 1].startsWith(FENCE)) body = body.slice(0, -1);
+    const cls = lang ? ` class="language-${lang.replace(/[^\w-]/g, '')}"` : '';
+    return `<pre><code${cls}>${body.join('\n')}</code></pre>`;
+  }
+
+  function renderBlock(block) {
+    if (block.startsWith(FENCE)) return renderFence(block);
+
+    let html = '';
+    let list = null; // 'ul' | 'ol'
+    let paragraph = [];
+    let quote = [];
+
+    const closeParagraph = () => {
+      if (paragraph.length) html += `<p>${paragraph.map(renderInline).join('<br/>')}</p>`;
+      paragraph = [];
+    };
+    const closeQuote = () => {
+      if (quote.length) html += `<blockquote>${quote.map(renderInline).join('<br/>')}</blockquote>`;
+      quote = [];
+    };
+    const closeList = () => {
+      if (list) html += `</${list}>`;
+      list = null;
+    };
+
+    for (const line of block.split('\n')) {
+      let m;
+      if ((m = line.match(/^(#{1,6})\s+(.*)$/))) {
+        closeParagraph(); closeQuote(); closeList();
+        html += `<h${m[1].length}>${renderInline(m[2])}</h${m[1].length}>`;
+      } else if ((m = line.match(/^\s*(?:[-*+]|(\d+)[.)])\s+(.*)$/))) {
+        closeParagraph(); closeQuote();
+        const kind = m[1] ? 'ol' : 'ul';
+        if (list !== kind) { closeList(); html += `<${kind}>`; list = kind; }
+        html += `<li>${renderInline(m[2])}</li>`;
+      } else if ((m = line.match(/^&gt;\s?(.*)$/))) {
+        closeParagraph(); closeList();
+        quote.push(m[1]);
+      } else if (line.trim()) {
+        closeQuote(); closeList();
+        paragraph.push(line);
+      }
+    }
+    closeParagraph(); closeQuote(); closeList();
+    return html;
+  }
+
+  // Length of the first complete block of `text` (blank lines and
+  // separators included), or -1 while it is still open.
+  function completeBlockLength(text) {
+    let start = 0;
+    while (text[start] === '\n') start++;
+    const rest = text.slice(start);
+
+    if (rest.startsWith(FENCE)) {
+      const firstLineEnd = rest.indexOf('\n');
+      if (firstLineEnd < 0) return -1;
+      const close = rest.indexOf('\n' + FENCE, firstLineEnd);
+      if (close < 0) return -1;
+      const closeEnd = rest.indexOf('\n', close + 1);
+      return closeEnd < 0 ? -1 : start + closeEnd + 1;
+    }
+
+    const blank = rest.indexOf('\n\n');
+    const fence = rest.indexOf('\n' + FENCE);
+    if (fence >= 0 && (blank < 0 || fence < blank)) return start + fence + 1;
+    if (blank >= 0) return start + blank + 2;
+    return -1;
+  }
+
+  // ---------- DOM-free incremental renderer ----------
+  class MarkdownStream {
+    constructor() {
+      this.open = ''; // escaped text of the block still being written
+      this.dirty = false;
+    }
+
+    // Take one chunk; only that chunk is escaped
+    push(chunk) {
+      if (!chunk) return;
+      this.open += escapeText(chunk);
+      this.dirty = true;
+    }
+
+    // HTML of the blocks completed since the last flush, and of the open one
+    flush() {
+      let done = '';
+      let length;
+      while ((length = completeBlockLength(this.open)) >= 0) {
+        const block = this.open.slice(0, length).replace(/^\n+|\n+$/g, '');
+        if (block) done += renderBlock(block);
+        this.open = this.open.slice(length);
+      }
+      this.dirty = false;
+      return { done, tail: renderBlock(this.open.replace(/^\n+/, '')) };
+    }
+  }
+
+  // ---------- DOM binding ----------
+  // push() buffers; the DOM is touched at most once per animation frame.
+  function createStreamRenderer(container, schedule) {
+    const stream = new MarkdownStream();
+    const requestFrame = schedule || ((fn) => root.requestAnimationFrame(fn));
+    const tail = container.ownerDocument.createElement('div');
+    container.innerHTML = '';
+    container.appendChild(tail);
+    let scheduled = false;
+    let text = '';
+
+    const flush = () => {
+      scheduled = false;
+      if (!stream.dirty) return;
+      const { done, tail: tailHtml } = stream.flush();
+      if (done) tail.insertAdjacentHTML('beforebegin', done);
+      tail.innerHTML = tailHtml;
+    };
+
+    return {
+      push(chunk) {
+        text += chunk;
+        stream.push(chunk);
+        if (!scheduled) {
+          scheduled = true;
+          requestFrame(flush);
+        }
+      },
+      // Render whatever is pending right now (end of stream)
+      finish: flush,
+      text: () => text,
+    };
+  }
+
+  const api = { MarkdownStream, createStreamRenderer, renderBlock, escapeText };
+  if (typeof module !== 'undefined' && module.exports) {
+    module.exports = api;
+  } else {
+    root.ChatRender = api;
+  }
+})(typeof window !== 'undefined' ? window : globalThis);